@@ -0,0 +1,58 @@
+"""
+Measures the memory a block of code uses, under MicroPython or regular Python (CPython). Handy for benchmarking code that should allocate as little as possible.
+Author Tim Hanewich, github.com/TimHanewich
+Find updates to this code: https://github.com/TimHanewich/MicroPython-Collection/blob/master/AllocationMeter/
+
+MIT License
+Copyright 2024 Tim Hanewich
+Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated documentation files (the “Software”), to deal in the Software without restriction, including without limitation the rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software, and to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in all copies or substantial portions of the Software.
+THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+import gc
+
+class AllocationMeter:
+    """
+    Measures memory used by a block of code. On MicroPython that is the bytes allocated (gc.mem_alloc with the GC paused, so nothing is freed in between).
+    CPython frees objects as soon as they are no longer used, so there it is the most memory held at once during the block above what was held before it (tracemalloc's peak, reset at begin()), which counts the block's temporary objects too.
+    """
+
+    def __init__(self) -> None:
+        self._micropython:bool = hasattr(gc, "mem_alloc")
+        self._tracemalloc = None
+        if not self._micropython:
+            import tracemalloc
+            self._tracemalloc = tracemalloc
+        self._before:int = 0
+        self.metric:str = "bytes allocated (gc.mem_alloc)" if self._micropython else "peak bytes (tracemalloc)"
+
+    def start(self) -> None:
+        """Starts a measuring session (pausing the GC on MicroPython), before any begin()."""
+        if self._micropython:
+            gc.collect()
+            gc.disable()
+        else:
+            self._tracemalloc.start()
+
+    def stop(self) -> None:
+        """Ends the measuring session."""
+        if self._micropython:
+            gc.enable()
+        else:
+            self._tracemalloc.stop()
+
+    def begin(self) -> None:
+        """Marks the start of the block to measure."""
+        if self._micropython:
+            self._before = gc.mem_alloc()
+        else:
+            self._tracemalloc.reset_peak()
+            self._before = self._tracemalloc.get_traced_memory()[0]
+
+    def end(self) -> int:
+        """Returns the bytes used by the block since begin() (see metric for what they are)."""
+        if self._micropython:
+            return gc.mem_alloc() - self._before
+        else:
+            return self._tracemalloc.get_traced_memory()[1] - self._before
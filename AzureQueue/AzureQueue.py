@@ -10,7 +10,14 @@ The above copyright notice and this permission notice shall be included in all c
 THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 """
 
-import requests
+import socket
+import time
+try:
+    import ssl
+    import binascii
+except ImportError: # older MicroPython firmware
+    import ussl as ssl
+    import ubinascii as binascii
 
 def urljoin(part1:str, part2:str) -> str:
     """Combines two portions into a single URL, being mindful of repeating slashes."""
@@ -39,6 +46,482 @@ def get_xml_tag(body:str, tag_name:str) -> str:
     except:
         raise Exception("Unable to find XML tag '" + tag_name + "' in provided body.")
 
+# largest message the Azure Queue service accepts, in bytes
+MAX_MESSAGE_SIZE:int = 65536
+
+######## ENCODING ########
+
+_XML_ENTITIES:dict = {"amp": "&", "lt": "<", "gt": ">", "quot": "\"", "apos": "'"}
+
+def xml_escape(text:str) -> str:
+    """Escapes the characters that can't appear as-is in XML text (&, < and >)."""
+    if "&" not in text and "<" not in text and ">" not in text: # nothing to escape, the common case
+        return text
+    parts:list[str] = []
+    start:int = 0
+    for i in range(len(text)):
+        c:str = text[i]
+        if c == "&":
+            entity:str = "&amp;"
+        elif c == "<":
+            entity:str = "&lt;"
+        elif c == ">":
+            entity:str = "&gt;"
+        else:
+            continue
+        parts.append(text[start:i])
+        parts.append(entity)
+        start = i + 1
+    parts.append(text[start:])
+    return "".join(parts)
+
+def xml_unescape(text:str) -> str:
+    """Replaces the XML entities (i.e. "&amp;" or "&#169;") in text with the characters they stand for."""
+    i:int = text.find("&")
+    if i == -1:
+        return text
+    parts:list[str] = []
+    start:int = 0
+    while i != -1:
+        j:int = text.find(";", i + 1)
+        if j == -1:
+            break
+        name:str = text[i + 1:j]
+        if name.startswith("#x") or name.startswith("#X"):
+            c:str = chr(int(name[2:], 16))
+        elif name.startswith("#"):
+            c:str = chr(int(name[1:]))
+        elif name in _XML_ENTITIES:
+            c:str = _XML_ENTITIES[name]
+        else: # not an entity, leave it be
+            i = text.find("&", i + 1)
+            continue
+        parts.append(text[start:i])
+        parts.append(c)
+        start = j + 1
+        i = text.find("&", start)
+    parts.append(text[start:])
+    return "".join(parts)
+
+_B64_ALPHABET:bytes = b"ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/"
+
+def b64_length(n:int) -> int:
+    """Length of n bytes once base64 encoded."""
+    return ((n + 2) // 3) * 4
+
+def b64encode_into(data, buf, offset:int = 0) -> int:
+    """Base64 encodes data straight into a caller-provided buffer (i.e. a preallocated bytearray) at offset, rather than allocating a new string. Returns the number of bytes written (see b64_length())."""
+    n:int = len(data)
+    if len(buf) - offset < b64_length(n):
+        raise Exception("Buffer of " + str(len(buf) - offset) + " bytes is too small to base64 encode " + str(n) + " bytes into. " + str(b64_length(n)) + " bytes are needed.")
+    alphabet:bytes = _B64_ALPHABET
+    o:int = offset
+    full:int = n - (n % 3)
+    for i in range(0, full, 3):
+        v:int = (data[i] << 16) | (data[i + 1] << 8) | data[i + 2]
+        buf[o] = alphabet[v >> 18]
+        buf[o + 1] = alphabet[(v >> 12) & 63]
+        buf[o + 2] = alphabet[(v >> 6) & 63]
+        buf[o + 3] = alphabet[v & 63]
+        o = o + 4
+    if n - full > 0: # the last 1 or 2 bytes, padded with "="
+        v:int = data[full] << 16
+        if n - full == 2:
+            v = v | (data[full + 1] << 8)
+        buf[o] = alphabet[v >> 18]
+        buf[o + 1] = alphabet[(v >> 12) & 63]
+        buf[o + 2] = alphabet[(v >> 6) & 63] if n - full == 2 else 61 # =
+        buf[o + 3] = 61
+        o = o + 4
+    return o - offset
+
+def _ticks_ms() -> int:
+    """Milliseconds from an arbitrary starting point, on both MicroPython and CPython."""
+    if hasattr(time, "ticks_ms"):
+        return time.ticks_ms()
+    return int(time.time() * 1000)
+
+def _ticks_diff(new:int, old:int) -> int:
+    if hasattr(time, "ticks_diff"):
+        return time.ticks_diff(new, old)
+    return new - old
+
+def parse_url(url:str) -> tuple[bool, str, int, str]:
+    """Splits a URL into (uses TLS, host, port, path). i.e. "https://myaccount.queue.core.windows.net/myqueue" = (True, "myaccount.queue.core.windows.net", 443, "/myqueue")"""
+    tls:bool = url.lower().startswith("https://")
+    if not tls and not url.lower().startswith("http://"):
+        raise Exception("URL '" + url + "' must start with 'https://' or 'http://'.")
+    rest:str = url[8:] if tls else url[7:]
+    i:int = rest.find("/")
+    if i == -1:
+        host:str = rest
+        path:str = "/"
+    else:
+        host:str = rest[:i]
+        path:str = rest[i:]
+    port:int = 443 if tls else 80
+    i = host.find(":")
+    if i != -1:
+        port = int(host[i + 1:])
+        host = host[:i]
+    return (tls, host, port, path)
+
+######## HTTP ########
+
+class HTTPResponse:
+    """A response to a request made through an HTTPConnection. Mirrors the parts of the requests library's response that this module uses."""
+
+    def __init__(self, status_code:int, headers:dict, content:bytes):
+        self.status_code:int = status_code
+        self.headers:dict = headers # header names are lowercase
+        self.content:bytes = content
+
+    @property
+    def text(self) -> str:
+        return self.content.decode()
+
+# how the body of a response is delimited
+_BODY_NONE:int = 0 # no body, or it has been read to the end
+_BODY_LENGTH:int = 1 # Content-Length
+_BODY_CHUNKED:int = 2 # Transfer-Encoding: chunked
+_BODY_TO_CLOSE:int = 3 # until the server closes the connection
+
+# Parsing shared by HTTPConnection and AzureQueueAsync.AsyncHTTPConnection. Each takes bytes already read off of the connection, so only the I/O differs between the two.
+
+def parse_status_line(line:bytes) -> int:
+    """Returns the status code of a response's status line, i.e. b"HTTP/1.1 200 OK" = 200."""
+    if len(line) < 12 or line[0:5] != b"HTTP/":
+        raise Exception("Expected an HTTP status line but received '" + str(line) + "'.")
+    return int(line[9:12])
+
+def parse_header(line:bytes, headers:dict) -> None:
+    """Adds a header line (without its line ending, i.e. b"Content-Length: 42") to headers, with the name lowercase. A line without a colon is ignored."""
+    i:int = line.find(b":")
+    if i != -1:
+        headers[line[:i].decode().lower()] = line[i + 1:].decode().strip()
+
+def body_framing(method:str, status_code:int, headers:dict) -> tuple[int, int, bool]:
+    """Returns how the body of a response is delimited: (_BODY_NONE, _BODY_LENGTH, _BODY_CHUNKED or _BODY_TO_CLOSE, its Content-Length (0 if it has none), whether the connection can be kept alive once the body has been read)."""
+    keep_alive:bool = headers.get("connection", "").lower() != "close"
+    if method == "HEAD" or status_code == 204 or status_code == 304 or status_code < 200:
+        return (_BODY_NONE, 0, keep_alive)
+    elif headers.get("transfer-encoding", "").lower() == "chunked":
+        return (_BODY_CHUNKED, 0, keep_alive)
+    elif "content-length" in headers:
+        length:int = int(headers["content-length"])
+        return (_BODY_LENGTH if length > 0 else _BODY_NONE, length, keep_alive)
+    else: # body ends when the server closes the connection
+        return (_BODY_TO_CLOSE, 0, False)
+
+def parse_chunk_size(line:bytes) -> int:
+    """Returns the size of the next chunk of a chunked body from its size line (hexadecimal), ignoring any chunk extensions. 0 marks the end of the body."""
+    i:int = line.find(b";")
+    return int(line if i == -1 else line[:i], 16)
+
+def connection_closed(host:str) -> Exception:
+    """The exception raised when the server closes the connection part way through a response."""
+    return Exception("Connection to " + host + " was closed by the server.")
+
+class HTTPConnection:
+    """A single persistent (HTTP/1.1 keep-alive) connection to a host. The socket (and TLS session) is opened on the first request, reused for every request after that, and transparently reopened if the server closed it."""
+
+    def __init__(self, host:str, port:int, tls:bool = True, timeout:float = 15.0, buffer_size:int = 1024):
+        self.host:str = host
+        self.port:int = port
+        self.tls:bool = tls
+        self.timeout:float = timeout
+        self._sock = None
+        self._read = None # the socket's recv_into/readinto
+        self._write = None # the socket's sendall/write
+        self.requests:int = 0 # number of requests sent over the current socket
+
+        # receive buffer. Unread bytes are _rbuf[_rstart:_rend]
+        self._rbuf:bytearray = bytearray(buffer_size)
+        self._rmv:memoryview = memoryview(self._rbuf)
+        self._rstart:int = 0
+        self._rend:int = 0
+        self._received:int = 0 # bytes received since the current request was sent
+
+        # how much of the current response's body is left to read
+        self._body_mode:int = _BODY_NONE
+        self._body_left:int = 0 # bytes left in the body (Content-Length) or in the current chunk (chunked)
+        self._keep_alive:bool = True
+
+        # send buffer, reused for every request so the request line, headers and (small) body go out in a single write
+        self._wbuf:bytearray = bytearray(buffer_size)
+        self._wmv:memoryview = memoryview(self._wbuf)
+        self._wlen:int = 0
+
+        # headers sent with every request, encoded once
+        self._common_headers:bytes = ("Host: " + host + "\r\nConnection: keep-alive\r\n").encode()
+
+    @property
+    def connected(self) -> bool:
+        return self._sock != None
+
+    def connect(self) -> None:
+        self.close()
+        addr = socket.getaddrinfo(self.host, self.port, 0, socket.SOCK_STREAM)[0][-1]
+        sock = socket.socket()
+        try:
+            sock.settimeout(self.timeout)
+            sock.connect(addr)
+            if self.tls:
+                if hasattr(ssl, "create_default_context"): # CPython
+                    sock = ssl.create_default_context().wrap_socket(sock, server_hostname=self.host)
+                else: # MicroPython
+                    sock = ssl.wrap_socket(sock, server_hostname=self.host)
+        except:
+            sock.close()
+            raise
+        self._sock = sock
+        self._read = sock.recv_into if hasattr(sock, "recv_into") else sock.readinto
+        self._write = sock.sendall if hasattr(sock, "sendall") else sock.write
+        self._rstart = 0
+        self._rend = 0
+        self._wlen = 0
+        self._body_mode = _BODY_NONE
+        self.requests = 0
+
+    def close(self) -> None:
+        if self._sock != None:
+            try:
+                self._sock.close()
+            except:
+                pass
+            self._sock = None
+        self._body_mode = _BODY_NONE
+
+    def request(self, method:str, target:str, body:bytes = None, content_type:str = None) -> HTTPResponse:
+        """
+        Sends a request and reads the full response.
+
+        Parameters:
+        method (str): i.e. "GET"
+        target (str): The path and query string, i.e. "/myqueue/messages?sv=..."
+        body (bytes): Optional request body.
+        content_type (str): Content-Type of the body, if there is one.
+        """
+        status_code, headers = self.begin(method, target, body, content_type)
+        return HTTPResponse(status_code, headers, self.read_body())
+
+    def begin(self, method:str, target:str, body:bytes = None, content_type:str = None) -> tuple[int, dict]:
+        """Sends a request and reads the response's status and headers, returning (status code, headers). The body is then read with read_chunk() (or all at once with read_body())."""
+        attempt:int = 0
+        while True:
+            reused:bool = self._sock != None
+            if not reused:
+                self.connect()
+            try:
+                self.send_request(method, target, body, content_type)
+                return self.read_head(method)
+            except Exception as e:
+                self.close()
+
+                # a kept-alive connection the server has since closed fails on the first write or read. Retry once on a fresh connection, but only if no part of a response came back (so the server never handled it).
+                if not reused or attempt > 0 or self._received > 0:
+                    raise
+                attempt = attempt + 1
+
+    def send_request(self, method:str, target:str, body:bytes = None, content_type:str = None, flush:bool = True) -> None:
+        """Writes a request without waiting for the response (see read_response()). Sending several before reading their responses pipelines them. With flush=False, the request may stay in the send buffer (so several go out in one write) until flush() is called."""
+        if self._sock == None:
+            self.connect()
+        self._received = 0
+        self._out(method.encode())
+        self._out(b" ")
+        self._out(target.encode())
+        self._out(b" HTTP/1.1\r\n")
+        self._out(self._common_headers)
+        if body != None:
+            if content_type != None:
+                self._out(b"Content-Type: ")
+                self._out(content_type.encode())
+                self._out(b"\r\n")
+            self._out(b"Content-Length: ")
+            self._out(str(len(body)).encode())
+            self._out(b"\r\n\r\n")
+            self._out(body)
+        else:
+            self._out(b"Content-Length: 0\r\n\r\n")
+        if flush:
+            self._flush()
+        self.requests = self.requests + 1
+
+    def read_response(self, method:str = "GET") -> HTTPResponse:
+        """Reads the next response from the connection."""
+        status_code, headers = self.read_head(method)
+        return HTTPResponse(status_code, headers, self.read_body())
+
+    def read_head(self, method:str = "GET") -> tuple[int, dict]:
+        """Reads the status line and headers of the next response from the connection, returning (status code, headers). The body must be read (see read_chunk()) before the next response can be."""
+
+        # status line, i.e. "HTTP/1.1 200 OK"
+        status_code:int = parse_status_line(self._readline())
+
+        # headers
+        headers:dict = {}
+        while True:
+            line:bytes = self._readline()
+            if len(line) == 0: # blank line, end of headers
+                break
+            parse_header(line, headers)
+
+        # how the body is delimited
+        self._body_mode, self._body_left, self._keep_alive = body_framing(method, status_code, headers)
+        if self._body_mode == _BODY_NONE:
+            self._end_body()
+        return (status_code, headers)
+
+    @property
+    def body_pending(self) -> bool:
+        """True if the body of the current response has not been read to the end yet."""
+        return self._body_mode != _BODY_NONE
+
+    def read_chunk(self) -> bytes:
+        """Reads the next piece of the current response's body (at most the size of the receive buffer). Returns b"" once the whole body has been read."""
+        while True:
+            if self._body_mode == _BODY_NONE:
+                return b""
+            elif self._body_mode == _BODY_CHUNKED and self._body_left == 0: # at the start of a chunk
+                self._body_left = parse_chunk_size(self._readline())
+                if self._body_left == 0:
+                    while len(self._readline()) > 0: # trailers, until the blank line
+                        pass
+                    self._end_body()
+                    return b""
+            elif self._body_mode == _BODY_TO_CLOSE:
+                if self._rstart == self._rend:
+                    try:
+                        self._fill()
+                    except Exception: # closed, that's the end of the body
+                        self._end_body()
+                        return b""
+                ToReturn:bytes = bytes(self._rmv[self._rstart:self._rend])
+                self._rstart = self._rend
+                return ToReturn
+            else: # inside of a chunk or a Content-Length body
+                if self._rstart == self._rend:
+                    self._fill()
+                take:int = min(self._body_left, self._rend - self._rstart)
+                ToReturn:bytes = bytes(self._rmv[self._rstart:self._rstart + take])
+                self._rstart = self._rstart + take
+                self._body_left = self._body_left - take
+                if self._body_left == 0:
+                    if self._body_mode == _BODY_CHUNKED:
+                        self._readline() # the \r\n after the chunk
+                    else:
+                        self._end_body()
+                return ToReturn
+
+    def read_body(self) -> bytes:
+        """Reads the rest of the current response's body."""
+        chunk:bytes = self.read_chunk()
+        if len(chunk) == 0 or not self.body_pending: # the common case, a body that arrived in one piece
+            return chunk
+        chunks:list[bytes] = [chunk]
+        while True:
+            chunk = self.read_chunk()
+            if len(chunk) == 0:
+                return b"".join(chunks)
+            chunks.append(chunk)
+
+    def _end_body(self) -> None:
+        self._body_mode = _BODY_NONE
+        if not self._keep_alive:
+            self.close()
+
+    def flush(self) -> None:
+        """Writes out any requests sent with flush=False."""
+        self._flush()
+
+    ######## SENDING ########
+
+    def _out(self, data:bytes) -> None:
+        """Adds data to the send buffer, writing the buffer out whenever it fills up."""
+        if self._wlen + len(data) > len(self._wbuf):
+            self._flush()
+            if len(data) > len(self._wbuf): # too big to buffer at all, write it directly
+                self._write(data)
+                return
+        self._wbuf[self._wlen:self._wlen + len(data)] = data
+        self._wlen = self._wlen + len(data)
+
+    def _flush(self) -> None:
+        if self._wlen > 0:
+            self._write(self._wmv[0:self._wlen])
+            self._wlen = 0
+
+    ######## RECEIVING ########
+
+    def _fill(self) -> None:
+        """Receives more bytes into the receive buffer, making room first if needed. Raises an exception if the connection was closed."""
+        if self._rstart == self._rend:
+            self._rstart = 0
+            self._rend = 0
+        elif self._rend == len(self._rbuf): # move what is unread to the front
+            unread:bytes = bytes(self._rmv[self._rstart:self._rend])
+            self._rbuf[0:len(unread)] = unread
+            self._rstart = 0
+            self._rend = len(unread)
+            if self._rend == len(self._rbuf):
+                raise Exception("HTTP response line is longer than the " + str(len(self._rbuf)) + " byte receive buffer.")
+        n:int = self._read(self._rmv[self._rend:])
+        if n == None or n == 0:
+            raise connection_closed(self.host)
+        self._rend = self._rend + n
+        self._received = self._received + n
+
+    def _readline(self) -> bytes:
+        """Reads a line (ending in \\r\\n), returning it without the line ending."""
+        scanned:int = self._rstart
+        while True:
+            for i in range(scanned, self._rend):
+                if self._rbuf[i] == 10: # \n
+                    end:int = i - 1 if i > self._rstart and self._rbuf[i - 1] == 13 else i # drop the \r
+                    ToReturn:bytes = bytes(self._rmv[self._rstart:end])
+                    self._rstart = i + 1
+                    return ToReturn
+            scanned = self._rend - self._rstart # offset scanned so far, as _fill() may move the unread bytes
+            self._fill()
+            scanned = self._rstart + scanned
+
+class ConnectionPool:
+    """A small pool of persistent HTTPConnections to one host."""
+
+    def __init__(self, host:str, port:int, tls:bool = True, size:int = 1, timeout:float = 15.0):
+        self.host:str = host
+        self.port:int = port
+        self.tls:bool = tls
+        self.size:int = size
+        self.timeout:float = timeout
+        self._idle:list[HTTPConnection] = []
+        self._created:int = 0
+
+    def acquire(self) -> HTTPConnection:
+        """Takes a connection out of the pool (opening a new one if none are idle). Give it back with release()."""
+        if len(self._idle) > 0:
+            return self._idle.pop()
+        if self._created >= self.size:
+            raise Exception("All " + str(self.size) + " connections in the pool to " + self.host + " are in use.")
+        self._created = self._created + 1
+        return HTTPConnection(self.host, self.port, self.tls, self.timeout)
+
+    def release(self, conn:HTTPConnection) -> None:
+        self._idle.append(conn)
+
+    def request(self, method:str, target:str, body:bytes = None, content_type:str = None) -> HTTPResponse:
+        conn:HTTPConnection = self.acquire()
+        try:
+            return conn.request(method, target, body, content_type)
+        finally:
+            self.release(conn)
+
+    def close(self) -> None:
+        """Closes every idle connection. They reconnect automatically if used again."""
+        for conn in self._idle:
+            conn.close()
+
 class QueueMessage:
     def __init__(self):
         self._id:str = None
@@ -69,20 +552,115 @@ class QueueMessage:
     def MessageText(self, value) -> None:
         self._txt = value
 
+    @property
+    def MessageBytes(self) -> bytes:
+        """The message text decoded from base64, for messages sent with QueueService.put_bytes()."""
+        return binascii.a2b_base64(self._txt)
+
     def __repr__(self):
         return str({"MessageId": self.MessageId, "PopReceipt": self.PopReceipt, "MessageText": self.MessageText})
 
 
+# tags the QueueMessageParser acts on
+_TAG_MESSAGE:bytes = b"QueueMessage"
+_TAG_MESSAGE_END:bytes = b"/QueueMessage"
+_FIELD_TAGS:tuple[bytes] = (b"MessageId", b"PopReceipt", b"MessageText") # in the order of _FIELD_* below
+_FIELD_END_TAGS:tuple[bytes] = (b"/MessageId", b"/PopReceipt", b"/MessageText")
+_FIELD_NONE:int = -1
+_FIELD_ID:int = 0
+_FIELD_POP:int = 1
+_FIELD_TEXT:int = 2
+
+class QueueMessageParser:
+    """
+    Single-pass pull parser for the XML the Queue service responds with (a <QueueMessagesList>). Feed it the response body in pieces of any size, as they come off of the socket, and completed QueueMessages collect in messages.
+    Only the text of the fields a QueueMessage holds is kept, so the whole body is never held in memory.
+    """
+
+    def __init__(self):
+        self.messages:list[QueueMessage] = [] # completed messages, not yet taken
+        self._in_tag:bool = False # between a "<" and its ">"
+        self._tag:bytearray = bytearray() # the tag read so far (between the "<" and ">")
+        self._value:bytearray = bytearray() # text of the field being read
+        self._field:int = _FIELD_NONE # the field being read
+        self._current:QueueMessage = None # the message being read
+
+    def feed(self, data:bytes) -> int:
+        """Parses the next piece of the body. Returns the number of messages completed by it."""
+        completed:int = 0
+        i:int = 0
+        n:int = len(data)
+        while i < n:
+            if self._in_tag:
+                j:int = data.find(b">", i)
+                if j == -1: # the tag continues in the next piece
+                    self._tag.extend(data[i:])
+                    break
+                self._tag.extend(data[i:j])
+                self._in_tag = False
+                i = j + 1
+                if self._end_tag():
+                    completed = completed + 1
+            else:
+                j:int = data.find(b"<", i)
+                end:int = n if j == -1 else j
+                if self._field != _FIELD_NONE and end > i: # text we want to keep
+                    self._value.extend(data[i:end])
+                if j == -1:
+                    break
+                self._in_tag = True
+                self._tag = bytearray()
+                i = j + 1
+        return completed
+
+    def _end_tag(self) -> bool:
+        """Acts on the tag just read. Returns True if it completed a message."""
+        tag:bytearray = self._tag
+        if self._current == None:
+            if tag == _TAG_MESSAGE:
+                self._current = QueueMessage()
+        elif self._field != _FIELD_NONE:
+            if tag == _FIELD_END_TAGS[self._field]:
+                value:str = xml_unescape(self._value.decode())
+                if self._field == _FIELD_ID:
+                    self._current.MessageId = value
+                elif self._field == _FIELD_POP:
+                    self._current.PopReceipt = value
+                else:
+                    self._current.MessageText = value
+                self._field = _FIELD_NONE
+        elif tag == _TAG_MESSAGE_END:
+            self.messages.append(self._current)
+            self._current = None
+            return True
+        else:
+            for f in range(len(_FIELD_TAGS)):
+                if tag == _FIELD_TAGS[f]:
+                    self._field = f
+                    self._value = bytearray()
+                    break
+        return False
+
+# request body of a put, around the message itself
+_PUT_PREFIX:bytes = b"<QueueMessage><MessageText>"
+_PUT_SUFFIX:bytes = b"</MessageText></QueueMessage>"
+
+def message_target(message_prefix:str, message_id:str, pop_receipt:str, token_suffix:str) -> str:
+    """The path and query string of a specific message, for deleting it (append "&visibilitytimeout=..." for updating it). Shared by QueueService and AzureQueueAsync.AsyncQueueService so the pop receipt is escaped the same way everywhere."""
+    return message_prefix + message_id + "?popreceipt=" + pop_receipt.replace("+", "%2B") + token_suffix
+
 class QueueService:
     """Brokers communication with the Azure Queue REST API"""
 
-    def __init__(self, queue_url:str, sas_token:str):
+    def __init__(self, queue_url:str, sas_token:str, pool_size:int = 1, timeout:float = 15.0):
         """
         Creates a new instance of the QueueService class, ready to communicate with a specific queue within a specific Azure Storage Account.
         
         Parameters:
         queue_url (str): The URL directly to the Azure Storage Queue, i.e. "https://mystorageaccount.queue.core.windows.net/myqueue"
         sas_token (str): The Shared Access Signature (SAS) you get when generating in the Azure Portal. i.e. "sv=2022-11-02&ss=bfqt&srt=c&sp=rwdlacupiytfx&se=2024-11-30T19:34:10Z&st=2024-11-30T11:34:10Z&spr=https&sig=%2FKxtw%2FTzD0lXqj2kGyMuJ9Y0cFb16javsQb7Pz4b6KM%3D"
+        pool_size (int): Maximum number of connections kept open to the storage account.
+        timeout (float): Socket timeout, in seconds.
         """
 
         # ensure the URL has an actual queue name in it
@@ -93,65 +671,321 @@ class QueueService:
         self._url = queue_url
         self._token = sas_token
 
+        # persistent connection(s) to the storage account, reused across requests
+        tls, host, port, path = parse_url(queue_url)
+        self._pool:ConnectionPool = ConnectionPool(host, port, tls, pool_size, timeout)
+        self._queue_path:str = path # i.e. "/myqueue"
+        self._messages_path:str = urljoin(path, "messages") # i.e. "/myqueue/messages"
+        self._message_prefix:str = self._messages_path + "/" # a specific message's path follows, i.e. "/myqueue/messages/<message id>"
+        self._token_suffix:str = "&" + sas_token
+
+        # request body of put(), reused for every message
+        self._body:bytearray = bytearray(0)
+
+    def close(self) -> None:
+        """Closes the connection(s) to the storage account. They are reopened automatically if the QueueService is used again."""
+        self._pool.close()
+
     def put(self, text:str) -> None:
-        """Adds a new message to the queue."""
-        
-        # construct body
-        body:str = "<QueueMessage><MessageText>" + text + "</MessageText></QueueMessage>"
+        """Adds a new message to the queue. Characters XML can't carry as-is (&, < and >) are escaped."""
+        data:bytes = xml_escape(text).encode()
+        end:int = self._begin_body(len(data))
+        self._body[len(_PUT_PREFIX):len(_PUT_PREFIX) + len(data)] = data
+        self._put_body(end)
+
+    def put_bytes(self, data) -> None:
+        """
+        Adds a new message holding binary data (i.e. a packed struct of sensor readings) to the queue. The data is base64 encoded straight into a reused buffer.
+        Read it back with the received QueueMessage's MessageBytes property. At most 49,152 bytes can be sent (base64 takes 4 bytes for every 3).
+        """
+        size:int = b64_length(len(data))
+        if size > MAX_MESSAGE_SIZE:
+            raise Exception("Binary message of " + str(len(data)) + " bytes is " + str(size) + " bytes once base64 encoded, over the " + str(MAX_MESSAGE_SIZE) + " byte Azure Queue message limit.")
+        end:int = self._begin_body(size)
+        b64encode_into(data, self._body, len(_PUT_PREFIX))
+        self._put_body(end)
+
+    def _begin_body(self, size:int) -> int:
+        """Makes room for a message of size bytes in the reused request body buffer (which always starts with the opening tags), writes the closing tags after it and returns where the body ends. The message itself goes right after the opening tags."""
+        needed:int = len(_PUT_PREFIX) + size + len(_PUT_SUFFIX)
+        if len(self._body) < needed:
+            self._body = bytearray(needed)
+            self._body[0:len(_PUT_PREFIX)] = _PUT_PREFIX
+        end:int = len(_PUT_PREFIX) + size
+        self._body[end:end + len(_PUT_SUFFIX)] = _PUT_SUFFIX
+        return end + len(_PUT_SUFFIX)
+
+    def _put_body(self, end:int) -> None:
+        """Sends the first end bytes of the request body buffer as a new message."""
 
         # Make POST request
-        post_url:str = urljoin(self._url, "messages") + "?" + self._token
-        headers = {"Content-Type": "application/xml"}
-        response = requests.post(post_url, headers=headers, data=body)
+        response:HTTPResponse = self._pool.request("POST", self._messages_path + "?" + self._token, memoryview(self._body)[0:end], "application/xml")
         
         # handle code?
         if response.status_code != 201:
             raise Exception("POST request to Azure Queue Service to upload message returned status code '" + str(response.status_code) + "', not the successful '201 CREATED'!")
         
-    def receive(self) -> QueueMessage:
-        """Receives the next message from the queue, but does NOT delete it."""
+    def receive_batch(self, n:int = 32, visibility_timeout:int = None) -> list[QueueMessage]:
+        """
+        Receives up to n messages from the queue in a single request, but does NOT delete them.
+
+        Parameters:
+        n (int): Maximum number of messages to receive, 1-32 (the most the Azure Queue REST API allows per request).
+        visibility_timeout (int): How long (in seconds) the messages stay invisible to other receivers before reappearing in the queue if not deleted, 1-604800 (7 days). If not provided, the service default (30 seconds) is used.
+
+        Returns:
+        list[QueueMessage]: The messages received, in queue order. An empty list if the queue is empty.
+        """
+        return list(self.iter_receive(n, visibility_timeout))
+
+    def iter_receive(self, n:int = 32, visibility_timeout:int = None):
+        """
+        Like receive_batch(), but yields each message as soon as it has been read off of the connection rather than waiting for (and holding onto) the whole response.
+        Parameters are the same as receive_batch(). Read every message (i.e. with a for loop). If you stop early, call close() on the generator, and the connection is closed and reopened for the next request. The connection is held until then, so with pool_size=1 other calls must wait until the loop is done.
+        """
+
+        # validate
+        if n < 1 or n > 32:
+            raise Exception("Number of messages to receive must be between 1 and 32. '" + str(n) + "' is invalid.")
+        if visibility_timeout != None and (visibility_timeout < 1 or visibility_timeout > 604800):
+            raise Exception("Visibility timeout must be between 1 and 604800 seconds (7 days). '" + str(visibility_timeout) + "' is invalid.")
 
         # make get request
-        get_url:str = urljoin(self._url, "messages") + "?" + self._token
-        response = requests.get(get_url)
-        response_body:str = response.text
+        target:str = self._messages_path + "?numofmessages=" + str(n)
+        if visibility_timeout != None:
+            target = target + "&visibilitytimeout=" + str(visibility_timeout)
+        return self._iter_messages(target + self._token_suffix)
 
-        # handle error
+    def peek(self, n:int = 1) -> list[QueueMessage]:
+        """
+        Returns up to n messages (1-32) from the front of the queue without receiving them: they stay visible to other receivers (and can't be deleted, as they have no PopReceipt).
+        An empty list is returned if the queue is empty.
+        """
+        if n < 1 or n > 32:
+            raise Exception("Number of messages to peek must be between 1 and 32. '" + str(n) + "' is invalid.")
+        return list(self._iter_messages(self._messages_path + "?peekonly=true&numofmessages=" + str(n) + self._token_suffix))
+
+    def approximate_message_count(self) -> int:
+        """Returns the approximate number of messages in the queue (as reported by the service, it may be slightly out of date), without receiving any. Handy for deciding how often to poll."""
+        return int(self.metadata()["x-ms-approximate-messages-count"])
+
+    def metadata(self) -> dict:
+        """Returns the queue's properties: the headers of a Get Queue Metadata request (names lowercase), i.e. "x-ms-approximate-messages-count" and any user-defined "x-ms-meta-..." values."""
+        response:HTTPResponse = self._pool.request("HEAD", self._queue_path + "?comp=metadata" + self._token_suffix)
         if response.status_code != 200:
-            raise Exception("GET request to receive queue message returned status code " + str(response.status_code) + "! Body: " + response_body)
+            raise Exception("Request for queue metadata returned status code " + str(response.status_code) + ", not the successful '200 OK'!")
+        return response.headers
 
-        # if there was no queue messages left
-        if "<QueueMessagesList />" in response_body: # an empty list
+    def _iter_messages(self, target:str):
+        """Makes a GET request for messages, yielding each as soon as it has been parsed from the response as it streams in."""
+        conn:HTTPConnection = self._pool.acquire()
+        try:
+            status_code, headers = conn.begin("GET", target)
+
+            # handle error
+            if status_code != 200:
+                raise Exception("GET request to receive queue messages returned status code " + str(status_code) + "! Body: " + conn.read_body().decode())
+
+            # parse the messages as the body streams in
+            parser:QueueMessageParser = QueueMessageParser()
+            while True:
+                chunk:bytes = conn.read_chunk()
+                if len(chunk) == 0:
+                    break
+                if parser.feed(chunk) > 0:
+                    for msg in parser.messages:
+                        yield msg
+                    parser.messages = []
+        finally:
+            if conn.body_pending: # stopped part way through, the rest of the response would be mistaken for the next one's
+                conn.close()
+            self._pool.release(conn)
+
+    def receive(self) -> QueueMessage:
+        """Receives the next message from the queue, but does NOT delete it."""
+        messages:list[QueueMessage] = self.receive_batch(1)
+        if len(messages) == 0: # the queue is empty
             return None
-        
-        # get data from response body
-        ToReturn:QueueMessage = QueueMessage()
-        ToReturn.MessageId = get_xml_tag(response_body, "MessageId")
-        ToReturn.PopReceipt = get_xml_tag(response_body, "PopReceipt")
-        ToReturn.MessageText = get_xml_tag(response_body, "MessageText")
-        return ToReturn
+        return messages[0]
     
     def delete(self, message_id:str, pop_receipt:str) -> None:
         """Deletes a message from the queue."""
 
         # make DELETE request
-        delete_url:str = urljoin(urljoin(self._url, "messages"), message_id) + "?popreceipt=" + pop_receipt.replace("+", "%2B") + "&" + self._token
-        response = requests.delete(delete_url)
+        response:HTTPResponse = self._pool.request("DELETE", self._message_target(message_id, pop_receipt))
 
         # handle error
         if response.status_code != 204: # when successful, it returns 204 NO CONTENT
             response_body:str = response.text
             raise Exception("Deletion of message '" + message_id + "' was unsuccessful! Status code '" + str(response.status_code) + "' was returned. Body: " + response_body)
 
+    def update_visibility(self, message:QueueMessage, visibility_timeout:int) -> None:
+        """
+        Renews (or shortens) how long a received message stays invisible to other receivers, i.e. to keep working on it past its original visibility timeout. 0 makes it visible again straight away.
+        The message's PopReceipt changes with each update, so message is updated in place to be deleted (or updated) later.
+        """
+        if visibility_timeout < 0 or visibility_timeout > 604800:
+            raise Exception("Visibility timeout must be between 0 and 604800 seconds (7 days). '" + str(visibility_timeout) + "' is invalid.")
+        response:HTTPResponse = self._pool.request("PUT", self._update_target(message, visibility_timeout))
+        if response.status_code != 204: # when successful, it returns 204 NO CONTENT
+            raise Exception("Updating the visibility of message '" + message.MessageId + "' was unsuccessful! Status code '" + str(response.status_code) + "' was returned. Body: " + response.text)
+        message.PopReceipt = response.headers["x-ms-popreceipt"]
+
+    def _update_target(self, message:QueueMessage, visibility_timeout:int) -> str:
+        """The path and query string of a specific message, for updating its visibility timeout."""
+        return self._message_target(message.MessageId, message.PopReceipt) + "&visibilitytimeout=" + str(visibility_timeout)
+
+    def delete_many(self, messages:list[QueueMessage], window:int = 8) -> list[tuple[QueueMessage, str]]:
+        """
+        Deletes many messages from the queue (i.e. a batch from receive_batch() once processed). Rather than waiting for each deletion to be confirmed before requesting the next, up to window DELETE requests are sent back-to-back (pipelined) over the connection, then their responses are read.
+        A message that can't be deleted doesn't stop the others from being deleted.
+
+        Parameters:
+        messages (list[QueueMessage]): The messages to delete.
+        window (int): Maximum number of requests sent before their responses are read.
+
+        Returns:
+        list[tuple[QueueMessage, str]]: A (message, reason) for each message that could not be deleted. An empty list if every message was deleted.
+        """
+        ToReturn:list[tuple[QueueMessage, str]] = []
+        conn:HTTPConnection = self._pool.acquire()
+        try:
+            i:int = 0
+            retried:bool = False
+            while i < len(messages):
+                batch:list[QueueMessage] = messages[i:i + window]
+                reused:bool = conn.connected
+                answered:int = 0
+                try:
+                    for msg in batch:
+                        conn.send_request("DELETE", self._message_target(msg.MessageId, msg.PopReceipt), flush=False)
+                    conn.flush()
+                    while answered < len(batch):
+                        response:HTTPResponse = conn.read_response("DELETE")
+                        if response.status_code != 204: # when successful, it returns 204 NO CONTENT
+                            ToReturn.append((batch[answered], "Status code '" + str(response.status_code) + "' was returned. Body: " + response.text))
+                        answered = answered + 1
+                except Exception as e:
+                    conn.close()
+
+                    # a kept-alive connection the server has since closed fails straight away. Send the same requests again once over a fresh connection.
+                    if reused and answered == 0 and not retried:
+                        retried = True
+                        continue
+
+                    # otherwise, it is unknown whether the unanswered ones were deleted
+                    for msg in batch[answered:]:
+                        ToReturn.append((msg, str(e)))
+                i = i + len(batch)
+                retried = False
+        finally:
+            self._pool.release(conn)
+        return ToReturn
+
+    def _message_target(self, message_id:str, pop_receipt:str) -> str:
+        """The path and query string of a specific message, for deleting (or, see _update_target(), updating) it."""
+        return message_target(self._message_prefix, message_id, pop_receipt, self._token_suffix)
+
     def clear(self) -> None:
         """Clears the queue of all messages"""
 
         # make DELETE request
-        delete_url:str = urljoin(self._url, "messages") + "?" + self._token
-        response = requests.delete(delete_url)
+        response:HTTPResponse = self._pool.request("DELETE", self._messages_path + "?" + self._token)
 
         # handle error
         if response.status_code != 204: # when successful, it returns 204 NO CONTENT
             response_body:str = response.text
             raise Exception("Clearing of queue was unsuccessful! Status code '" + str(response.status_code) + "' was returned. Body: " + response_body)
 
+class QueueBatchWriter:
+    """
+    Batches many small readings into a single queue message, so a sensor loop sends one request every so often instead of one per reading.
+    Readings are joined with a separator (a newline by default) and sent as soon as the batch would grow past max_bytes, reaches max_count readings or becomes older than max_age_ms.
+    """
+
+    def __init__(self, service:QueueService, max_bytes:int = 60000, max_count:int = 0, max_age_ms:int = 60000, separator:str = "\n", spool = None):
+        """
+        Creates a new batching writer in front of a QueueService.
+
+        Parameters:
+        service (QueueService): The queue the batches are sent to.
+        max_bytes (int): Maximum size of a batch (UTF-8 encoded and XML escaped, as sent), in bytes. Can't exceed the 64 KB Azure message limit.
+        max_count (int): Maximum number of readings in a batch. 0 = no limit.
+        max_age_ms (int): Maximum time a reading waits in the batch before it is sent, in milliseconds. Checked on write() and poll(). 0 = no limit.
+        separator (str): Placed between readings in a batch.
+        spool (QueueSpool.QueueSpool): Optional spool on flash. If a batch can't be sent (i.e. Wi-Fi is down), it is added to the spool instead of raising. Its records must be able to hold max_bytes. While the spool holds anything, new batches are added to it too, so they arrive in order once a QueueSpool.SpoolDrainer forwards them.
+        """
+        if max_bytes > MAX_MESSAGE_SIZE:
+            raise Exception("Maximum batch size of " + str(max_bytes) + " bytes exceeds the Azure Queue message limit of " + str(MAX_MESSAGE_SIZE) + " bytes.")
+        if spool != None and spool.max_message < max_bytes: # a batch that can't be sent must always fit in the spool
+            raise Exception("Maximum batch size of " + str(max_bytes) + " bytes exceeds the " + str(spool.max_message) + " bytes a spool record can hold. Lower max_bytes or create the spool with a larger record_size.")
+        self._service:QueueService = service
+        self.max_bytes:int = max_bytes
+        self.max_count:int = max_count
+        self.max_age_ms:int = max_age_ms
+        self.separator:str = separator
+        self.spool = spool
+
+        # current batch
+        self._readings:list[str] = []
+        self._bytes:int = 0 # size of the current batch once joined, in bytes
+        self._started_ticks_ms:int = 0 # when the first reading of the current batch was written
+
+        # counters
+        self.sent:int = 0 # batches sent
+        self.spooled:int = 0 # batches added to the spool
+
+    def __len__(self) -> int:
+        """Number of readings waiting in the current batch."""
+        return len(self._readings)
+
+    def write(self, reading:str) -> None:
+        """Adds a reading to the batch, sending the batch first if the reading would not fit and afterwards if it is now full or old enough. If the batch can't be sent (or spooled), the exception is raised and the batch is kept, without the new reading."""
+        size:int = len(xml_escape(reading).encode()) # as it will be sent
+        if size > self.max_bytes:
+            raise Exception("Reading of " + str(size) + " bytes is larger than the maximum batch size of " + str(self.max_bytes) + " bytes.")
+
+        # would not fit? send what we have first
+        added:int = size if len(self._readings) == 0 else size + len(self.separator.encode())
+        if len(self._readings) > 0 and self._bytes + added > self.max_bytes:
+            self.flush()
+            added = size
+
+        if len(self._readings) == 0:
+            self._started_ticks_ms = _ticks_ms()
+        self._readings.append(reading)
+        self._bytes = self._bytes + added
+
+        if self.max_count > 0 and len(self._readings) >= self.max_count:
+            self.flush()
+        else:
+            self.poll()
+
+    def poll(self) -> None:
+        """Sends the batch if it has become older than max_age_ms. Call this regularly from your main loop so a batch doesn't wait on the next write()."""
+        if self.max_age_ms > 0 and len(self._readings) > 0 and _ticks_diff(_ticks_ms(), self._started_ticks_ms) >= self.max_age_ms:
+            self.flush()
+
+    def flush(self) -> None:
+        """Sends the current batch now (or adds it to the spool)."""
+        if len(self._readings) == 0:
+            return
+        batch:str = self.separator.join(self._readings)
+
+        # anything already spooled goes first, so readings arrive in order
+        if self.spool != None and len(self.spool) > 0:
+            self.spool.append(batch)
+            self.spooled = self.spooled + 1
+        else:
+            try:
+                self._service.put(batch)
+                self.sent = self.sent + 1
+            except Exception:
+                if self.spool == None:
+                    raise
+                self.spool.append(batch)
+                self.spooled = self.spooled + 1
+
+        # only forget the batch once it was sent or spooled. If both failed, the exception above leaves it in place to try again.
+        self._readings = []
+        self._bytes = 0
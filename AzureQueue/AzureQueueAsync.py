@@ -0,0 +1,381 @@
+"""
+asyncio client for the Azure Queue Storage REST API: the same operations as AzureQueue.QueueService, without blocking the rest of your program while waiting on the network.
+Author Tim Hanewich, github.com/TimHanewich
+Find updates to this code: https://github.com/TimHanewich/MicroPython-Collection/tree/master/AzureQueue
+
+MIT License
+Copyright 2024 Tim Hanewich
+Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated documentation files (the “Software”), to deal in the Software without restriction, including without limitation the rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software, and to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in all copies or substantial portions of the Software.
+THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+try:
+    import asyncio
+except ImportError: # older MicroPython firmware
+    import uasyncio as asyncio
+
+import AzureQueue
+from AzureQueue import QueueMessage, HTTPResponse
+
+######## HTTP ########
+
+class AsyncHTTPConnection:
+    """A single persistent (HTTP/1.1 keep-alive) connection to a host, using asyncio streams. Opened on the first request, reused after that, and transparently reopened if the server closed it."""
+
+    def __init__(self, host:str, port:int, tls:bool = True, chunk_size:int = 1024):
+        self.host:str = host
+        self.port:int = port
+        self.tls:bool = tls
+        self.chunk_size:int = chunk_size
+        self._reader = None
+        self._writer = None
+        self.requests:int = 0 # number of requests sent over the current connection
+        self._received:bool = False # whether any part of the current response has been received
+
+        # how much of the current response's body is left to read (see AzureQueue.HTTPConnection)
+        self._body_mode:int = AzureQueue._BODY_NONE
+        self._body_left:int = 0
+        self._keep_alive:bool = True
+
+        # headers sent with every request, encoded once
+        self._common_headers:bytes = ("Host: " + host + "\r\nConnection: keep-alive\r\n").encode()
+
+    @property
+    def connected(self) -> bool:
+        return self._writer != None
+
+    async def connect(self) -> None:
+        self.close()
+        if self.tls:
+            self._reader, self._writer = await asyncio.open_connection(self.host, self.port, ssl=True)
+        else:
+            self._reader, self._writer = await asyncio.open_connection(self.host, self.port)
+        self.requests = 0
+
+    def close(self) -> None:
+        if self._writer != None:
+            try:
+                self._writer.close()
+            except:
+                pass
+            self._reader = None
+            self._writer = None
+        self._body_mode = AzureQueue._BODY_NONE
+
+    async def request(self, method:str, target:str, body:bytes = None, content_type:str = None) -> HTTPResponse:
+        """Sends a request and reads the full response."""
+        status_code, headers = await self.begin(method, target, body, content_type)
+        return HTTPResponse(status_code, headers, await self.read_body())
+
+    async def begin(self, method:str, target:str, body:bytes = None, content_type:str = None) -> tuple[int, dict]:
+        """Sends a request and reads the response's status and headers, returning (status code, headers). The body is then read with read_chunk() (or all at once with read_body())."""
+        attempt:int = 0
+        while True:
+            reused:bool = self._writer != None
+            if not reused:
+                await self.connect()
+            try:
+                await self.send_request(method, target, body, content_type)
+                return await self.read_head(method)
+            except Exception as e:
+                self.close()
+
+                # a kept-alive connection the server has since closed fails on the first write or read. Retry once on a fresh connection, but only if no part of a response came back (so the server never handled it).
+                if not reused or attempt > 0 or self._received:
+                    raise
+                attempt = attempt + 1
+
+    async def send_request(self, method:str, target:str, body:bytes = None, content_type:str = None) -> None:
+        self._received = False
+        head:list[bytes] = [method.encode(), b" ", target.encode(), b" HTTP/1.1\r\n", self._common_headers]
+        if body != None:
+            if content_type != None:
+                head.append(b"Content-Type: " + content_type.encode() + b"\r\n")
+            head.append(b"Content-Length: " + str(len(body)).encode() + b"\r\n\r\n")
+        else:
+            head.append(b"Content-Length: 0\r\n\r\n")
+        self._writer.write(b"".join(head))
+        if body != None:
+            self._writer.write(body)
+        await self._writer.drain()
+        self.requests = self.requests + 1
+
+    async def read_head(self, method:str = "GET") -> tuple[int, dict]:
+        # status line, i.e. "HTTP/1.1 200 OK"
+        status_line:bytes = await self._readline()
+        self._received = True
+        status_code:int = AzureQueue.parse_status_line(status_line)
+
+        # headers
+        headers:dict = {}
+        while True:
+            line:bytes = await self._readline()
+            if len(line) == 0: # blank line, end of headers
+                break
+            AzureQueue.parse_header(line, headers)
+
+        # how the body is delimited
+        self._body_mode, self._body_left, self._keep_alive = AzureQueue.body_framing(method, status_code, headers)
+        if self._body_mode == AzureQueue._BODY_NONE:
+            self._end_body()
+        return (status_code, headers)
+
+    @property
+    def body_pending(self) -> bool:
+        """True if the body of the current response has not been read to the end yet."""
+        return self._body_mode != AzureQueue._BODY_NONE
+
+    async def read_chunk(self) -> bytes:
+        """Reads the next piece of the current response's body (at most chunk_size bytes). Returns b"" once the whole body has been read."""
+        while True:
+            if self._body_mode == AzureQueue._BODY_NONE:
+                return b""
+            elif self._body_mode == AzureQueue._BODY_CHUNKED and self._body_left == 0: # at the start of a chunk
+                self._body_left = AzureQueue.parse_chunk_size(await self._readline())
+                if self._body_left == 0:
+                    while len(await self._readline()) > 0: # trailers, until the blank line
+                        pass
+                    self._end_body()
+                    return b""
+            elif self._body_mode == AzureQueue._BODY_TO_CLOSE:
+                ToReturn:bytes = await self._reader.read(self.chunk_size)
+                if len(ToReturn) == 0: # closed, that's the end of the body
+                    self._end_body()
+                return ToReturn
+            else: # inside of a chunk or a Content-Length body
+                ToReturn:bytes = await self._reader.read(min(self._body_left, self.chunk_size))
+                if len(ToReturn) == 0:
+                    raise AzureQueue.connection_closed(self.host)
+                self._body_left = self._body_left - len(ToReturn)
+                if self._body_left == 0:
+                    if self._body_mode == AzureQueue._BODY_CHUNKED:
+                        await self._readline() # the \r\n after the chunk
+                    else:
+                        self._end_body()
+                return ToReturn
+
+    async def read_body(self) -> bytes:
+        """Reads the rest of the current response's body."""
+        chunks:list[bytes] = []
+        while True:
+            chunk:bytes = await self.read_chunk()
+            if len(chunk) == 0:
+                return b"".join(chunks)
+            chunks.append(chunk)
+
+    async def _readline(self) -> bytes:
+        """Reads a line, returning it without the line ending."""
+        line:bytes = await self._reader.readline()
+        if len(line) == 0:
+            raise AzureQueue.connection_closed(self.host)
+        if line.endswith(b"\r\n"):
+            return line[:-2]
+        return line.rstrip(b"\n")
+
+    def _end_body(self) -> None:
+        self._body_mode = AzureQueue._BODY_NONE
+        if not self._keep_alive:
+            self.close()
+
+class AsyncConnectionPool:
+    """A small pool of persistent AsyncHTTPConnections to one host, bounding how many requests are in flight at once. Requests beyond that wait their turn."""
+
+    def __init__(self, host:str, port:int, tls:bool = True, size:int = 2, timeout:float = 15.0):
+        self.host:str = host
+        self.port:int = port
+        self.tls:bool = tls
+        self.size:int = size
+        self.timeout:float = timeout
+        self._idle:list[AsyncHTTPConnection] = []
+        self._created:int = 0
+        self._available:asyncio.Event = asyncio.Event() # set whenever a connection is given back
+
+    @property
+    def in_use(self) -> int:
+        """Number of connections currently handling a request."""
+        return self._created - len(self._idle)
+
+    async def acquire(self) -> AsyncHTTPConnection:
+        """Takes a connection out of the pool, waiting for one to be given back if all of them are in use. Give it back with release()."""
+        while True:
+            if len(self._idle) > 0:
+                return self._idle.pop()
+            if self._created < self.size:
+                self._created = self._created + 1
+                return AsyncHTTPConnection(self.host, self.port, self.tls)
+            self._available.clear()
+            await self._available.wait()
+
+    def release(self, conn:AsyncHTTPConnection) -> None:
+        self._idle.append(conn)
+        self._available.set()
+
+    async def request(self, method:str, target:str, body:bytes = None, content_type:str = None) -> HTTPResponse:
+        conn:AsyncHTTPConnection = await self.acquire()
+        try:
+            return await asyncio.wait_for(conn.request(method, target, body, content_type), self.timeout)
+        except BaseException: # failed, timed out or cancelled part way through, so the connection is in an unknown state
+            conn.close()
+            raise
+        finally:
+            self.release(conn)
+
+    def close(self) -> None:
+        """Closes every idle connection. They reconnect automatically if used again."""
+        for conn in self._idle:
+            conn.close()
+
+######## QUEUE ########
+
+class AsyncQueueService:
+    """
+    asyncio version of AzureQueue.QueueService. Every operation is a coroutine, so other tasks (reading sensors, blinking LEDs, listening on a radio) keep running while it waits on the network.
+    Cancelling a task in the middle of an operation (i.e. with asyncio.wait_for) is safe: the connection it was using is closed and reopened for the next operation.
+    """
+
+    def __init__(self, queue_url:str, sas_token:str, concurrency:int = 2, timeout:float = 15.0):
+        """
+        Creates a new instance of the AsyncQueueService class, ready to communicate with a specific queue within a specific Azure Storage Account.
+
+        Parameters:
+        queue_url (str): The URL directly to the Azure Storage Queue, i.e. "https://mystorageaccount.queue.core.windows.net/myqueue"
+        sas_token (str): The Shared Access Signature (SAS) you get when generating in the Azure Portal.
+        concurrency (int): Maximum number of requests in flight at once (each uses its own connection). Further operations wait their turn.
+        timeout (float): Maximum time a single request may take, in seconds.
+        """
+
+        # ensure the URL has an actual queue name in it
+        if "/" not in queue_url.lower().replace("https://", "").replace("http://", "") or queue_url[len(queue_url) - 1] == "/":
+            raise Exception("You did not provide the URL to a specific Queue in the URL you provided. Ensure the URL you are providing is not only to a specific storage account, but also to a specific queue (i.e. '/myqueue' at the end)!")
+
+        self._url = queue_url
+        self._token = sas_token
+
+        # persistent connection(s) to the storage account, reused across requests
+        tls, host, port, path = AzureQueue.parse_url(queue_url)
+        self._pool:AsyncConnectionPool = AsyncConnectionPool(host, port, tls, concurrency, timeout)
+        self._queue_path:str = path # i.e. "/myqueue"
+        self._messages_path:str = AzureQueue.urljoin(path, "messages") # i.e. "/myqueue/messages"
+        self._message_prefix:str = self._messages_path + "/"
+        self._token_suffix:str = "&" + sas_token
+
+    def close(self) -> None:
+        """Closes the connection(s) to the storage account. They are reopened automatically if the AsyncQueueService is used again."""
+        self._pool.close()
+
+    async def put(self, text:str) -> None:
+        """Adds a new message to the queue. Characters XML can't carry as-is (&, < and >) are escaped."""
+        await self._put_body(AzureQueue._PUT_PREFIX + AzureQueue.xml_escape(text).encode() + AzureQueue._PUT_SUFFIX)
+
+    async def put_bytes(self, data) -> None:
+        """Adds a new message holding binary data to the queue, base64 encoded. Read it back with the received QueueMessage's MessageBytes property."""
+        size:int = AzureQueue.b64_length(len(data))
+        if size > AzureQueue.MAX_MESSAGE_SIZE:
+            raise Exception("Binary message of " + str(len(data)) + " bytes is " + str(size) + " bytes once base64 encoded, over the " + str(AzureQueue.MAX_MESSAGE_SIZE) + " byte Azure Queue message limit.")
+        body:bytearray = bytearray(len(AzureQueue._PUT_PREFIX) + size + len(AzureQueue._PUT_SUFFIX))
+        body[0:len(AzureQueue._PUT_PREFIX)] = AzureQueue._PUT_PREFIX
+        AzureQueue.b64encode_into(data, body, len(AzureQueue._PUT_PREFIX))
+        body[len(body) - len(AzureQueue._PUT_SUFFIX):] = AzureQueue._PUT_SUFFIX
+        await self._put_body(body)
+
+    async def _put_body(self, body:bytes) -> None:
+        response:HTTPResponse = await self._pool.request("POST", self._messages_path + "?" + self._token, body, "application/xml")
+        if response.status_code != 201:
+            raise Exception("POST request to Azure Queue Service to upload message returned status code '" + str(response.status_code) + "', not the successful '201 CREATED'!")
+
+    async def receive_batch(self, n:int = 32, visibility_timeout:int = None) -> list[QueueMessage]:
+        """Receives up to n messages (1-32) from the queue in a single request, but does NOT delete them. See AzureQueue.QueueService.receive_batch()."""
+        if n < 1 or n > 32:
+            raise Exception("Number of messages to receive must be between 1 and 32. '" + str(n) + "' is invalid.")
+        if visibility_timeout != None and (visibility_timeout < 1 or visibility_timeout > 604800):
+            raise Exception("Visibility timeout must be between 1 and 604800 seconds (7 days). '" + str(visibility_timeout) + "' is invalid.")
+        target:str = self._messages_path + "?numofmessages=" + str(n)
+        if visibility_timeout != None:
+            target = target + "&visibilitytimeout=" + str(visibility_timeout)
+        return await self._get_messages(target + self._token_suffix)
+
+    async def receive(self) -> QueueMessage:
+        """Receives the next message from the queue, but does NOT delete it. Returns None if the queue is empty."""
+        messages:list[QueueMessage] = await self.receive_batch(1)
+        if len(messages) == 0:
+            return None
+        return messages[0]
+
+    async def peek(self, n:int = 1) -> list[QueueMessage]:
+        """Returns up to n messages (1-32) from the front of the queue without receiving them: they stay visible to other receivers and have no PopReceipt."""
+        if n < 1 or n > 32:
+            raise Exception("Number of messages to peek must be between 1 and 32. '" + str(n) + "' is invalid.")
+        return await self._get_messages(self._messages_path + "?peekonly=true&numofmessages=" + str(n) + self._token_suffix)
+
+    async def approximate_message_count(self) -> int:
+        """Returns the approximate number of messages in the queue, without receiving any. See AzureQueue.QueueService.approximate_message_count()."""
+        return int((await self.metadata())["x-ms-approximate-messages-count"])
+
+    async def metadata(self) -> dict:
+        """Returns the queue's properties: the headers of a Get Queue Metadata request (names lowercase)."""
+        response:HTTPResponse = await self._pool.request("HEAD", self._queue_path + "?comp=metadata" + self._token_suffix)
+        if response.status_code != 200:
+            raise Exception("Request for queue metadata returned status code " + str(response.status_code) + ", not the successful '200 OK'!")
+        return response.headers
+
+    async def _get_messages(self, target:str) -> list[QueueMessage]:
+        """Makes a GET request for messages, parsing them as the response streams in."""
+        conn:AsyncHTTPConnection = await self._pool.acquire()
+        try:
+            return await asyncio.wait_for(self._read_messages(conn, target), self._pool.timeout)
+        except BaseException: # failed, timed out or cancelled part way through
+            conn.close()
+            raise
+        finally:
+            self._pool.release(conn)
+
+    async def _read_messages(self, conn:AsyncHTTPConnection, target:str) -> list[QueueMessage]:
+        status_code, headers = await conn.begin("GET", target)
+        if status_code != 200:
+            raise Exception("GET request to receive queue messages returned status code " + str(status_code) + "! Body: " + (await conn.read_body()).decode())
+        parser:AzureQueue.QueueMessageParser = AzureQueue.QueueMessageParser()
+        while True:
+            chunk:bytes = await conn.read_chunk()
+            if len(chunk) == 0:
+                return parser.messages
+            parser.feed(chunk)
+
+    async def delete(self, message_id:str, pop_receipt:str) -> None:
+        """Deletes a message from the queue."""
+        target:str = AzureQueue.message_target(self._message_prefix, message_id, pop_receipt, self._token_suffix)
+        response:HTTPResponse = await self._pool.request("DELETE", target)
+        if response.status_code != 204: # when successful, it returns 204 NO CONTENT
+            raise Exception("Deletion of message '" + message_id + "' was unsuccessful! Status code '" + str(response.status_code) + "' was returned. Body: " + response.text)
+
+    async def update_visibility(self, message:QueueMessage, visibility_timeout:int) -> None:
+        """Renews (or shortens) how long a received message stays invisible to other receivers. See AzureQueue.QueueService.update_visibility(). message's PopReceipt is updated in place."""
+        if visibility_timeout < 0 or visibility_timeout > 604800:
+            raise Exception("Visibility timeout must be between 0 and 604800 seconds (7 days). '" + str(visibility_timeout) + "' is invalid.")
+        target:str = AzureQueue.message_target(self._message_prefix, message.MessageId, message.PopReceipt, self._token_suffix) + "&visibilitytimeout=" + str(visibility_timeout)
+        response:HTTPResponse = await self._pool.request("PUT", target)
+        if response.status_code != 204: # when successful, it returns 204 NO CONTENT
+            raise Exception("Updating the visibility of message '" + message.MessageId + "' was unsuccessful! Status code '" + str(response.status_code) + "' was returned. Body: " + response.text)
+        message.PopReceipt = response.headers["x-ms-popreceipt"]
+
+    async def delete_many(self, messages:list[QueueMessage]) -> list[tuple[QueueMessage, str]]:
+        """
+        Deletes many messages from the queue, up to concurrency of them at once. A message that can't be deleted doesn't stop the others from being deleted.
+        Returns a (message, reason) for each message that could not be deleted. An empty list if every message was deleted.
+        """
+        ToReturn:list[tuple[QueueMessage, str]] = []
+
+        async def delete_one(msg:QueueMessage) -> None:
+            try:
+                await self.delete(msg.MessageId, msg.PopReceipt)
+            except Exception as e:
+                ToReturn.append((msg, str(e)))
+
+        await asyncio.gather(*[delete_one(msg) for msg in messages]) # the pool limits how many actually run at once
+        return ToReturn
+
+    async def clear(self) -> None:
+        """Clears the queue of all messages"""
+        response:HTTPResponse = await self._pool.request("DELETE", self._messages_path + "?" + self._token)
+        if response.status_code != 204: # when successful, it returns 204 NO CONTENT
+            raise Exception("Clearing of queue was unsuccessful! Status code '" + str(response.status_code) + "' was returned. Body: " + response.text)
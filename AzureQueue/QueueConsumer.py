@@ -0,0 +1,189 @@
+"""
+Adaptive queue consumer for AzureQueue: receives messages as they arrive and hands each to your handler, polling quickly while the queue is busy and backing off while it is empty.
+Author Tim Hanewich, github.com/TimHanewich
+Find updates to this code: https://github.com/TimHanewich/MicroPython-Collection/tree/master/AzureQueue
+
+MIT License
+Copyright 2024 Tim Hanewich
+Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated documentation files (the “Software”), to deal in the Software without restriction, including without limitation the rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software, and to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in all copies or substantial portions of the Software.
+THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+try:
+    import asyncio
+except ImportError: # older MicroPython firmware
+    import uasyncio as asyncio
+
+import AzureQueue
+from AzureQueue import QueueMessage
+from AzureQueueAsync import AsyncQueueService
+
+class QueueConsumer:
+    """
+    Receives messages from an AsyncQueueService and passes each to a handler, deleting it once handled.
+    - While the queue is empty, the wait between polls doubles from min_interval_ms up to max_interval_ms, and drops back to polling straight away as soon as a poll returns messages.
+    - While a batch is being handled, the next one is already being received (prefetched), so a busy queue is drained without waiting on a round trip between batches.
+    - Messages are kept invisible to other receivers for as long as they are held (handled or waiting in a prefetched batch), by renewing their visibility timeout shortly before it runs out.
+    """
+
+    def __init__(self, service:AsyncQueueService, handler, batch:int = 16, visibility_timeout:int = 30, min_interval_ms:int = 1000, max_interval_ms:int = 60000, renew_margin_s:int = 10, prefetch:bool = True, on_error = None, on_poll = None):
+        """
+        Parameters:
+        service (AsyncQueueService): The queue to consume.
+        handler: Called with each QueueMessage. May be a regular function or a coroutine function. The message is deleted once it returns, unless it raises an exception, in which case the message is left to reappear in the queue once its visibility timeout runs out.
+        batch (int): Maximum number of messages received per poll (1-32).
+        visibility_timeout (int): Visibility timeout requested (and renewed) for held messages, in seconds.
+        min_interval_ms (int): Wait after the first empty poll, in milliseconds.
+        max_interval_ms (int): Longest wait between polls while the queue is empty, in milliseconds.
+        renew_margin_s (int): A held message's visibility is renewed once it is due to run out within this many seconds.
+        prefetch (bool): Receive the next batch while the current one is being handled.
+        on_error: Optional, called with (message, exception) when the handler raises an exception, and with (None, exception) when a poll fails.
+        on_poll: Optional, called with (consumer, number of messages received) after every poll. Handy for reporting the metrics below.
+        """
+        if renew_margin_s >= visibility_timeout:
+            raise Exception("Renewal margin of " + str(renew_margin_s) + " seconds must be shorter than the visibility timeout of " + str(visibility_timeout) + " seconds.")
+        self.service:AsyncQueueService = service
+        self.handler = handler
+        self.batch:int = batch
+        self.visibility_timeout:int = visibility_timeout
+        self.min_interval_ms:int = min_interval_ms
+        self.max_interval_ms:int = max_interval_ms
+        self.renew_margin_s:int = renew_margin_s
+        self.prefetch:bool = prefetch
+        self.on_error = on_error
+        self.on_poll = on_poll
+        self.interval_ms:int = 0 # current wait between polls, 0 while the queue is busy
+        self._running:bool = False
+
+        # held messages: [message, ticks_ms its visibility timeout was last set]. Renewals and deletions are done under a lock, as each changes the message's PopReceipt.
+        self._held:list[list] = []
+        self._lease_lock:asyncio.Lock = asyncio.Lock()
+
+        # metrics
+        self.polls:int = 0
+        self.empty_polls:int = 0
+        self.failed_polls:int = 0
+        self.received:int = 0
+        self.handled:int = 0
+        self.failed:int = 0 # messages the handler raised an exception for, or that could not be deleted
+        self.renewals:int = 0
+
+    def metrics(self) -> dict:
+        ToReturn = {}
+        ToReturn["polls"] = self.polls
+        ToReturn["empty_polls"] = self.empty_polls
+        ToReturn["failed_polls"] = self.failed_polls
+        ToReturn["received"] = self.received
+        ToReturn["handled"] = self.handled
+        ToReturn["failed"] = self.failed
+        ToReturn["renewals"] = self.renewals
+        ToReturn["held"] = len(self._held)
+        ToReturn["interval_ms"] = self.interval_ms
+        return ToReturn
+
+    def stop(self) -> None:
+        """Stops run() once the message being handled is done. Messages received but not yet handled reappear in the queue once their visibility timeout runs out."""
+        self._running = False
+
+    async def run(self) -> None:
+        """Consumes the queue until stop() is called. Run it as a task: asyncio.create_task(consumer.run())"""
+        self._running = True
+        renewer = asyncio.create_task(self._renew_loop())
+        pending = None # the prefetch in progress
+        try:
+            while self._running:
+                if pending != None:
+                    messages:list[QueueMessage] = await pending
+                    pending = None
+                else:
+                    messages:list[QueueMessage] = await self._poll()
+
+                if len(messages) == 0:
+                    self.interval_ms = self.min_interval_ms if self.interval_ms == 0 else min(self.interval_ms * 2, self.max_interval_ms)
+                    await asyncio.sleep(self.interval_ms / 1000)
+                    continue
+                self.interval_ms = 0
+
+                # receive the next batch while this one is handled
+                if self.prefetch and self._running:
+                    pending = asyncio.create_task(self._poll())
+
+                for msg in messages:
+                    if not self._running:
+                        break
+                    await self._handle(msg)
+        finally:
+            self._running = False
+            if pending != None:
+                pending.cancel()
+            renewer.cancel()
+            self._held = []
+
+    async def _poll(self) -> list[QueueMessage]:
+        self.polls = self.polls + 1
+        try:
+            messages:list[QueueMessage] = await self.service.receive_batch(self.batch, self.visibility_timeout)
+        except Exception as e:
+            self.failed_polls = self.failed_polls + 1
+            if self.on_error != None:
+                self.on_error(None, e)
+            messages = []
+        if len(messages) == 0:
+            self.empty_polls = self.empty_polls + 1
+        self.received = self.received + len(messages)
+        now:int = AzureQueue._ticks_ms()
+        for msg in messages:
+            self._held.append([msg, now])
+        if self.on_poll != None:
+            self.on_poll(self, len(messages))
+        return messages
+
+    async def _handle(self, msg:QueueMessage) -> None:
+        try:
+            result = self.handler(msg)
+            if hasattr(result, "send"): # a coroutine
+                await result
+        except Exception as e:
+            self.failed = self.failed + 1
+            self._release(msg)
+            if self.on_error != None:
+                self.on_error(msg, e)
+            return
+
+        # handled, delete it
+        async with self._lease_lock:
+            self._release(msg)
+            try:
+                await self.service.delete(msg.MessageId, msg.PopReceipt)
+                self.handled = self.handled + 1
+            except Exception as e:
+                self.failed = self.failed + 1
+                if self.on_error != None:
+                    self.on_error(msg, e)
+
+    def _release(self, msg:QueueMessage) -> None:
+        """Stops holding (renewing) a message."""
+        for i in range(len(self._held)):
+            if self._held[i][0] is msg:
+                self._held.pop(i)
+                return
+
+    async def _renew_loop(self) -> None:
+        """Renews the visibility of every held message that is close to reappearing in the queue."""
+        while True:
+            await asyncio.sleep(1)
+            renew_after_ms:int = (self.visibility_timeout - self.renew_margin_s) * 1000
+            for entry in list(self._held):
+                if AzureQueue._ticks_diff(AzureQueue._ticks_ms(), entry[1]) < renew_after_ms:
+                    continue
+                async with self._lease_lock:
+                    if entry not in self._held: # handled in the meantime
+                        continue
+                    try:
+                        await self.service.update_visibility(entry[0], self.visibility_timeout)
+                        entry[1] = AzureQueue._ticks_ms()
+                        self.renewals = self.renewals + 1
+                    except Exception as e:
+                        if self.on_error != None:
+                            self.on_error(entry[0], e)
@@ -0,0 +1,304 @@
+"""
+Offline store-and-forward for AzureQueue: messages that can't be sent right now (i.e. Wi-Fi is down) are kept in a spool on flash and forwarded once the connection is back.
+Author Tim Hanewich, github.com/TimHanewich
+Find updates to this code: https://github.com/TimHanewich/MicroPython-Collection/tree/master/AzureQueue
+
+MIT License
+Copyright 2024 Tim Hanewich
+Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated documentation files (the “Software”), to deal in the Software without restriction, including without limitation the rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software, and to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in all copies or substantial portions of the Software.
+THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+import struct
+import random
+try:
+    import asyncio
+except ImportError: # older MicroPython firmware
+    import uasyncio as asyncio
+import AzureQueue
+
+# record format: a fixed-size slot in the data file per message
+_RECORD_HEADER:str = "<BH" # kind, payload length
+RECORD_HEADER_SIZE:int = struct.calcsize(_RECORD_HEADER)
+KIND_TEXT:int = 0 # sent with put()
+KIND_BYTES:int = 1 # sent with put_bytes()
+
+# index format: two slots, written alternately, so a crash (or power loss) part way through writing one leaves the other intact
+_INDEX_SLOT:str = "<IIII" # sequence number, head, tail, check
+INDEX_SLOT_SIZE:int = struct.calcsize(_INDEX_SLOT)
+_INDEX_MAGIC:int = 0x5A17C0DE
+
+def _index_check(seq:int, head:int, tail:int) -> int:
+    return (seq ^ (head * 31) ^ (tail * 1009) ^ _INDEX_MAGIC) & 0xFFFFFFFF
+
+class QueueSpool:
+    """
+    A durable first-in first-out spool of queue messages on flash.
+    Messages are stored in a circular data file of capacity fixed-size records, each written in place exactly once, so the file is never rewritten as a whole. Which records hold messages is tracked by a small head/tail index file.
+    Messages are numbered oldest (0) to newest (len - 1).
+    """
+
+    def __init__(self, path:str = "spool", record_size:int = 512, capacity:int = 64, overwrite:bool = True):
+        """
+        Opens the spool at path (creating it if needed). Two files are used: path + ".dat" (capacity * record_size bytes) and path + ".idx" (a few bytes).
+
+        Parameters:
+        path (str): Path of the spool files, without extension.
+        record_size (int): Size of each record, in bytes. A message can be at most record_size - 3 bytes.
+        capacity (int): Maximum number of messages held.
+        overwrite (bool): When the spool is full, True drops the oldest message to make room for a new one (counted in dropped). False raises an exception instead.
+        """
+        if record_size <= RECORD_HEADER_SIZE or record_size > 0xFFFF:
+            raise Exception("Record size of " + str(record_size) + " bytes is invalid. It must be between " + str(RECORD_HEADER_SIZE + 1) + " and 65535 bytes.")
+        self.record_size:int = record_size
+        self.max_message:int = record_size - RECORD_HEADER_SIZE # largest message that fits in a record, in bytes
+        self.capacity:int = capacity
+        self.overwrite:bool = overwrite
+        self.dropped:int = 0 # messages dropped because the spool was full
+        self._data_path:str = path + ".dat"
+        self._index_path:str = path + ".idx"
+        self._buf:bytearray = bytearray(record_size) # reused for every record read and written
+        self._mv:memoryview = memoryview(self._buf)
+
+        # head (oldest message) and tail (where the next message goes) only ever count up. Their position in the data file is the count modulo capacity.
+        self.head:int = 0
+        self.tail:int = 0
+        self._seq:int = 0 # sequence number of the index slot written last
+
+        self._data = None
+        self._index = None
+        self._open()
+
+    def __len__(self) -> int:
+        return self.tail - self.head
+
+    @property
+    def full(self) -> bool:
+        return self.tail - self.head >= self.capacity
+
+    def append(self, message) -> None:
+        """Adds a message (a str, sent with put(), or bytes, sent with put_bytes()) to the end of the spool."""
+        if isinstance(message, str):
+            kind:int = KIND_TEXT
+            data:bytes = message.encode()
+        else:
+            kind:int = KIND_BYTES
+            data = message
+        if len(data) > self.record_size - RECORD_HEADER_SIZE:
+            raise Exception("Message of " + str(len(data)) + " bytes is too large for a spool record of " + str(self.record_size) + " bytes. At most " + str(self.record_size - RECORD_HEADER_SIZE) + " bytes fit.")
+
+        # make room
+        if self.full:
+            if not self.overwrite:
+                raise Exception("Spool is full! All " + str(self.capacity) + " records hold messages that have not been sent yet.")
+            self.head = self.head + 1 # committed before the oldest record is overwritten, so a crash in between can't make the new message look like the oldest
+            self.dropped = self.dropped + 1
+            self._commit()
+
+        # write the record, then the index that makes it part of the spool
+        struct.pack_into(_RECORD_HEADER, self._buf, 0, kind, len(data))
+        self._buf[RECORD_HEADER_SIZE:RECORD_HEADER_SIZE + len(data)] = data
+        self._data.seek((self.tail % self.capacity) * self.record_size)
+        self._data.write(self._mv[0:RECORD_HEADER_SIZE + len(data)])
+        self._data.flush()
+        self.tail = self.tail + 1
+        self._commit()
+
+    def read(self, i:int = 0):
+        """Returns message i (0 = the oldest) without removing it: a str if it was added as one, otherwise bytes."""
+        if i < 0 or i >= len(self):
+            raise Exception("Message " + str(i) + " is not in the spool, which holds " + str(len(self)) + " messages.")
+        self._data.seek(((self.head + i) % self.capacity) * self.record_size)
+        self._data.readinto(self._buf)
+        kind, length = struct.unpack_from(_RECORD_HEADER, self._buf, 0)
+        data:bytes = bytes(self._mv[RECORD_HEADER_SIZE:RECORD_HEADER_SIZE + length])
+        if kind == KIND_TEXT:
+            return data.decode()
+        return data
+
+    def pop(self, n:int = 1) -> None:
+        """Removes the n oldest messages (i.e. once they have been sent). The index is written once, however many are removed."""
+        n = min(n, len(self))
+        if n > 0:
+            self.head = self.head + n
+            self._commit()
+
+    def pop_until(self, position:int) -> None:
+        """Removes every message before position, counted like head and tail (i.e. head + the number sent). Messages already dropped to make room (head has moved past them) are skipped, so a message added since can't be removed in their place."""
+        self.pop(position - self.head)
+
+    def clear(self) -> None:
+        self.pop(len(self))
+
+    def close(self) -> None:
+        for f in (self._data, self._index):
+            if f != None:
+                f.close()
+        self._data = None
+        self._index = None
+
+    ######## FILES ########
+
+    def _open(self) -> None:
+        size:int = self.capacity * self.record_size
+
+        # data file, created at its full size up front if it doesn't exist (or was created with a different size)
+        fresh:bool = False
+        try:
+            self._data = open(self._data_path, "r+b")
+            self._data.seek(0, 2)
+            if self._data.tell() != size:
+                self._data.close()
+                raise OSError("spool was created with a different size")
+        except OSError:
+            self._data = open(self._data_path, "wb")
+            for i in range(self.capacity):
+                self._data.write(self._buf)
+            self._data.close()
+            self._data = open(self._data_path, "r+b")
+            fresh = True
+
+        # index
+        try:
+            self._index = open(self._index_path, "r+b")
+        except OSError:
+            self._index = open(self._index_path, "wb")
+            self._index.write(bytes(2 * INDEX_SLOT_SIZE))
+            self._index.close()
+            self._index = open(self._index_path, "r+b")
+            fresh = True
+        if fresh:
+            # wipe both slots, or a slot left over from before the data file was recreated could still hold a higher sequence number (and the old head and tail), and be loaded after a reboot
+            self._index.seek(0)
+            self._index.write(bytes(2 * INDEX_SLOT_SIZE))
+            self._index.flush()
+            self._seq = 0
+            self.head = 0
+            self.tail = 0
+            self._commit()
+        else:
+            self._load_index()
+
+    def _load_index(self) -> None:
+        """Takes the head and tail from the newest intact index slot."""
+        raw:bytes = self._index.read(2 * INDEX_SLOT_SIZE)
+        found:bool = False
+        for slot in range(2):
+            if len(raw) < (slot + 1) * INDEX_SLOT_SIZE:
+                break
+            seq, head, tail, check = struct.unpack_from(_INDEX_SLOT, raw, slot * INDEX_SLOT_SIZE)
+            if check != _index_check(seq, head, tail) or tail < head or tail - head > self.capacity:
+                continue # torn write (or never written)
+            if not found or seq > self._seq:
+                self._seq = seq
+                self.head = head
+                self.tail = tail
+                found = True
+        if not found: # nothing intact, start empty
+            self._commit()
+
+    def _commit(self) -> None:
+        """Writes the head and tail to the index slot not written last."""
+        self._seq = self._seq + 1
+        slot:int = self._seq % 2
+        self._index.seek(slot * INDEX_SLOT_SIZE)
+        self._index.write(struct.pack(_INDEX_SLOT, self._seq, self.head, self.tail, _index_check(self._seq, self.head, self.tail)))
+        self._index.flush()
+
+class SpoolDrainer:
+    """
+    Forwards the messages in a QueueSpool to a queue, oldest first, in batches.
+    While the queue can't be reached, attempts back off exponentially (with some randomness, so a fleet of devices coming back online doesn't all retry at once) from min_backoff_ms up to max_backoff_ms, and go back to normal as soon as one succeeds.
+    Messages are removed from the spool only once sent. If the device resets between the two, a message may be sent twice, but it is never lost.
+    Messages are tracked by their position in the spool (see QueueSpool.head), so one appended while a send is in flight (with run(), which may drop the oldest to make room) is never removed in place of one that was sent.
+    """
+
+    def __init__(self, spool:QueueSpool, service, batch:int = 8, min_backoff_ms:int = 1000, max_backoff_ms:int = 300000):
+        """
+        Parameters:
+        spool (QueueSpool): The spool to forward.
+        service: Where to forward to. An AzureQueue.QueueService for poll(), or an AzureQueueAsync.AsyncQueueService for run().
+        batch (int): Maximum number of messages sent per attempt.
+        min_backoff_ms (int): Wait after the first failed attempt, in milliseconds.
+        max_backoff_ms (int): Longest wait between attempts, in milliseconds.
+        """
+        self.spool:QueueSpool = spool
+        self.service = service
+        self.batch:int = batch
+        self.min_backoff_ms:int = min_backoff_ms
+        self.max_backoff_ms:int = max_backoff_ms
+        self.backoff_ms:int = 0 # current wait between attempts, 0 while attempts are succeeding
+        self._last_attempt_ticks_ms:int = 0
+        self._wait_ms:int = 0 # wait before the next attempt
+
+        # counters
+        self.sent:int = 0
+        self.failures:int = 0 # failed attempts
+        self.last_error:str = None
+
+    @property
+    def due(self) -> bool:
+        """True if there is something to send and the backoff (if any) has passed."""
+        return len(self.spool) > 0 and AzureQueue._ticks_diff(AzureQueue._ticks_ms(), self._last_attempt_ticks_ms) >= self._wait_ms
+
+    def poll(self) -> int:
+        """Sends the next batch if one is due. Call this regularly from your main loop (it returns straight away otherwise). Returns the number of messages sent."""
+        if not self.due:
+            return 0
+        sent:int = 0
+        position:int = self.spool.head # of the next message to send
+        error:Exception = None
+        try:
+            while sent < self.batch and position < self.spool.tail:
+                message = self.spool.read(position - self.spool.head)
+                if isinstance(message, str):
+                    self.service.put(message)
+                else:
+                    self.service.put_bytes(message)
+                sent = sent + 1
+                position = position + 1
+        except Exception as e:
+            error = e
+        self._finish(sent, position, error)
+        return sent
+
+    async def run(self, idle_ms:int = 1000) -> None:
+        """Forwards the spool forever, for use as an asyncio task with an AsyncQueueService. Checks for new messages every idle_ms milliseconds while the spool is empty."""
+        while True:
+            if not self.due:
+                await asyncio.sleep(idle_ms / 1000)
+                continue
+            sent:int = 0
+            position:int = self.spool.head # of the next message to send
+            error:Exception = None
+            try:
+                while sent < self.batch and max(position, self.spool.head) < self.spool.tail:
+                    position = max(position, self.spool.head) # skip any dropped (to make room for new ones) while the last one was being sent
+                    message = self.spool.read(position - self.spool.head)
+                    if isinstance(message, str):
+                        await self.service.put(message)
+                    else:
+                        await self.service.put_bytes(message)
+                    sent = sent + 1
+                    position = position + 1
+            except Exception as e:
+                error = e
+            self._finish(sent, position, error)
+            if error != None:
+                await asyncio.sleep(self._wait_ms / 1000)
+
+    def _finish(self, sent:int, position:int, error:Exception) -> None:
+        """Removes what was sent (every message before position) from the spool with a single index write, and updates the backoff."""
+        self.spool.pop_until(position)
+        self.sent = self.sent + sent
+        self._last_attempt_ticks_ms = AzureQueue._ticks_ms()
+        if error == None:
+            self.backoff_ms = 0
+            self._wait_ms = 0
+            return
+        self.failures = self.failures + 1
+        self.last_error = str(error)
+        self.backoff_ms = self.min_backoff_ms if self.backoff_ms == 0 else min(self.backoff_ms * 2, self.max_backoff_ms)
+        half:int = self.backoff_ms // 2
+        self._wait_ms = half + (random.getrandbits(16) % (half + 1)) # somewhere between half and all of the backoff
@@ -0,0 +1,441 @@
+"""
+A local stand-in for the Azure Queue Storage REST API, for trying out (and testing) AzureQueue.py on a desktop (CPython) without a storage account.
+It serves the requests QueueService and AsyncQueueService make: put (POST), get and peek (GET), update (PUT), delete and clear (DELETE) and queue metadata (HEAD). The SAS token is accepted but not checked.
+Responses can be sent chunked (Transfer-Encoding: chunked) instead of with a Content-Length, and kept-alive connections can be dropped after every few requests without warning (like Azure closing an idle connection) to exercise those paths.
+
+Usage:
+python standin.py                              # serve on http://127.0.0.1:8080/devstoreaccount1/<queue name> until Ctrl+C
+python standin.py --port 10001 --chunked --drop-after 3
+python standin.py --check                      # run QueueService, AsyncQueueService and SpoolDrainer against it, exiting 1 on any failure
+"""
+
+import sys
+import time
+import uuid
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+
+class StandInMessage:
+    def __init__(self, text:str) -> None:
+        self.id:str = str(uuid.uuid4())
+        self.text:str = text # as sent, still XML escaped (or base64)
+        self.pop_receipt:str = ""
+        self.visible_at:float = 0.0 # time.time() it becomes visible again
+        self.dequeue_count:int = 0
+        self.inserted:str = time.strftime("%a, %d %b %Y %H:%M:%S GMT", time.gmtime())
+
+class QueueStandIn:
+    """A local HTTP server acting like Azure Queue Storage. Each queue (the last part of the URL path) is created on first use."""
+
+    def __init__(self, host:str = "127.0.0.1", port:int = 0, chunked:bool = False, chunk_size:int = 50, drop_after:int = 0) -> None:
+        """
+        Parameters:
+        host (str): Address to listen on.
+        port (int): Port to listen on. 0 picks a free one (see url()).
+        chunked (bool): Send response bodies chunked instead of with a Content-Length.
+        chunk_size (int): Size of each chunk, in bytes, when chunked.
+        drop_after (int): Close each connection, without a "Connection: close" header, after this many requests. 0 keeps connections open.
+        """
+        self.chunked:bool = chunked
+        self.chunk_size:int = chunk_size
+        self.drop_after:int = drop_after
+        self.queues:dict = {} # queue name: list[StandInMessage]
+        self.lock:threading.Lock = threading.Lock()
+
+        # metrics
+        self.requests:int = 0
+        self.connections:int = 0
+        self.dropped:int = 0
+
+        self._server:ThreadingHTTPServer = ThreadingHTTPServer((host, port), _StandInHandler)
+        self._server.daemon_threads = True
+        self._server.standin = self
+        self._thread:threading.Thread = None
+
+    def url(self, queue:str = "myqueue") -> str:
+        """The URL of a queue on the stand-in, to pass to QueueService."""
+        host, port = self._server.server_address[0:2]
+        return "http://" + host + ":" + str(port) + "/devstoreaccount1/" + queue
+
+    def start(self) -> None:
+        """Starts serving on a background thread."""
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+
+    def serve_forever(self) -> None:
+        self._server.serve_forever()
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def queue(self, name:str) -> list[StandInMessage]:
+        if name not in self.queues:
+            self.queues[name] = []
+        return self.queues[name]
+
+class _StandInHandler(BaseHTTPRequestHandler):
+    """Handles one connection (every request made over it, while it is kept alive)."""
+
+    protocol_version = "HTTP/1.1"
+
+    def setup(self) -> None:
+        super().setup()
+        self.standin:QueueStandIn = self.server.standin
+        self.served:int = 0 # requests handled over this connection
+        with self.standin.lock:
+            self.standin.connections = self.standin.connections + 1
+
+    def log_message(self, format, *args) -> None:
+        pass
+
+    ######## REQUESTS ########
+
+    def do_POST(self) -> None:
+        name, message_id, query = self._target()
+        body:str = self._read_body()
+        start:int = body.find("<MessageText>")
+        end:int = body.find("</MessageText>")
+        if message_id != None or start == -1 or end == -1:
+            self._respond(400, self._error("InvalidXmlDocument"))
+            return
+        msg:StandInMessage = StandInMessage(body[start + len("<MessageText>"):end])
+        msg.pop_receipt = self._new_pop_receipt()
+        with self.standin.lock:
+            self.standin.queue(name).append(msg)
+        self._respond(201, self._messages_xml([msg], False, False))
+
+    def do_GET(self) -> None:
+        name, message_id, query = self._target()
+        if "comp" in query: # Get Queue Metadata can be a GET too
+            self._respond_metadata(name)
+            return
+        n:int = int(query.get("numofmessages", ["1"])[0])
+        peek:bool = query.get("peekonly", ["false"])[0] == "true"
+        visibility_timeout:int = int(query.get("visibilitytimeout", ["30"])[0])
+        if n < 1 or n > 32:
+            self._respond(400, self._error("OutOfRangeQueryParameterValue"))
+            return
+        now:float = time.time()
+        found:list[StandInMessage] = []
+        with self.standin.lock:
+            for msg in self.standin.queue(name):
+                if len(found) == n:
+                    break
+                if msg.visible_at <= now:
+                    if not peek:
+                        msg.visible_at = now + visibility_timeout
+                        msg.pop_receipt = self._new_pop_receipt()
+                        msg.dequeue_count = msg.dequeue_count + 1
+                    found.append(msg)
+        self._respond(200, self._messages_xml(found, not peek, True))
+
+    def do_HEAD(self) -> None:
+        name, message_id, query = self._target()
+        self._respond_metadata(name)
+
+    def do_PUT(self) -> None:
+        name, message_id, query = self._target()
+        body:str = self._read_body()
+        with self.standin.lock:
+            msg:StandInMessage = self._find(name, message_id, query)
+            if msg != None:
+                msg.pop_receipt = self._new_pop_receipt()
+                msg.visible_at = time.time() + int(query.get("visibilitytimeout", ["0"])[0])
+                start:int = body.find("<MessageText>")
+                end:int = body.find("</MessageText>")
+                if start != -1 and end != -1:
+                    msg.text = body[start + len("<MessageText>"):end]
+        if msg == None:
+            self._respond(404, self._error("MessageNotFound"))
+        else:
+            self._respond(204, b"", {"x-ms-popreceipt": msg.pop_receipt})
+
+    def do_DELETE(self) -> None:
+        name, message_id, query = self._target()
+        self._read_body()
+        with self.standin.lock:
+            if message_id == None: # Clear Messages
+                self.standin.queue(name).clear()
+                msg = True
+            else:
+                msg = self._find(name, message_id, query)
+                if msg != None:
+                    self.standin.queue(name).remove(msg)
+        if msg == None:
+            self._respond(404, self._error("MessageNotFound"))
+        else:
+            self._respond(204)
+
+    ######## HELPERS ########
+
+    def _target(self) -> tuple[str, str, dict]:
+        """Splits the request target into (queue name, message id or None, query parameters), i.e. "/devstoreaccount1/myqueue/messages/<id>?popreceipt=..." """
+        with self.standin.lock:
+            self.standin.requests = self.standin.requests + 1
+        parts = urlsplit(self.path)
+        path:list[str] = [p for p in parts.path.split("/") if p != ""]
+        message_id:str = None
+        if "messages" in path:
+            i:int = path.index("messages")
+            if i + 1 < len(path):
+                message_id = path[i + 1]
+            path = path[:i]
+        return (path[-1] if len(path) > 0 else "", message_id, parse_qs(parts.query))
+
+    def _find(self, name:str, message_id:str, query:dict) -> StandInMessage:
+        """The message with this id and pop receipt, or None. Call with the lock held."""
+        pop_receipt:str = query.get("popreceipt", [""])[0]
+        for msg in self.standin.queue(name):
+            if msg.id == message_id and msg.pop_receipt == pop_receipt:
+                return msg
+        return None
+
+    def _read_body(self) -> str:
+        length:int = int(self.headers.get("Content-Length", "0"))
+        return self.rfile.read(length).decode() if length > 0 else ""
+
+    def _new_pop_receipt(self) -> str:
+        return "AgAAAAMAAAAAAAAA+" + uuid.uuid4().hex[0:8] # includes a "+", which the client must escape
+
+    def _messages_xml(self, messages:list[StandInMessage], receipts:bool, text:bool) -> bytes:
+        if len(messages) == 0:
+            return b"<?xml version=\"1.0\" encoding=\"utf-8\"?><QueueMessagesList />"
+        parts:list[str] = ["<?xml version=\"1.0\" encoding=\"utf-8\"?><QueueMessagesList>"]
+        for msg in messages:
+            parts.append("<QueueMessage><MessageId>" + msg.id + "</MessageId><InsertionTime>" + msg.inserted + "</InsertionTime><ExpirationTime>" + msg.inserted + "</ExpirationTime>")
+            if receipts:
+                parts.append("<PopReceipt>" + msg.pop_receipt + "</PopReceipt><TimeNextVisible>" + msg.inserted + "</TimeNextVisible>")
+            if text:
+                parts.append("<DequeueCount>" + str(msg.dequeue_count) + "</DequeueCount><MessageText>" + msg.text + "</MessageText>")
+            parts.append("</QueueMessage>")
+        parts.append("</QueueMessagesList>")
+        return "".join(parts).encode()
+
+    def _error(self, code:str) -> bytes:
+        return ("<?xml version=\"1.0\" encoding=\"utf-8\"?><Error><Code>" + code + "</Code><Message>Returned by the stand-in.</Message></Error>").encode()
+
+    def _respond_metadata(self, name:str) -> None:
+        with self.standin.lock:
+            count:int = len(self.standin.queue(name))
+        self._respond(200, b"", {"x-ms-approximate-messages-count": str(count), "x-ms-meta-standin": "true"})
+
+    def _respond(self, status_code:int, body:bytes = b"", headers:dict = None) -> None:
+        self.send_response(status_code)
+        self.send_header("x-ms-version", "2018-03-28")
+        if headers != None:
+            for name in headers:
+                self.send_header(name, headers[name])
+        has_body:bool = status_code != 204 and self.command != "HEAD"
+        if has_body:
+            self.send_header("Content-Type", "application/xml")
+        if has_body and self.standin.chunked:
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            for i in range(0, len(body), self.standin.chunk_size):
+                chunk:bytes = body[i:i + self.standin.chunk_size]
+                self.wfile.write(("%x" % len(chunk)).encode() + b"\r\n" + chunk + b"\r\n")
+            self.wfile.write(b"0\r\n\r\n")
+        else:
+            if self.command != "HEAD" or status_code == 204:
+                self.send_header("Content-Length", str(len(body) if has_body else 0))
+            self.end_headers()
+            if has_body:
+                self.wfile.write(body)
+        self.wfile.flush()
+
+        # drop the kept-alive connection without telling the client, like Azure does with idle ones
+        self.served = self.served + 1
+        if self.standin.drop_after > 0 and self.served % self.standin.drop_after == 0:
+            self.close_connection = True
+            with self.standin.lock:
+                self.standin.dropped = self.standin.dropped + 1
+
+######## CHECK ########
+
+def _expect(failures:list[str], what:str, ok:bool) -> None:
+    if not ok:
+        failures.append(what)
+
+def check_sync(standin:QueueStandIn) -> list[str]:
+    """Runs QueueService through every operation against the stand-in, returning what failed (an empty list if nothing did)."""
+    import AzureQueue
+    failures:list[str] = []
+    qs = AzureQueue.QueueService(standin.url("sync"), "sv=standin&sig=none")
+    qs.clear()
+    texts:list[str] = ["Reading #" + str(i) + " <&> " + ("x" * (i * 20)) for i in range(12)]
+    for text in texts:
+        qs.put(text)
+    qs.put_bytes(b"\x00\x01\x02\xff")
+    _expect(failures, "approximate_message_count() after 13 puts", qs.approximate_message_count() == 13)
+    _expect(failures, "peek()", [m.MessageText for m in qs.peek(3)] == texts[0:3])
+
+    msgs = qs.receive_batch(32, 60)
+    _expect(failures, "receive_batch() text", [m.MessageText for m in msgs[0:12]] == texts)
+    _expect(failures, "receive_batch() bytes", len(msgs) == 13 and msgs[12].MessageBytes == b"\x00\x01\x02\xff")
+    _expect(failures, "receive() while all are hidden", qs.receive() == None)
+
+    qs.update_visibility(msgs[0], 0) # visible again straight away
+    again = qs.receive()
+    _expect(failures, "update_visibility()", again != None and again.MessageId == msgs[0].MessageId)
+    qs.delete(again.MessageId, again.PopReceipt)
+
+    # pipelined deletes. Only a dropped connection may fail some: the ones in the same window after the drop, which the stand-in never got to (so they are still in the queue).
+    rest:list = msgs[1:]
+    failed = qs.delete_many(rest, window=4)
+    if standin.drop_after == 0:
+        _expect(failures, "delete_many() reported " + str(len(failed)) + " failures over a kept-alive connection", len(failed) == 0)
+    else:
+        failed_at:list[int] = [rest.index(msg) for msg, reason in failed]
+        for i in failed_at:
+            _expect(failures, "delete_many() reported message " + str(i) + " as failed but not the one after it in its window", i % 4 == 3 or i == len(rest) - 1 or (i + 1) in failed_at)
+        _expect(failures, "delete_many() failures are exactly the messages left in the queue", qs.approximate_message_count() == len(failed))
+        for msg, reason in failed:
+            qs.delete(msg.MessageId, msg.PopReceipt) # raises if it was deleted after all
+    _expect(failures, "queue empty after deleting", qs.approximate_message_count() == 0)
+
+    try:
+        qs.delete(msgs[1].MessageId, msgs[1].PopReceipt)
+        failures.append("delete() of a deleted message raised no exception")
+    except Exception:
+        pass
+    qs.close()
+    return failures
+
+async def check_async(standin:QueueStandIn) -> list[str]:
+    """Like check_sync(), with AsyncQueueService."""
+    import asyncio
+    import AzureQueueAsync
+    failures:list[str] = []
+    qs = AzureQueueAsync.AsyncQueueService(standin.url("async"), "sv=standin&sig=none", concurrency=2)
+    await qs.clear()
+    texts:list[str] = ["Reading #" + str(i) + " <&> " + ("y" * (i * 20)) for i in range(8)]
+    await asyncio.gather(*[qs.put(text) for text in texts])
+    await qs.put_bytes(b"\x10\x20")
+    _expect(failures, "async approximate_message_count()", await qs.approximate_message_count() == 9)
+    msgs = await qs.receive_batch(32, 60)
+    _expect(failures, "async receive_batch() text", sorted([m.MessageText for m in msgs[0:9] if m.MessageText in texts]) == sorted(texts))
+    _expect(failures, "async receive_batch() count", len(msgs) == 9)
+    failed = await qs.delete_many(msgs) # one request per message, each retried once on a fresh connection if a kept-alive one was dropped
+    _expect(failures, "async delete_many() reported " + str(len(failed)) + " failures", len(failed) == 0)
+    _expect(failures, "async queue empty after deleting", await qs.approximate_message_count() == 0)
+    return failures
+
+class _AppendDuringPut:
+    """Forwards put() to an AsyncQueueService, and has another task append to a spool while each of the first few puts is in flight."""
+
+    def __init__(self, service, spool, appends:int) -> None:
+        self.service = service
+        self.spool = spool
+        self.appends:int = appends
+        self.appended:list[str] = []
+
+    async def put(self, text:str) -> None:
+        import asyncio
+        if self.appends > 0:
+            self.appends = self.appends - 1
+            asyncio.create_task(self._append("Appended mid-put #" + str(len(self.appended))))
+        await self.service.put(text)
+
+    async def _append(self, text:str) -> None:
+        self.spool.append(text)
+        self.appended.append(text)
+
+async def check_spool_async(standin:QueueStandIn) -> list[str]:
+    """Drains a full QueueSpool with SpoolDrainer.run() while messages are appended to it mid-put (each dropping the oldest to make room). Every message must be either sent or counted as dropped, never removed unsent."""
+    import os
+    import asyncio
+    import tempfile
+    import AzureQueueAsync
+    import QueueSpool
+    failures:list[str] = []
+    qs = AzureQueueAsync.AsyncQueueService(standin.url("spool"), "sv=standin&sig=none")
+    await qs.clear()
+    folder:str = tempfile.mkdtemp()
+    spool = QueueSpool.QueueSpool(os.path.join(folder, "spool"), record_size=64, capacity=4)
+    texts:list[str] = ["Spooled #" + str(i) for i in range(4)]
+    for text in texts:
+        spool.append(text)
+    service:_AppendDuringPut = _AppendDuringPut(qs, spool, 6)
+    drainer = QueueSpool.SpoolDrainer(spool, service, batch=4)
+    task = asyncio.create_task(drainer.run(idle_ms=10))
+    for i in range(500):
+        if service.appends == 0 and len(spool) == 0:
+            break
+        await asyncio.sleep(0.01)
+    task.cancel()
+
+    received:list[str] = []
+    while True:
+        msgs = await qs.receive_batch(32, 60)
+        if len(msgs) == 0:
+            break
+        received = received + [m.MessageText for m in msgs]
+    added:list[str] = texts + service.appended
+    _expect(failures, "spool drained", len(spool) == 0)
+    _expect(failures, "each message sent once", len(received) == len(set(received)))
+    _expect(failures, "only appended messages sent", set(received) <= set(added))
+    _expect(failures, str(len(added) - len(received)) + " of " + str(len(added)) + " appended never sent, but only " + str(spool.dropped) + " dropped", len(added) - len(received) <= spool.dropped)
+    _expect(failures, "the newest message (never dropped) sent", added[-1] in received)
+    spool.close()
+    return failures
+
+def check() -> int:
+    """Runs both clients against the stand-in with Content-Length and chunked responses, with connections kept alive and dropped. Returns 0 if everything passed."""
+    import asyncio
+    ToReturn:int = 0
+    for chunked in (False, True):
+        for drop_after in (0, 3):
+            standin:QueueStandIn = QueueStandIn(chunked=chunked, drop_after=drop_after)
+            standin.start()
+            try:
+                failures:list[str] = check_sync(standin) + asyncio.run(check_async(standin))
+            except Exception as e:
+                failures = ["raised " + repr(e)]
+            finally:
+                standin.stop()
+            mode:str = ("chunked" if chunked else "content-length") + ", " + ("dropped every " + str(drop_after) + " requests" if drop_after > 0 else "kept alive")
+            print(("FAIL" if len(failures) > 0 else "ok").ljust(6) + mode.ljust(44) + str(standin.requests) + " requests over " + str(standin.connections) + " connections")
+            for failure in failures:
+                print("      " + failure)
+                ToReturn = 1
+
+    # spool drained while messages are appended to it
+    standin:QueueStandIn = QueueStandIn()
+    standin.start()
+    try:
+        failures:list[str] = asyncio.run(check_spool_async(standin))
+    except Exception as e:
+        failures = ["raised " + repr(e)]
+    finally:
+        standin.stop()
+    print(("FAIL" if len(failures) > 0 else "ok").ljust(6) + "spool appended to while draining")
+    for failure in failures:
+        print("      " + failure)
+        ToReturn = 1
+    return ToReturn
+
+def main(argv:list[str]) -> int:
+    import argparse
+    ap = argparse.ArgumentParser(description="Local stand-in for the Azure Queue Storage REST API.")
+    ap.add_argument("--host", default="127.0.0.1", help="address to listen on")
+    ap.add_argument("--port", type=int, default=8080, help="port to listen on")
+    ap.add_argument("--chunked", action="store_true", help="send response bodies chunked")
+    ap.add_argument("--drop-after", type=int, default=0, help="drop each kept-alive connection after this many requests")
+    ap.add_argument("--check", action="store_true", help="run QueueService and AsyncQueueService against the stand-in and exit")
+    args = ap.parse_args(argv)
+    if args.check:
+        return check()
+
+    standin:QueueStandIn = QueueStandIn(args.host, args.port, args.chunked, drop_after=args.drop_after)
+    print("Serving on " + standin.url("<queue name>") + " (Ctrl+C to stop)")
+    try:
+        standin.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    standin.stop()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
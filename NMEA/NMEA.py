@@ -13,98 +13,281 @@ THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR I
 
 import time
 import json
+import struct
+from array import array
 
-class NMEAParser:
+# size of the sentence assembly buffer. The NMEA 0183 standard caps a sentence at 82 characters, so this leaves headroom for non-compliant receivers.
+SENTENCE_BUFFER_SIZE:int = 128
+
+# maximum number of comma-delimited fields we keep track of in a single sentence
+MAX_FIELDS:int = 32
+
+# talker IDs a sentence type is registered under when registered without one (i.e. "GGA" instead of "GPGGA")
+TALKERS:tuple = (b"GP", b"GN", b"GL", b"GA", b"GB", b"BD", b"GQ")
+
+# maximum number of satellites kept in the satellites-in-view table (across all constellations)
+MAX_SATELLITES:int = 48
+
+class Fix:
+    """
+    A position fix, stored entirely as integers so updating it does not allocate and two fixes can be compared exactly (i.e. for geofencing).
+    Coordinates are in 1e-7 degrees (i.e. 27.1605857 = 271605857). Use the accessor methods to get them as floats when you need to.
+    """
+
+    __slots__ = ("latitude_e7", "longitude_e7", "altitude_cm", "hdop_c", "satellites", "quality", "ticks_ms")
 
     def __init__(self) -> None:
+        self.latitude_e7:int = 0 # latitude, in 1e-7 degrees (negative = south)
+        self.longitude_e7:int = 0 # longitude, in 1e-7 degrees (negative = west)
+        self.altitude_cm:int = 0 # altitude above sea level, in centimeters
+        self.hdop_c:int = 0 # Horizontal Dilution of Precision, in hundredths
+        self.satellites:int = 0 # number of satellites used in the fix
+        self.quality:int = 0 # 0 = invalid, 1 = GPS fix, 2 = DGPS fix, 4 = RTK fixed, 5 = RTK float, 6 = estimated
+        self.ticks_ms:int = 0 # time.ticks_ms() of when the position was last updated
+
+    def latitude(self) -> float:
+        return self.latitude_e7 / 10000000
+
+    def longitude(self) -> float:
+        return self.longitude_e7 / 10000000
+
+    def altitude(self) -> float:
+        """Altitude above sea level, in meters."""
+        return self.altitude_cm / 100
+
+    def hdop(self) -> float:
+        return self.hdop_c / 100
+
+    def same_position(self, other) -> bool:
+        return self.latitude_e7 == other.latitude_e7 and self.longitude_e7 == other.longitude_e7
+
+    def copy(self):
+        """Returns a snapshot of this fix (the parser updates its fix in place)."""
+        ToReturn:Fix = Fix()
+        ToReturn.latitude_e7 = self.latitude_e7
+        ToReturn.longitude_e7 = self.longitude_e7
+        ToReturn.altitude_cm = self.altitude_cm
+        ToReturn.hdop_c = self.hdop_c
+        ToReturn.satellites = self.satellites
+        ToReturn.quality = self.quality
+        ToReturn.ticks_ms = self.ticks_ms
+        return ToReturn
+
+    def __repr__(self) -> str:
+        return str({"latitude": self.latitude(), "longitude": self.longitude(), "altitude": self.altitude(), "HDOP": self.hdop(), "satellites": self.satellites, "quality": self.quality, "ticks_ms": self.ticks_ms})
+
+# fix states (see NMEAParser.fix_state), in order of increasing quality
+FIX_NONE:int = 0 # no fix, or the fix is stale or fails the HDOP gate
+FIX_2D:int = 1
+FIX_3D:int = 2
+FIX_DGPS:int = 3 # differential (DGPS/SBAS/RTK) corrected 3D fix
+
+# packed binary state format (see NMEAParser.pack_state_into() and unpack_state())
+STATE_VERSION:int = 1
+_STATE_FORMAT:str = "<BBBBHIiiiHIHHBBBBB" # version, utc hours, utc minutes, satellites, utc seconds (hundredths), position ticks_ms, latitude (1e-7 deg), longitude (1e-7 deg), altitude (cm), HDOP (hundredths), speed ticks_ms, speed (hundredths of a knot), course (hundredths of a degree), fix quality, fix mode, utc day, utc month, utc year (since 2000)
+STATE_SIZE:int = struct.calcsize(_STATE_FORMAT)
+
+def sentence_key(address:bytes) -> int:
+    """Converts a 5-character sentence address (talker + sentence type, i.e. b"GPGGA") into the integer key used by the handler table. Each letter is packed into 5 bits so the key always stays a small int."""
+    key:int = 0
+    for b in address:
+        key = (key << 5) | (b & 31)
+    return key
+
+class NMEAParser:
+
+    def __init__(self, track = None, max_fix_age_ms:int = 3000, max_hdop:float = 0.0) -> None:
+        """
+        Creates a new NMEA parser.
+
+        Parameters:
+        track (track.Track): Optional position history. If provided, every valid GGA fix is recorded to it automatically.
+        max_fix_age_ms (int): A fix (or speed) older than this is considered stale - fix_state becomes FIX_NONE and current_fix() returns None.
+        max_hdop (float): If above 0, a fix with an HDOP above this is treated as no fix.
+        """
+
+        # quality gates (see fix_state)
+        self.max_fix_age_ms:int = max_fix_age_ms
+        self.max_hdop:float = max_hdop
 
         # utc time
         self.utc_hours:int = 0
         self.utc_minutes:int = 0
         self.utc_seconds:float = 0
 
-        # From GPGGA
-        self.position_last_updated_ticks_ms:int = 0
-        self.latitude:float = 0.0
-        self.longitude:float = 0.0
-        self.satellites:int = 0
-        self.altitude:float = 0.0 # altitude above sea level, in meters
-        self.HDOP:float = 0.0 # Horizontal Dilution of Precision. Measures quality (accuracy) of the GPS fix. Lower values are more accurate.
+        # utc date (from RMC or ZDA)
+        self.utc_day:int = 0
+        self.utc_month:int = 0
+        self.utc_year:int = 0 # full year, i.e. 2023
+
+        # From GGA (RMC and GLL update the position too). Updated in place - the latitude, longitude, altitude, HDOP, satellites, fix_quality and position_last_updated_ticks_ms properties read from it.
+        self.fix:Fix = Fix()
+        self.fix_count:int = 0 # number of GGA fixes received, handy for telling when a new one arrives
 
-        # from GPRMC
+        # from GSA
+        self.fix_mode:int = 1 # 1 = no fix, 2 = 2D fix, 3 = 3D fix
+        self.PDOP:float = 0.0 # Position (3D) Dilution of Precision
+        self.VDOP:float = 0.0 # Vertical Dilution of Precision
+
+        # from RMC and VTG
         self.speed_last_updated_ticks_ms:int = 0
         self.speed_knots:float = 0.0
+        self.course:float = 0.0 # course over ground, in degrees relative to true north
+
+        # from GSV
+        self.satellites_in_view:SatelliteTable = SatelliteTable()
+
+        # position history (optional)
+        self.track = track
+
+        # fix state as of the last GGA/GSA, before the age and HDOP gates are applied (see fix_state)
+        self._fix_state:int = FIX_NONE
+
+        # sentence counters, useful for monitoring line noise
+        self.sentences_received:int = 0 # complete sentences that passed checksum validation
+        self.sentences_rejected:int = 0 # complete sentences that failed checksum validation (or were malformed)
+
+        # sentence assembly buffer. Bytes of a partial sentence stay here between calls to feed() so a sentence split across two UART reads is still parsed.
+        self._line:bytearray = bytearray(SENTENCE_BUFFER_SIZE)
+        self._len:int = 0 # number of bytes of the current sentence in the buffer (0 = waiting for a "$")
+        self._xor:int = 0 # running XOR checksum of the current sentence
+        self._summing:bool = False # True while between the "$" and the "*" (the part of the sentence the checksum covers)
+
+        # positions of every field delimiter ("," or the closing "*") in the current sentence
+        self._delims:bytearray = bytearray(MAX_FIELDS)
+        self._fields:int = 0 # number of fields in the current sentence (including the address field)
+
+        # handler registry: sentence key (see sentence_key()) -> handler object
+        self._handlers:dict = {}
+        self.register("GGA", GGAHandler())
+        self.register("RMC", RMCHandler())
+        self.register("GLL", GLLHandler())
+        self.register("VTG", VTGHandler())
+        self.register("GSA", GSAHandler())
+        self.register("GSV", GSVHandler())
+        self.register("ZDA", ZDAHandler())
+
+    @property
+    def latitude(self) -> float:
+        return self.fix.latitude()
+
+    @property
+    def longitude(self) -> float:
+        return self.fix.longitude()
+
+    @property
+    def altitude(self) -> float:
+        """Altitude above sea level, in meters."""
+        return self.fix.altitude()
+
+    @property
+    def HDOP(self) -> float:
+        """Horizontal Dilution of Precision. Measures quality (accuracy) of the GPS fix. Lower values are more accurate."""
+        return self.fix.hdop()
+
+    @property
+    def satellites(self) -> int:
+        return self.fix.satellites
+
+    @property
+    def fix_quality(self) -> int:
+        """0 = invalid, 1 = GPS fix, 2 = DGPS fix, 4 = RTK fixed, 5 = RTK float, 6 = estimated"""
+        return self.fix.quality
+
+    @property
+    def position_last_updated_ticks_ms(self) -> int:
+        return self.fix.ticks_ms
+
+    @property
+    def fix_state(self) -> int:
+        """The current fix state: FIX_NONE, FIX_2D, FIX_3D or FIX_DGPS. FIX_NONE if the receiver reports no fix, or the last fix is older than max_fix_age_ms or has an HDOP above max_hdop."""
+        if self._fix_state == FIX_NONE:
+            return FIX_NONE
+        if time.ticks_diff(time.ticks_ms(), self.fix.ticks_ms) > self.max_fix_age_ms:
+            return FIX_NONE
+        if self.max_hdop > 0 and self.fix.hdop_c > self.max_hdop * 100:
+            return FIX_NONE
+        return self._fix_state
+
+    def current_fix(self, min_state:int = FIX_2D) -> Fix:
+        """Returns the current fix if it is fresh and at least min_state (i.e. FIX_3D), otherwise None. Note the parser updates the returned Fix in place - use copy() to keep it."""
+        if self.fix_state < min_state:
+            return None
+        return self.fix
+
+    def current_speed_knots(self) -> float:
+        """Returns the current speed, in knots, or None if it is older than max_fix_age_ms."""
+        if self.speed_last_updated_ticks_ms == 0 or time.ticks_diff(time.ticks_ms(), self.speed_last_updated_ticks_ms) > self.max_fix_age_ms:
+            return None
+        return self.speed_knots
 
     @property
     def speed_mph(self) -> float:
         return self.speed_knots * 1.15078
 
-    def feed(self, data:str) -> None:
+    @property
+    def speed_kmh(self) -> float:
+        return self.speed_knots * 1.852
+
+    def register(self, sentence:str, handler) -> None:
+        """
+        Registers a handler object for a sentence. The handler must have a handle(parser) method, which is called once for every valid sentence of that type and reads its fields through the parser's field_*() methods.
+
+        Parameters:
+        sentence (str): Either a full address (i.e. "GPGGA"), which registers the handler for that talker only, or just the sentence type (i.e. "GGA"), which registers it for every talker in TALKERS.
+        handler: The handler object. Registering None removes the handler.
+        """
+        if len(sentence) == 5:
+            addresses:list[bytes] = [sentence.encode()]
+        elif len(sentence) == 3:
+            addresses:list[bytes] = [talker + sentence.encode() for talker in TALKERS]
+        else:
+            raise Exception("Sentence '" + sentence + "' is invalid. Provide either a 5-character address (i.e. 'GPGGA') or a 3-character sentence type (i.e. 'GGA').")
+        for address in addresses:
+            key:int = sentence_key(address)
+            if handler == None:
+                if key in self._handlers:
+                    del self._handlers[key]
+            else:
+                self._handlers[key] = handler
+
+    def feed(self, data) -> None:
+        """Feeds raw NMEA data received from the GPS module (bytes, bytearray, memoryview or str). Sentences can be split across calls - any partial sentence is held until the rest of it arrives."""
         if data != None:
 
-            # get GPGGA line
-            GPGGA:str = self._isolate_sentence(data, "GPGGA")
-            if GPGGA != None:
-                if self._validate_checksum(GPGGA):
-                    parts:list[str] = GPGGA.split(",")
-
-                    # UTC time
-                    if len(parts) >= 2:
-                        if (parts[1] != ""):
-                            self.utc_hours = int(parts[1][0:2])
-                            self.utc_minutes = int(parts[1][2:4])
-                            self.utc_seconds = float(parts[1][4:])
-
-                    # Latitude & longitude
-                    if len(parts) >= 6:
-
-                        # lat and long
-                        if parts[2] != "" and parts[3] != "" and parts[4] != "" and parts[5] != "":
-
-                            # latitude
-                            lat_s:str = parts[2][0:2]
-                            lat_d:float = float(parts[2][2:])
-                            self.latitude = float(lat_s + "." + str(lat_d / 60.0).replace("0.", ""))
-                            if parts[3].lower() == "s":
-                                self.latitude = self.latitude * -1
-                            
-                            # longitude
-                            lon_s:str = parts[4][0:3]
-                            lon_d:float = float(parts[4][3:])
-                            self.longitude = float(lon_s + "." + str(lon_d / 60.0).replace("0.", ""))
-                            if parts[5].lower() == "w":
-                                self.longitude = self.longitude * -1
-
-                            # update last received time
-                            self.position_last_updated_ticks_ms = time.ticks_ms()
-
-                        # number of GPS satellites
-                        if parts[7] != "":
-                            self.satellites = int(parts[7])
-
-                        # HDOP (Horizontal Dilution of Precision)
-                        if parts[8] != "":
-                            self.HDOP = float(parts[8])
-
-                        # altitude above sea level, in meters
-                        if parts[9] != "":
-                            self.altitude = float(parts[9])
-
-                            
-                
-            # get GPRMC line
-            GPRMC:str = self._isolate_sentence(data, "GPRMC")
-            if GPRMC != None:
-                if self._validate_checksum(GPRMC):
-                    parts:list[str] = GPRMC.split(",")
-
-                    # speed, knots
-                    if len(parts) >= 8:
-                        if parts[7] != "":
-                            self.speed_knots = float(parts[7])
-
-                            # update last received time
-                            self.speed_last_updated_ticks_ms = time.ticks_ms()
+            # str is still accepted for backwards compatibility, but passing the raw bytes from the UART avoids this conversion
+            if isinstance(data, str):
+                data = data.encode()
+
+            line:bytearray = self._line
+            n:int = self._len
+            xor:int = self._xor
+            summing:bool = self._summing
+            for b in data:
+                if b == 36: # "$", the start of a new sentence. Anything before it (a partial or corrupt sentence) is dropped.
+                    line[0] = b
+                    n = 1
+                    xor = 0
+                    summing = True
+                elif n == 0: # not inside of a sentence, ignore until the next "$"
+                    pass
+                elif b == 13 or b == 10: # "\r" or "\n", the end of the sentence
+                    self._sentence(n, xor)
+                    n = 0
+                elif n == SENTENCE_BUFFER_SIZE: # too long to be a valid sentence, throw it away
+                    n = 0
+                else:
+                    line[n] = b
+                    n = n + 1
+                    if b == 42: # "*", the checksum follows
+                        summing = False
+                    elif summing:
+                        xor = xor ^ b # XOR operation, carried through to each character in the sentence
+
+            # hold on to the partial sentence (if any) until the next call
+            self._len = n
+            self._xor = xor
+            self._summing = summing
 
     def to_json(self) -> str:
         ToReturn = {}
@@ -122,35 +305,542 @@ class NMEAParser:
         ToReturn["speed_mph"] = self.speed_mph
         return json.dumps(ToReturn)
 
-    def _validate_checksum(self, line:str) -> bool:
+    def pack_state_into(self, buf, offset:int = 0) -> int:
+        """Writes the parser's state as a compact, versioned binary record (STATE_SIZE bytes, vs. ~300 for to_json()) into a caller-provided buffer. Returns the number of bytes written. Decode it with unpack_state()."""
+        fix:Fix = self.fix
+        struct.pack_into(_STATE_FORMAT, buf, offset,
+            STATE_VERSION,
+            self.utc_hours,
+            self.utc_minutes,
+            min(fix.satellites, 255),
+            int((self.utc_seconds * 100) + 0.5),
+            fix.ticks_ms & 0xFFFFFFFF,
+            fix.latitude_e7,
+            fix.longitude_e7,
+            fix.altitude_cm,
+            min(fix.hdop_c, 0xFFFF),
+            self.speed_last_updated_ticks_ms & 0xFFFFFFFF,
+            min(int((self.speed_knots * 100) + 0.5), 0xFFFF),
+            int((self.course * 100) + 0.5) % 36000,
+            fix.quality,
+            self.fix_mode,
+            self.utc_day,
+            self.utc_month,
+            max(self.utc_year - 2000, 0))
+        return STATE_SIZE
+
+    def pack_state(self) -> bytes:
+        """The parser's state as a compact binary record. See pack_state_into()."""
+        ToReturn:bytearray = bytearray(STATE_SIZE)
+        self.pack_state_into(ToReturn)
+        return bytes(ToReturn)
+
+    ######## SENTENCE HANDLING ########
+
+    def _sentence(self, n:int, xor:int) -> None:
+        """Validates and dispatches the complete sentence of length n sitting in the assembly buffer."""
+        line:bytearray = self._line
+
+        # validate checksum
+        if not _checksum_matches(line, n, xor):
+            self.sentences_rejected = self.sentences_rejected + 1
+            return
+        self.sentences_received = self.sentences_received + 1
+
+        # record where each field ends
+        delims:bytearray = self._delims
+        fields:int = 0
+        for i in range(1, n - 2):
+            b:int = line[i]
+            if b == 44 or b == 42: # "," or "*"
+                if fields == MAX_FIELDS:
+                    return # more fields than we can track, not a sentence we understand
+                delims[fields] = i
+                fields = fields + 1
+        self._fields = fields
+
+        # the address field (i.e. "GPGGA") must be 5 characters
+        if delims[0] != 6:
+            return
+        key:int = 0
+        for i in range(1, 6):
+            key = (key << 5) | (line[i] & 31)
+
+        # dispatch
+        handler = self._handlers.get(key)
+        if handler != None:
+            handler.handle(self)
+
+    def _update_fix_state(self) -> None:
+        """Derives the fix state from the GGA fix quality and GSA fix mode."""
+        quality:int = self.fix.quality
+        if quality == 0 or quality == 6 or self.fix.ticks_ms == 0: # invalid, estimated (dead reckoning) or no position received yet
+            self._fix_state = FIX_NONE
+        elif self.fix_mode == 2:
+            self._fix_state = FIX_2D
+        elif quality == 1:
+            self._fix_state = FIX_3D
+        else: # 2 = DGPS, 4 = RTK fixed, 5 = RTK float
+            self._fix_state = FIX_DGPS
+
+    ######## FIELD ACCESS (for handlers) ########
+    # fields are numbered the same way str.split(",") would number them, so field 0 is the sentence address (i.e. "GPGGA")
+
+    @property
+    def field_count(self) -> int:
+        """Number of fields in the sentence currently being handled, including the address field."""
+        return self._fields
+
+    @property
+    def talker(self) -> int:
+        """The talker ID of the sentence currently being handled, as a 2-byte integer (i.e. "GP" = 0x4750)."""
+        return (self._line[1] << 8) | self._line[2]
+
+    def field_len(self, field:int) -> int:
+        """Length of a field, in bytes. Fields that are empty or beyond the end of the sentence are 0."""
+        if field >= self._fields:
+            return 0
+        return self._delims[field] - self._field_start(field)
+
+    def field_char(self, field:int) -> int:
+        """The first byte of a field (i.e. ord("A")), or 0 if the field is empty."""
+        if self.field_len(field) == 0:
+            return 0
+        return self._line[self._field_start(field)]
+
+    def field_int(self, field:int) -> int:
+        return _parse_int(self._line, self._field_start(field), self._delims[field])
+
+    def field_float(self, field:int) -> float:
+        return _parse_float(self._line, self._field_start(field), self._delims[field])
+
+    def field_scaled(self, field:int, decimals:int) -> int:
+        """Parses a decimal field as an integer in units of 10^-decimals, i.e. "10.4" with 2 decimals is 1040."""
+        return _parse_scaled(self._line, self._field_start(field), self._delims[field], decimals)
 
-        loc1 = line.find("$")
-        loc2 = line.find("*")
-        if loc1 == -1 or loc2 == -1:
+    def field_digits(self, field:int, offset:int, count:int) -> int:
+        """Parses a fixed-width group of digits inside of a field, i.e. the "mm" of a "hhmmss" time field is field_digits(field, 2, 2)."""
+        start:int = self._field_start(field) + offset
+        return _parse_int(self._line, start, start + count)
+
+    def field_time(self, field:int) -> None:
+        """Reads a UTC time field (hhmmss.ss) into the utc_* properties."""
+        if self.field_len(field) >= 6:
+            self.utc_hours = self.field_digits(field, 0, 2)
+            self.utc_minutes = self.field_digits(field, 2, 2)
+            self.utc_seconds = _parse_float(self._line, self._field_start(field) + 4, self._delims[field])
+
+    def field_position(self, field:int) -> bool:
+        """Reads a latitude, N/S, longitude, E/W group of fields starting at the given field into the fix. Returns False (and leaves the position as is) if any of them are empty."""
+        if self.field_len(field) == 0 or self.field_len(field + 1) == 0 or self.field_len(field + 2) == 0 or self.field_len(field + 3) == 0:
             return False
-        
-        # get checksum value
-        cs_value:int = int(line[loc2+1:], 16) # convert to hex (base 16)
-        
-        # calculate XOR checksum
-        mid:str = line[loc1+1:loc2]
-        checksum:int = 0
-        for char in mid:
-            int_representation:int = ord(char)
-            checksum = checksum ^ int_representation # XOR operation, carried through to each character in the sentence
-
-        return checksum == cs_value
-
-    def _isolate_sentence(self, full:str, sentence_type:str) -> str:
-        
-        # find start
-        loc1 = full.find("$" + sentence_type)
-        if loc1 == -1:
-            return None
-        
-        # find end
-        loc2 = full.find("\n", loc1 + 1)
-        if loc2 == -1:
-            loc2 = 99999
-        
-        return full[loc1:loc2]
\ No newline at end of file
+        self.fix.latitude_e7 = self._coordinate_e7(field, 2)
+        self.fix.longitude_e7 = self._coordinate_e7(field + 2, 3)
+
+        # update last received time
+        self.fix.ticks_ms = time.ticks_ms()
+        return True
+
+    def _field_start(self, field:int) -> int:
+        if field == 0:
+            return 1
+        return self._delims[field - 1] + 1
+
+    def _coordinate_e7(self, field:int, degree_digits:int) -> int:
+        """Converts a coordinate field in (d)ddmm.mmmm format, followed by its N/S/E/W hemisphere field, to signed 1e-7 degrees using only integer math."""
+        start:int = self._field_start(field)
+        end:int = self._delims[field]
+        degrees:int = _parse_int(self._line, start, start + degree_digits)
+        minutes_e6:int = _parse_scaled(self._line, start + degree_digits, end, 6) # minutes, in 1e-6 minutes (at most 59,999,999)
+        ToReturn:int = (degrees * 10000000) + ((minutes_e6 + 3) // 6) # 1e-6 minutes / 60 = (1/6) * 1e-7 degrees, rounded
+        hemisphere:int = self._line[end + 1] | 32 # lowercase
+        if hemisphere == 115 or hemisphere == 119: # "s" or "w"
+            ToReturn = ToReturn * -1
+        return ToReturn
+
+def unpack_state(blob, offset:int = 0) -> dict:
+    """Decodes a record written by NMEAParser.pack_state_into() into a dictionary with the same keys as to_json() (plus course, fix_quality, fix_mode and the UTC date). Works on a desktop, too."""
+    if blob[offset] != STATE_VERSION:
+        raise Exception("Unable to decode NMEA state of version " + str(blob[offset]) + ". Only version " + str(STATE_VERSION) + " is supported.")
+    values = struct.unpack_from(_STATE_FORMAT, blob, offset)
+    ToReturn = {}
+    ToReturn["utc_hours"] = values[1]
+    ToReturn["utc_minutes"] = values[2]
+    ToReturn["utc_seconds"] = values[4] / 100
+    ToReturn["position_last_updated_ticks_ms"] = values[5]
+    ToReturn["latitude"] = values[6] / 10000000
+    ToReturn["longitude"] = values[7] / 10000000
+    ToReturn["satellites"] = values[3]
+    ToReturn["altitude"] = values[8] / 100
+    ToReturn["HDOP"] = values[9] / 100
+    ToReturn["speed_last_updated_ticks_ms"] = values[10]
+    ToReturn["speed_knots"] = values[11] / 100
+    ToReturn["speed_mph"] = ToReturn["speed_knots"] * 1.15078
+    ToReturn["course"] = values[12] / 100
+    ToReturn["fix_quality"] = values[13]
+    ToReturn["fix_mode"] = values[14]
+    ToReturn["utc_day"] = values[15]
+    ToReturn["utc_month"] = values[16]
+    ToReturn["utc_year"] = 0 if values[16] == 0 else 2000 + values[17] # month 0 = no date received yet
+    return ToReturn
+
+class SatelliteTable:
+    """Fixed-capacity table of the satellites in view, as reported by the GSV sentences of every talker (constellation)."""
+
+    def __init__(self, capacity:int = MAX_SATELLITES) -> None:
+        self._talker:array = array("H", bytes(2 * capacity)) # talker ID (see NMEAParser.talker) that reported each satellite
+        self._prn:array = array("H", bytes(2 * capacity)) # satellite ID (PRN)
+        self._elevation:bytearray = bytearray(capacity) # degrees, 0-90
+        self._azimuth:array = array("H", bytes(2 * capacity)) # degrees from true north, 0-359
+        self._snr:bytearray = bytearray(capacity) # dB-Hz, 0 if not tracking
+        self._count:int = 0
+
+    def __len__(self) -> int:
+        return self._count
+
+    def talker(self, i:int) -> int:
+        return self._talker[i]
+
+    def prn(self, i:int) -> int:
+        return self._prn[i]
+
+    def elevation(self, i:int) -> int:
+        return self._elevation[i]
+
+    def azimuth(self, i:int) -> int:
+        return self._azimuth[i]
+
+    def snr(self, i:int) -> int:
+        return self._snr[i]
+
+    def tracked(self) -> int:
+        """Number of satellites in view with a signal (non-zero SNR)."""
+        ToReturn:int = 0
+        for i in range(self._count):
+            if self._snr[i] > 0:
+                ToReturn = ToReturn + 1
+        return ToReturn
+
+    def clear(self, talker:int) -> None:
+        """Removes every satellite reported by a talker, keeping the others in place (in order)."""
+        kept:int = 0
+        for i in range(self._count):
+            if self._talker[i] != talker:
+                if kept != i:
+                    self._talker[kept] = self._talker[i]
+                    self._prn[kept] = self._prn[i]
+                    self._elevation[kept] = self._elevation[i]
+                    self._azimuth[kept] = self._azimuth[i]
+                    self._snr[kept] = self._snr[i]
+                kept = kept + 1
+        self._count = kept
+
+    def add(self, talker:int, prn:int, elevation:int, azimuth:int, snr:int) -> None:
+        """Adds a satellite, or updates it if this talker already reported it."""
+
+        # find the existing entry (if any)
+        i:int = 0
+        while i < self._count and (self._prn[i] != prn or self._talker[i] != talker):
+            i = i + 1
+
+        if i < len(self._snr): # silently drop satellites beyond capacity
+            self._talker[i] = talker
+            self._prn[i] = prn
+            self._elevation[i] = elevation
+            self._azimuth[i] = azimuth
+            self._snr[i] = snr
+            if i == self._count:
+                self._count = i + 1
+
+    def __repr__(self) -> str:
+        return str([{"talker": bytes([self._talker[i] >> 8, self._talker[i] & 0xFF]).decode(), "prn": self._prn[i], "elevation": self._elevation[i], "azimuth": self._azimuth[i], "snr": self._snr[i]} for i in range(self._count)])
+
+######## SENTENCE HANDLERS ########
+# each handler is registered with NMEAParser.register() and its handle() method is called once for every valid sentence of its type
+
+class GGAHandler:
+    """Global Positioning System Fix Data"""
+
+    def handle(self, p:NMEAParser) -> None:
+
+        # UTC time
+        p.field_time(1)
+
+        # fix quality
+        if p.field_len(6) > 0:
+            p.fix.quality = p.field_int(6)
+
+        # Latitude & longitude
+        if p.field_count >= 10:
+            updated:bool = p.field_position(2)
+
+            # number of GPS satellites
+            if p.field_len(7) > 0:
+                p.fix.satellites = p.field_int(7)
+
+            # HDOP (Horizontal Dilution of Precision)
+            if p.field_len(8) > 0:
+                p.fix.hdop_c = p.field_scaled(8, 2)
+
+            # altitude above sea level, in meters
+            if p.field_len(9) > 0:
+                p.fix.altitude_cm = p.field_scaled(9, 2)
+
+            # record to the position history, once per fix
+            if updated and p.fix.quality > 0:
+                p.fix_count = p.fix_count + 1
+                if p.track != None:
+                    p.track.append_fix(p.fix, p.speed_knots)
+
+        p._update_fix_state()
+
+class RMCHandler:
+    """Recommended Minimum Specific GNSS Data"""
+
+    def handle(self, p:NMEAParser) -> None:
+
+        # UTC time
+        p.field_time(1)
+
+        # position, only if the receiver flags the data as valid ("A")
+        if p.field_char(2) == 65:
+            p.field_position(3)
+
+        # speed, knots
+        if p.field_len(7) > 0:
+            p.speed_knots = p.field_float(7)
+
+            # update last received time
+            p.speed_last_updated_ticks_ms = time.ticks_ms()
+
+        # course over ground
+        if p.field_len(8) > 0:
+            p.course = p.field_float(8)
+
+        # date, ddmmyy
+        if p.field_len(9) == 6:
+            p.utc_day = p.field_digits(9, 0, 2)
+            p.utc_month = p.field_digits(9, 2, 2)
+            p.utc_year = 2000 + p.field_digits(9, 4, 2)
+
+class GLLHandler:
+    """Geographic Position - Latitude/Longitude"""
+
+    def handle(self, p:NMEAParser) -> None:
+        if p.field_char(6) == 65: # "A" = data valid
+            p.field_time(5)
+            p.field_position(1)
+
+class VTGHandler:
+    """Course Over Ground and Ground Speed"""
+
+    def handle(self, p:NMEAParser) -> None:
+
+        # course over ground (true)
+        if p.field_len(1) > 0:
+            p.course = p.field_float(1)
+
+        # speed, knots
+        if p.field_len(5) > 0:
+            p.speed_knots = p.field_float(5)
+            p.speed_last_updated_ticks_ms = time.ticks_ms()
+
+class GSAHandler:
+    """GNSS DOP and Active Satellites"""
+
+    def handle(self, p:NMEAParser) -> None:
+        if p.field_count >= 18:
+
+            # fix mode (1 = none, 2 = 2D, 3 = 3D)
+            if p.field_len(2) > 0:
+                p.fix_mode = p.field_int(2)
+                p._update_fix_state()
+
+            # DOP triplet
+            if p.field_len(15) > 0:
+                p.PDOP = p.field_float(15)
+            if p.field_len(16) > 0:
+                p.fix.hdop_c = p.field_scaled(16, 2)
+            if p.field_len(17) > 0:
+                p.VDOP = p.field_float(17)
+
+class GSVHandler:
+    """GNSS Satellites in View. A full table is spread across several sentences (4 satellites each)."""
+
+    def handle(self, p:NMEAParser) -> None:
+        if p.field_count >= 4:
+            table:SatelliteTable = p.satellites_in_view
+            talker:int = p.talker
+
+            # the first message of a cycle replaces everything this talker reported last cycle
+            if p.field_int(2) == 1:
+                table.clear(talker)
+
+            # up to 4 satellites per message (PRN, elevation, azimuth, SNR)
+            field:int = 4
+            while field + 3 < p.field_count:
+                if p.field_len(field) > 0:
+                    table.add(talker, p.field_int(field), p.field_int(field + 1), p.field_int(field + 2), p.field_int(field + 3))
+                field = field + 4
+
+class ZDAHandler:
+    """Time and Date"""
+
+    def handle(self, p:NMEAParser) -> None:
+        if p.field_count >= 5 and p.field_len(2) > 0:
+            p.field_time(1)
+            p.utc_day = p.field_int(2)
+            p.utc_month = p.field_int(3)
+            p.utc_year = p.field_int(4)
+
+######## CHECKSUM VALIDATION ########
+
+def _build_hex_table() -> bytes:
+    ToReturn:bytearray = bytearray(b"\xff" * 256) # 0xFF = not a hex digit
+    for i in range(10):
+        ToReturn[48 + i] = i # 0-9
+    for i in range(6):
+        ToReturn[65 + i] = 10 + i # A-F
+        ToReturn[97 + i] = 10 + i # a-f
+    return bytes(ToReturn)
+
+# lookup table: ASCII byte -> value of that hex digit, so checking a checksum is two table lookups instead of int(..., 16) on a substring
+_HEX:bytes = _build_hex_table()
+
+def _checksum_matches(buf, end:int, xor:int) -> bool:
+    """Checks that the sentence ending at buf[end] (exclusive, the CR/LF not included) ends in "*" followed by two hex digits equal to the XOR checksum of its body."""
+    if end < 4 or buf[end - 3] != 42: # "*"
+        return False
+    hi:int = _HEX[buf[end - 2]]
+    lo:int = _HEX[buf[end - 1]]
+    return hi != 0xFF and lo != 0xFF and ((hi << 4) | lo) == xor
+
+class ChecksumResults:
+    """Preallocated results of validate_checksums(). Can be passed back in to be reused for the next chunk."""
+
+    def __init__(self, capacity:int = 32) -> None:
+        self.starts:array = array("I", bytes(4 * capacity)) # offset of the "$" of each sentence
+        self.ends:array = array("I", bytes(4 * capacity)) # offset just past the last checksum digit of each sentence
+        self.valid:bytearray = bytearray(capacity) # 1 if the sentence passed checksum validation, 0 if not
+        self.count:int = 0 # number of sentences found
+        self.rejected:int = 0 # number of sentences that failed validation
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __repr__(self) -> str:
+        return str([(self.starts[i], self.ends[i], self.valid[i] == 1) for i in range(self.count)])
+
+def validate_checksums(data, results:ChecksumResults = None) -> ChecksumResults:
+    """
+    Validates the checksum of every complete sentence in a chunk of NMEA data (bytes, bytearray or memoryview) in a single pass.
+
+    A sentence is complete once it is terminated by CR/LF. A sentence cut off by the start of another one (a "$" before the line ends) is counted as rejected. A trailing sentence that is not yet terminated is not reported.
+
+    Parameters:
+    data: The raw NMEA data.
+    results (ChecksumResults): Optional results object to reuse (it is reset first). If not provided, a new one is created.
+
+    Returns:
+    ChecksumResults: The offsets and pass/fail of each sentence found, plus the number rejected.
+    """
+    if results == None:
+        results = ChecksumResults()
+    results.count = 0
+    results.rejected = 0
+    capacity:int = len(results.valid)
+
+    start:int = -1 # offset of the "$" of the sentence we are inside of (-1 = not in a sentence)
+    xor:int = 0
+    summing:bool = False
+    i:int = 0
+    for b in data:
+        if b == 36: # "$"
+            if start != -1: # the previous sentence never ended
+                results.rejected = results.rejected + 1
+            start = i
+            xor = 0
+            summing = True
+        elif start == -1:
+            pass
+        elif b == 13 or b == 10: # CR or LF, the end of the sentence
+            ok:bool = _checksum_matches(data, i, xor)
+            if not ok:
+                results.rejected = results.rejected + 1
+            if results.count < capacity: # sentences beyond capacity are still validated (and counted if rejected), just not recorded
+                results.starts[results.count] = start
+                results.ends[results.count] = i
+                results.valid[results.count] = 1 if ok else 0
+                results.count = results.count + 1
+            start = -1
+        elif b == 42: # "*"
+            summing = False
+        elif summing:
+            xor = xor ^ b
+        i = i + 1
+    return results
+
+######## NUMERIC PARSING ########
+# these work directly on the bytes in the buffer so no intermediate strings are created
+
+def _parse_int(buf, start:int, end:int) -> int:
+    """Parses an optionally signed base-10 integer from buf[start:end]. Anything after a decimal point is ignored."""
+    negative:bool = False
+    if start < end and buf[start] == 45: # "-"
+        negative = True
+        start = start + 1
+    value:int = 0
+    for i in range(start, end):
+        b:int = buf[i]
+        if b == 46: # "."
+            break
+        value = (value * 10) + (b - 48)
+    if negative:
+        return value * -1
+    return value
+
+def _parse_scaled(buf, start:int, end:int, decimals:int) -> int:
+    """Parses an optionally signed decimal number from buf[start:end] as an integer in units of 10^-decimals. Extra decimal places are truncated, missing ones are zero."""
+    negative:bool = False
+    if start < end and buf[start] == 45: # "-"
+        negative = True
+        start = start + 1
+    value:int = 0
+    remaining:int = -1 # decimal places still wanted, -1 until the decimal point is seen
+    for i in range(start, end):
+        b:int = buf[i]
+        if b == 46: # "."
+            remaining = decimals
+        elif remaining != 0:
+            value = (value * 10) + (b - 48)
+            if remaining > 0:
+                remaining = remaining - 1
+    if remaining == -1:
+        remaining = decimals
+    while remaining > 0:
+        value = value * 10
+        remaining = remaining - 1
+    if negative:
+        return value * -1
+    return value
+
+def _parse_float(buf, start:int, end:int) -> float:
+    """Parses an optionally signed decimal number (i.e. "-26.9") from buf[start:end]. Digits are accumulated as an integer and scaled once at the end."""
+    negative:bool = False
+    if start < end and buf[start] == 45: # "-"
+        negative = True
+        start = start + 1
+    value:int = 0
+    decimals:int = -1 # -1 until the decimal point is seen
+    for i in range(start, end):
+        b:int = buf[i]
+        if b == 46: # "."
+            decimals = 0
+        else:
+            value = (value * 10) + (b - 48)
+            if decimals != -1:
+                decimals = decimals + 1
+    ToReturn:float = value / (10 ** decimals) if decimals > 0 else float(value)
+    if negative:
+        return ToReturn * -1
+    return ToReturn
@@ -0,0 +1,59 @@
+"""
+Replays the captured NMEA data in nmea_data.json through gps_async.GPSReader on a desktop (CPython), using an in-memory stand-in for the UART stream.
+Handy for trying out code that subscribes to fixes without a GPS module (or a microcontroller) at hand.
+
+Usage:
+python async_replay.py              # replay at 100x the capture rate
+python async_replay.py --speedup 1  # replay in real time (1 burst per second)
+"""
+
+import sys
+import os
+import time
+import json
+import asyncio
+
+import desktop # stand-ins for MicroPython's time functions under CPython
+import NMEA
+import gps_async
+
+class MemoryStream:
+    """In-memory stand-in for asyncio.StreamReader(uart): hands out the captured bursts in chunks, pausing between bursts like a real GPS module would."""
+
+    def __init__(self, bursts:list[bytes], interval_s:float = 0.0, chunk_size:int = 64) -> None:
+        self._bursts:list[bytes] = bursts
+        self._interval_s:float = interval_s
+        self._chunk_size:int = chunk_size
+        self._pending:bytes = b""
+
+    async def read(self, n:int) -> bytes:
+        while len(self._pending) == 0:
+            if len(self._bursts) == 0:
+                return b"" # end of stream
+            await asyncio.sleep(self._interval_s)
+            self._pending = self._bursts.pop(0)
+        ToReturn:bytes = self._pending[0:min(n, self._chunk_size)] # a UART hands data over in small pieces, so sentences get split
+        self._pending = self._pending[len(ToReturn):]
+        return ToReturn
+
+async def main(speedup:float) -> None:
+    f = open(os.path.join(os.path.dirname(os.path.abspath(__file__)), "nmea_data.json"), "r")
+    bursts:list[bytes] = [burst.encode() for burst in json.loads(f.read())]
+    f.close()
+
+    gps = gps_async.GPSReader(reader=MemoryStream(bursts, 1.0 / speedup))
+    received:list[int] = [0]
+    gps.subscribe(lambda fix: received.__setitem__(0, received[0] + 1)) # callback subscriber
+
+    task = asyncio.create_task(gps.run())
+    async for fix in gps: # awaiting subscriber
+        print(str(fix))
+    await task
+
+    print(str(received[0]) + " fixes published (" + str(gps.parser.sentences_received) + " sentences received, " + str(gps.parser.sentences_rejected) + " rejected)")
+
+if __name__ == "__main__":
+    speedup:float = 100.0
+    if "--speedup" in sys.argv:
+        speedup = float(sys.argv[sys.argv.index("--speedup") + 1])
+    asyncio.run(main(speedup))
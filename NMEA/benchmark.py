@@ -0,0 +1,128 @@
+"""
+Replays the captured NMEA data in nmea_data.json through NMEAParser.feed and reports how fast it went.
+Meant to be run on a desktop (CPython) before flashing parser changes to a device. The run() function also works on a device under MicroPython, the only place the bytes allocated per sentence can be measured.
+
+Usage:
+python benchmark.py                  # replay as fast as possible
+python benchmark.py --speedup 10     # replay at 10x the capture rate (captures were taken once per second)
+python benchmark.py --repeat 20 --min-rate 5000 --max-alloc 64   # fail (exit code 1) if slower than 5,000 sentences/sec or using over 64 bytes/sentence
+"""
+
+import sys
+import time
+import json
+
+import desktop # stand-ins for MicroPython's time functions under CPython
+import NMEA
+
+def percentile(values:list, pct:float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if len(values) == 0:
+        return 0
+    i:int = int(round((pct / 100.0) * (len(values) - 1)))
+    return values[i]
+
+def load_captures(path:str) -> list[bytes]:
+    """Loads the captured UART bursts as raw bytes, as they would come off of the UART."""
+    f = open(path, "r")
+    captures:list[str] = json.loads(f.read())
+    f.close()
+    return [capture.encode() for capture in captures]
+
+def run(captures:list[bytes], speedup:float = 0.0, repeat:int = 1) -> dict:
+    """
+    Streams the captures through a fresh NMEAParser.
+
+    Parameters:
+    captures (list[bytes]): The UART bursts to feed.
+    speedup (float): Replay rate relative to the capture rate (1 burst per second). 0 replays as fast as possible.
+    repeat (int): Number of times to replay the captures.
+
+    Returns:
+    dict: The timing, throughput and memory results (see "metric" for what the bytes are).
+    """
+    parser:NMEA.NMEAParser = NMEA.NMEAParser()
+    interval_s:float = 0.0 if speedup <= 0 else 1.0 / speedup
+    latencies_us:list[float] = []
+    busy_s:float = 0.0
+    started:float = desktop.now()
+
+    # timing pass
+    for r in range(repeat):
+        for capture in captures:
+            t1:float = desktop.now()
+            parser.feed(capture)
+            t2:float = desktop.now()
+            busy_s = busy_s + (t2 - t1)
+            latencies_us.append((t2 - t1) * 1000000)
+            if interval_s > 0:
+                time.sleep(interval_s)
+    elapsed_s:float = desktop.now() - started
+    sentences:int = parser.sentences_received + parser.sentences_rejected
+
+    # allocation pass (separate, as measuring allocations slows everything down)
+    meter:desktop.AllocationMeter = desktop.AllocationMeter()
+    alloc_parser:NMEA.NMEAParser = NMEA.NMEAParser()
+    allocated:int = 0
+    meter.start()
+    try:
+        for capture in captures:
+            meter.begin()
+            alloc_parser.feed(capture)
+            allocated = allocated + meter.end()
+    finally:
+        meter.stop()
+    alloc_sentences:int = alloc_parser.sentences_received + alloc_parser.sentences_rejected
+
+    latencies_us.sort()
+    ToReturn = {}
+    ToReturn["feeds"] = len(latencies_us)
+    ToReturn["sentences"] = sentences
+    ToReturn["rejected"] = parser.sentences_rejected
+    ToReturn["elapsed_s"] = elapsed_s
+    ToReturn["sentences_per_s"] = sentences / busy_s if busy_s > 0 else 0.0 # parser throughput, not counting the replay delay
+    ToReturn["latency_p50_us"] = percentile(latencies_us, 50)
+    ToReturn["latency_p90_us"] = percentile(latencies_us, 90)
+    ToReturn["latency_p99_us"] = percentile(latencies_us, 99)
+    ToReturn["latency_max_us"] = latencies_us[-1] if len(latencies_us) > 0 else 0
+    ToReturn["bytes_per_feed"] = allocated / len(captures) if len(captures) > 0 else 0.0
+    ToReturn["bytes_per_sentence"] = allocated / alloc_sentences if alloc_sentences > 0 else 0.0
+    ToReturn["metric"] = meter.metric
+    return ToReturn
+
+def main(argv:list[str]) -> int:
+    import argparse
+    import os
+    ap = argparse.ArgumentParser(description="Replay captured NMEA data through NMEAParser.feed and report throughput.")
+    ap.add_argument("--data", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "nmea_data.json"), help="path to the captured NMEA data (JSON list of UART bursts)")
+    ap.add_argument("--speedup", type=float, default=0.0, help="replay rate relative to the capture rate of 1 burst/second. 0 (default) = as fast as possible")
+    ap.add_argument("--repeat", type=int, default=10, help="number of times to replay the captures")
+    ap.add_argument("--min-rate", type=float, default=None, help="exit with code 1 if throughput is below this many sentences/second")
+    ap.add_argument("--max-alloc", type=float, default=None, help="exit with code 1 if more than this many bytes per sentence are allocated (MicroPython) or held at the peak of a feed (CPython)")
+    ap.add_argument("--json", action="store_true", help="print the results as JSON")
+    args = ap.parse_args(argv)
+
+    results:dict = run(load_captures(args.data), args.speedup, args.repeat)
+
+    if args.json:
+        print(json.dumps(results))
+    else:
+        print("Feeds:                  " + str(results["feeds"]))
+        print("Sentences:              " + str(results["sentences"]) + " (" + str(results["rejected"]) + " rejected)")
+        print("Throughput:             " + str(round(results["sentences_per_s"])) + " sentences/s")
+        print("Feed latency p50/p90/p99/max: " + str(round(results["latency_p50_us"], 1)) + " / " + str(round(results["latency_p90_us"], 1)) + " / " + str(round(results["latency_p99_us"], 1)) + " / " + str(round(results["latency_max_us"], 1)) + " us")
+        print("Memory per feed:        " + str(round(results["bytes_per_feed"], 1)) + " " + results["metric"])
+        print("Memory per sentence:    " + str(round(results["bytes_per_sentence"], 1)) + " " + results["metric"])
+
+    # regression gates
+    failed:bool = False
+    if args.min_rate != None and results["sentences_per_s"] < args.min_rate:
+        print("FAIL: throughput of " + str(round(results["sentences_per_s"])) + " sentences/s is below the minimum of " + str(args.min_rate))
+        failed = True
+    if args.max_alloc != None and results["bytes_per_sentence"] > args.max_alloc:
+        print("FAIL: " + str(round(results["bytes_per_sentence"], 1)) + " " + results["metric"] + " per sentence is above the maximum of " + str(args.max_alloc))
+        failed = True
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,35 @@
+"""
+Lets the desktop tools in this folder (benchmark.py and async_replay.py) run under regular Python (CPython) as well as on a device.
+Importing it provides stand-ins for the MicroPython-specific time functions NMEA.py uses. Under MicroPython it changes nothing.
+Author Tim Hanewich, github.com/TimHanewich
+Find updates to this code: https://github.com/TimHanewich/MicroPython-Collection/blob/master/NMEA/
+
+MIT License
+Copyright 2024 Tim Hanewich
+Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated documentation files (the “Software”), to deal in the Software without restriction, including without limitation the rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software, and to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in all copies or substantial portions of the Software.
+THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+import sys
+import time
+
+# stand-ins for the MicroPython-specific time functions, so NMEA.py runs under CPython
+if not hasattr(time, "ticks_ms"):
+    _epoch:float = time.monotonic()
+    time.ticks_ms = lambda: int((time.monotonic() - _epoch) * 1000)
+    time.ticks_us = lambda: int((time.monotonic() - _epoch) * 1000000)
+    time.ticks_diff = lambda new, old: new - old
+    time.sleep_ms = lambda ms: time.sleep(ms / 1000)
+
+def now() -> float:
+    """Seconds, from the highest resolution clock available."""
+    if hasattr(time, "perf_counter"):
+        return time.perf_counter()
+    return time.ticks_us() / 1000000
+
+# the AllocationMeter the benchmark uses is shared by the folders of this collection, so it lives in its own folder (copy AllocationMeter.py alongside on a device)
+if sys.implementation.name != "micropython":
+    import os
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "AllocationMeter"))
+from AllocationMeter import AllocationMeter
@@ -0,0 +1,173 @@
+"""
+Geodesic utilities for NMEA fixes: distance, bearing, track distance and geofencing.
+Author: Tim Hanewich - https://github.com/TimHanewich
+Get updates to this code file here: https://github.com/TimHanewich/MicroPython-Collection/blob/master/NMEA/geo.py
+
+License: MIT License
+Copyright 2023 Tim Hanewich
+Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated documentation files (the “Software”), to deal in the Software without restriction, including without limitation the rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software, and to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in all copies or substantial portions of the Software.
+THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+import math
+from array import array
+
+# positions are handled as 1e-7 degree integers (like NMEA.Fix). Differences between two positions are taken as integers first, so the math stays accurate even with the single precision floats most microcontrollers use.
+EARTH_RADIUS_M:float = 6371008.8 # mean earth radius
+_RAD_PER_E7:float = math.pi / 1800000000 # radians per 1e-7 degree
+_METERS_PER_E7:float = EARTH_RADIUS_M * _RAD_PER_E7 # meters per 1e-7 degree of latitude (about 0.0111 m)
+
+######## DISTANCE & BEARING ########
+
+def distance_e7(lat1_e7:int, lon1_e7:int, lat2_e7:int, lon2_e7:int) -> float:
+    """Great-circle (haversine) distance between two positions in 1e-7 degrees, in meters."""
+    dlat:float = (lat2_e7 - lat1_e7) * _RAD_PER_E7
+    dlon:float = (lon2_e7 - lon1_e7) * _RAD_PER_E7
+    s1:float = math.sin(dlat / 2)
+    s2:float = math.sin(dlon / 2)
+    a:float = (s1 * s1) + (math.cos(lat1_e7 * _RAD_PER_E7) * math.cos(lat2_e7 * _RAD_PER_E7) * s2 * s2)
+    return 2 * EARTH_RADIUS_M * math.asin(math.sqrt(min(a, 1.0)))
+
+def bearing_e7(lat1_e7:int, lon1_e7:int, lat2_e7:int, lon2_e7:int) -> float:
+    """Initial bearing (forward azimuth) from the first position to the second, in degrees from true north (0-360)."""
+    lat1:float = lat1_e7 * _RAD_PER_E7
+    lat2:float = lat2_e7 * _RAD_PER_E7
+    dlon:float = (lon2_e7 - lon1_e7) * _RAD_PER_E7
+    y:float = math.sin(dlon) * math.cos(lat2)
+    x:float = (math.cos(lat1) * math.sin(lat2)) - (math.sin(lat1) * math.cos(lat2) * math.cos(dlon))
+    return (math.degrees(math.atan2(y, x)) + 360) % 360
+
+def distance(a, b) -> float:
+    """Distance between two fixes (NMEA.Fix, or anything with latitude_e7 and longitude_e7), in meters."""
+    return distance_e7(a.latitude_e7, a.longitude_e7, b.latitude_e7, b.longitude_e7)
+
+def bearing(a, b) -> float:
+    """Initial bearing from fix a to fix b, in degrees from true north (0-360)."""
+    return bearing_e7(a.latitude_e7, a.longitude_e7, b.latitude_e7, b.longitude_e7)
+
+def track_distance(track) -> float:
+    """Cumulative distance along a track.Track, oldest to newest point, in meters."""
+    ToReturn:float = 0.0
+    for i in range(1, len(track)):
+        ToReturn = ToReturn + distance_e7(track.latitude_e7(i - 1), track.longitude_e7(i - 1), track.latitude_e7(i), track.longitude_e7(i))
+    return ToReturn
+
+######## GEOFENCES ########
+# every fence precomputes what it can when it is created and keeps an integer bounding box, so the common case (a fix nowhere near the fence) is rejected with four integer comparisons
+
+class CircleFence:
+    """A circular geofence."""
+
+    def __init__(self, latitude:float, longitude:float, radius_m:float, name:str = None) -> None:
+        self.name:str = name
+        self.latitude_e7:int = int(round(latitude * 10000000))
+        self.longitude_e7:int = int(round(longitude * 10000000))
+        self.radius_m:float = radius_m
+
+        # precomputed constants
+        self._lon_scale:float = math.cos(self.latitude_e7 * _RAD_PER_E7) # longitude degrees shrink towards the poles
+        self._radius_sq:float = radius_m * radius_m
+        dlat:int = int(radius_m / _METERS_PER_E7) + 1
+        dlon:int = int(radius_m / (_METERS_PER_E7 * max(self._lon_scale, 0.000001))) + 1
+        self.min_lat_e7:int = self.latitude_e7 - dlat
+        self.max_lat_e7:int = self.latitude_e7 + dlat
+        self.min_lon_e7:int = self.longitude_e7 - dlon
+        self.max_lon_e7:int = self.longitude_e7 + dlon
+
+    def contains_e7(self, lat_e7:int, lon_e7:int) -> bool:
+        if lat_e7 < self.min_lat_e7 or lat_e7 > self.max_lat_e7 or lon_e7 < self.min_lon_e7 or lon_e7 > self.max_lon_e7:
+            return False
+
+        # local flat (equirectangular) projection around the center - accurate to well under a meter for fences up to several kilometers across
+        dy:float = (lat_e7 - self.latitude_e7) * _METERS_PER_E7
+        dx:float = (lon_e7 - self.longitude_e7) * _METERS_PER_E7 * self._lon_scale
+        return (dx * dx) + (dy * dy) <= self._radius_sq
+
+    def contains(self, fix) -> bool:
+        return self.contains_e7(fix.latitude_e7, fix.longitude_e7)
+
+class PolygonFence:
+    """A polygon geofence. Vertices are given in order (either direction), the polygon closes itself."""
+
+    def __init__(self, vertices:list, name:str = None) -> None:
+        """
+        Parameters:
+        vertices (list): The polygon's vertices as (latitude, longitude) tuples, in degrees. At least 3.
+        name (str): Optional name, handy for telling fences apart in a FenceSet.
+        """
+        if len(vertices) < 3:
+            raise Exception("A polygon geofence needs at least 3 vertices. " + str(len(vertices)) + " were provided.")
+        self.name:str = name
+        n:int = len(vertices)
+        lats:list[int] = [int(round(v[0] * 10000000)) for v in vertices]
+        lons:list[int] = [int(round(v[1] * 10000000)) for v in vertices]
+        self.min_lat_e7:int = min(lats)
+        self.max_lat_e7:int = max(lats)
+        self.min_lon_e7:int = min(lons)
+        self.max_lon_e7:int = max(lons)
+
+        # vertices relative to the bounding box corner (small integers, so exact as floats), plus each edge's slope, so a test is a multiply and compare per edge
+        self._y:array = array("f", [lat - self.min_lat_e7 for lat in lats])
+        self._x:array = array("f", [lon - self.min_lon_e7 for lon in lons])
+        self._slope:array = array("f", bytes(4 * n)) # dx/dy of the edge from vertex i to vertex i + 1
+        for i in range(n):
+            j:int = (i + 1) % n
+            dy:float = self._y[j] - self._y[i]
+            self._slope[i] = 0.0 if dy == 0 else (self._x[j] - self._x[i]) / dy
+
+    def contains_e7(self, lat_e7:int, lon_e7:int) -> bool:
+        if lat_e7 < self.min_lat_e7 or lat_e7 > self.max_lat_e7 or lon_e7 < self.min_lon_e7 or lon_e7 > self.max_lon_e7:
+            return False
+
+        # ray casting: count the edges a ray heading east from the point crosses
+        y:float = lat_e7 - self.min_lat_e7
+        x:float = lon_e7 - self.min_lon_e7
+        xs:array = self._x
+        ys:array = self._y
+        slope:array = self._slope
+        n:int = len(xs)
+        inside:bool = False
+        for i in range(n):
+            yi:float = ys[i]
+            yj:float = ys[(i + 1) % n]
+            if (yi > y) != (yj > y) and x < xs[i] + ((y - yi) * slope[i]):
+                inside = not inside
+        return inside
+
+    def contains(self, fix) -> bool:
+        return self.contains_e7(fix.latitude_e7, fix.longitude_e7)
+
+class FenceSet:
+    """A collection of geofences (any mix of CircleFence and PolygonFence), checked together."""
+
+    def __init__(self, fences:list = None) -> None:
+        self.fences:list = [] if fences == None else fences
+
+    def add(self, fence) -> None:
+        self.fences.append(fence)
+
+    def __len__(self) -> int:
+        return len(self.fences)
+
+    def first(self, fix):
+        """The first fence that contains the fix, or None."""
+        lat_e7:int = fix.latitude_e7
+        lon_e7:int = fix.longitude_e7
+        for fence in self.fences:
+            if fence.contains_e7(lat_e7, lon_e7):
+                return fence
+        return None
+
+    def containing(self, fix, into:list = None) -> list:
+        """Every fence that contains the fix. Pass a list to reuse as into and it will be cleared and filled instead of allocating a new one."""
+        ToReturn:list = [] if into == None else into
+        if into != None:
+            while len(ToReturn) > 0:
+                ToReturn.pop()
+        lat_e7:int = fix.latitude_e7
+        lon_e7:int = fix.longitude_e7
+        for fence in self.fences:
+            if fence.contains_e7(lat_e7, lon_e7):
+                ToReturn.append(fence)
+        return ToReturn
@@ -0,0 +1,109 @@
+"""
+asyncio GPS reader: streams NMEA data from a UART into an NMEAParser and publishes each new fix to awaiting subscribers.
+Author: Tim Hanewich - https://github.com/TimHanewich
+Get updates to this code file here: https://github.com/TimHanewich/MicroPython-Collection/blob/master/NMEA/gps_async.py
+
+License: MIT License
+Copyright 2023 Tim Hanewich
+Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated documentation files (the “Software”), to deal in the Software without restriction, including without limitation the rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software, and to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in all copies or substantial portions of the Software.
+THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+try:
+    import asyncio
+except ImportError: # older MicroPython firmware
+    import uasyncio as asyncio
+
+import NMEA
+
+class GPSReader:
+    """Reads NMEA data from a stream as it arrives (no polling), feeds it to an NMEAParser and publishes every new fix."""
+
+    def __init__(self, uart = None, reader = None, parser:NMEA.NMEAParser = None, min_state:int = NMEA.FIX_2D, chunk_size:int = 128) -> None:
+        """
+        Creates a new GPS reader. Start it with asyncio.create_task(reader.run()).
+
+        Parameters:
+        uart (machine.UART): The UART the GPS module is connected to. Wrapped in an asyncio.StreamReader.
+        reader: Alternatively, any object with an awaitable read(n) method that returns b"" at the end of the stream (i.e. an asyncio.StreamReader, or an in-memory stand-in for testing on a desktop).
+        parser (NMEA.NMEAParser): The parser to feed. A new one is created if not provided.
+        min_state (int): Only fixes at least this good (see NMEA.FIX_*) are published.
+        chunk_size (int): Maximum number of bytes read from the stream at once.
+        """
+        if reader == None:
+            if uart == None:
+                raise Exception("Either a UART or a stream reader must be provided to read NMEA data from.")
+            reader = asyncio.StreamReader(uart)
+        self._reader = reader
+        self.parser:NMEA.NMEAParser = NMEA.NMEAParser() if parser == None else parser
+        self.min_state:int = min_state
+        self._chunk_size:int = chunk_size
+        self._new_fix:asyncio.Event = asyncio.Event()
+        self._callbacks:list = []
+        self._running:bool = False
+        self._done:bool = False # True once run() has finished (the stream ended or stop() was called)
+
+    def subscribe(self, callback) -> None:
+        """Registers a function to be called with each new fix (an NMEA.Fix) as soon as it is parsed. Keep it short, it runs inside of the reader's task."""
+        self._callbacks.append(callback)
+
+    def unsubscribe(self, callback) -> None:
+        if callback in self._callbacks:
+            self._callbacks.remove(callback)
+
+    async def next_fix(self) -> NMEA.Fix:
+        """Waits for the next fix to be published and returns it, or returns None if the reader has stopped. The parser updates the returned Fix in place - use copy() to keep it."""
+        if self._done:
+            return None
+        await self._new_fix.wait()
+        if self._done:
+            return None
+        return self.parser.fix
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> NMEA.Fix:
+        """Allows "async for fix in reader:" to receive every fix until the reader stops."""
+        fix:NMEA.Fix = await self.next_fix()
+        if fix == None:
+            raise StopAsyncIteration
+        return fix
+
+    def stop(self) -> None:
+        """Stops the reader once the read it is currently waiting on completes."""
+        self._running = False
+
+    async def run(self) -> None:
+        """Reads and parses until the stream ends or stop() is called."""
+        self._running = True
+        self._done = False
+        self._new_fix.clear()
+        parser:NMEA.NMEAParser = self.parser
+        try:
+            while self._running:
+                data:bytes = await self._reader.read(self._chunk_size)
+                if not data: # end of stream
+                    break
+                fixes:int = parser.fix_count
+                parser.feed(data)
+                if parser.fix_count != fixes: # a new fix was parsed from this chunk
+                    self._publish()
+        finally:
+            self._running = False
+
+            # release anything still waiting on next_fix()
+            self._done = True
+            self._new_fix.set()
+
+    def _publish(self) -> None:
+        fix:NMEA.Fix = self.parser.current_fix(self.min_state)
+        if fix == None:
+            return
+        for callback in self._callbacks:
+            callback(fix)
+
+        # wake up everything awaiting next_fix() and get ready for the next one
+        self._new_fix.set()
+        self._new_fix.clear()
@@ -0,0 +1,252 @@
+"""
+Fixed-capacity position history (track) for NMEA fixes, with track compression and packed binary export.
+Author: Tim Hanewich - https://github.com/TimHanewich
+Get updates to this code file here: https://github.com/TimHanewich/MicroPython-Collection/blob/master/NMEA/track.py
+
+License: MIT License
+Copyright 2023 Tim Hanewich
+Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated documentation files (the “Software”), to deal in the Software without restriction, including without limitation the rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software, and to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in all copies or substantial portions of the Software.
+THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+import math
+import struct
+from array import array
+
+# packed binary format
+PACK_VERSION:int = 1
+_HEADER:str = "<BBH" # version, reserved, point count
+_RECORD:str = "<IiiiHH" # ticks_ms, latitude (1e-7 deg), longitude (1e-7 deg), altitude (cm), HDOP (hundredths), speed (hundredths of a knot)
+HEADER_SIZE:int = struct.calcsize(_HEADER)
+RECORD_SIZE:int = struct.calcsize(_RECORD)
+
+# meters per 1e-7 degree of latitude (and of longitude at the equator)
+_METERS_PER_E7:float = 0.011131949
+
+class Track:
+    """Fixed-capacity ring buffer of timestamped fixes. Once full, the oldest point is overwritten. Points are numbered oldest (0) to newest (len - 1)."""
+
+    def __init__(self, capacity:int = 256, deadband_m:float = 0.0) -> None:
+        """
+        Creates a new track.
+
+        Parameters:
+        capacity (int): Maximum number of points held. Each point takes 20 bytes.
+        deadband_m (float): A new point is only recorded if it is at least this many meters from the newest point already recorded. 0 records every point.
+        """
+        self.deadband_m:float = deadband_m
+        self._ticks:array = array("I", bytes(4 * capacity))
+        self._lat:array = array("i", bytes(4 * capacity))
+        self._lon:array = array("i", bytes(4 * capacity))
+        self._alt:array = array("i", bytes(4 * capacity))
+        self._hdop:array = array("H", bytes(2 * capacity))
+        self._speed:array = array("H", bytes(2 * capacity))
+        self._capacity:int = capacity
+        self._start:int = 0 # physical index of the oldest point
+        self._count:int = 0
+
+    def __len__(self) -> int:
+        return self._count
+
+    @property
+    def capacity(self) -> int:
+        return self._capacity
+
+    def clear(self) -> None:
+        self._start = 0
+        self._count = 0
+
+    ######## RECORDING ########
+
+    def append(self, ticks_ms:int, latitude_e7:int, longitude_e7:int, altitude_cm:int = 0, hdop_c:int = 0, speed_c:int = 0) -> bool:
+        """Records a point. Returns False if it was skipped because it is within the dead-band of the newest point."""
+        if self._count > 0 and self.deadband_m > 0:
+            newest:int = self._physical(self._count - 1)
+            if _distance_m(self._lat[newest], self._lon[newest], latitude_e7, longitude_e7) < self.deadband_m:
+                return False
+
+        if self._count < self._capacity:
+            i:int = self._physical(self._count)
+            self._count = self._count + 1
+        else: # full, overwrite the oldest
+            i:int = self._start
+            self._start = (self._start + 1) % self._capacity
+
+        self._ticks[i] = ticks_ms & 0xFFFFFFFF
+        self._lat[i] = latitude_e7
+        self._lon[i] = longitude_e7
+        self._alt[i] = altitude_cm
+        self._hdop[i] = min(max(hdop_c, 0), 0xFFFF)
+        self._speed[i] = min(max(speed_c, 0), 0xFFFF)
+        return True
+
+    def append_fix(self, fix, speed_knots:float = 0.0) -> bool:
+        """Records an NMEA.Fix (and the current speed, in knots)."""
+        return self.append(fix.ticks_ms, fix.latitude_e7, fix.longitude_e7, fix.altitude_cm, fix.hdop_c, int(speed_knots * 100))
+
+    ######## READING ########
+
+    def _physical(self, i:int) -> int:
+        return (self._start + i) % self._capacity
+
+    def ticks_ms(self, i:int) -> int:
+        return self._ticks[self._physical(i)]
+
+    def latitude_e7(self, i:int) -> int:
+        return self._lat[self._physical(i)]
+
+    def longitude_e7(self, i:int) -> int:
+        return self._lon[self._physical(i)]
+
+    def altitude_cm(self, i:int) -> int:
+        return self._alt[self._physical(i)]
+
+    def hdop_c(self, i:int) -> int:
+        return self._hdop[self._physical(i)]
+
+    def speed_c(self, i:int) -> int:
+        """Speed at point i, in hundredths of a knot."""
+        return self._speed[self._physical(i)]
+
+    def point(self, i:int) -> tuple:
+        """Point i as a (ticks_ms, latitude, longitude, altitude, HDOP, speed_knots) tuple of floats (ticks_ms excepted). Convenient, but allocates."""
+        p:int = self._physical(i)
+        return (self._ticks[p], self._lat[p] / 10000000, self._lon[p] / 10000000, self._alt[p] / 100, self._hdop[p] / 100, self._speed[p] / 100)
+
+    ######## COMPRESSION ########
+
+    def compress(self, tolerance_m:float) -> int:
+        """
+        Simplifies the track in place with the Douglas-Peucker algorithm: points that are within tolerance_m meters of the line between the points kept around them are removed. The first and last points are always kept.
+        Returns the number of points removed.
+        """
+        n:int = self._count
+        if n < 3:
+            return 0
+        self._linearize()
+
+        # iterative Douglas-Peucker (an explicit stack of segments instead of recursion, which would quickly exhaust the stack on a microcontroller)
+        keep:bytearray = bytearray(n)
+        keep[0] = 1
+        keep[n - 1] = 1
+        stack:array = array("H", bytes(4 * n)) # (first, last) pairs. Each segment on the stack has at least one interior point, so there are never more than n of them.
+        stack[1] = n - 1
+        top:int = 2 # number of values on the stack
+        while top > 0:
+            first:int = stack[top - 2]
+            last:int = stack[top - 1]
+            top = top - 2
+            farthest:int = -1
+            farthest_m:float = tolerance_m
+            for i in range(first + 1, last):
+                d:float = _segment_distance_m(self._lat[i], self._lon[i], self._lat[first], self._lon[first], self._lat[last], self._lon[last])
+                if d > farthest_m:
+                    farthest = i
+                    farthest_m = d
+            if farthest != -1:
+                keep[farthest] = 1
+                if farthest - first > 1:
+                    stack[top] = first
+                    stack[top + 1] = farthest
+                    top = top + 2
+                if last - farthest > 1:
+                    stack[top] = farthest
+                    stack[top + 1] = last
+                    top = top + 2
+
+        # compact the kept points to the front
+        kept:int = 0
+        for i in range(n):
+            if keep[i]:
+                if kept != i:
+                    self._ticks[kept] = self._ticks[i]
+                    self._lat[kept] = self._lat[i]
+                    self._lon[kept] = self._lon[i]
+                    self._alt[kept] = self._alt[i]
+                    self._hdop[kept] = self._hdop[i]
+                    self._speed[kept] = self._speed[i]
+                kept = kept + 1
+        self._count = kept
+        return n - kept
+
+    def _linearize(self) -> None:
+        """Rotates the ring in place so the oldest point is at physical index 0."""
+        if self._start == 0:
+            return
+        for column in (self._ticks, self._lat, self._lon, self._alt, self._hdop, self._speed):
+            _reverse(column, 0, self._start - 1)
+            _reverse(column, self._start, self._capacity - 1)
+            _reverse(column, 0, self._capacity - 1)
+        self._start = 0
+
+    ######## BINARY EXPORT ########
+
+    def packed_size(self) -> int:
+        """Number of bytes pack() will produce."""
+        return HEADER_SIZE + (RECORD_SIZE * self._count)
+
+    def pack_into(self, buf, offset:int = 0) -> int:
+        """Writes the whole track as a packed binary blob into a caller-provided buffer (i.e. a preallocated bytearray). Returns the number of bytes written."""
+        if len(buf) - offset < self.packed_size():
+            raise Exception("Buffer of " + str(len(buf) - offset) + " bytes is too small to pack a track of " + str(self._count) + " points into. " + str(self.packed_size()) + " bytes are needed.")
+        struct.pack_into(_HEADER, buf, offset, PACK_VERSION, 0, self._count)
+        o:int = offset + HEADER_SIZE
+        for i in range(self._count):
+            p:int = self._physical(i)
+            struct.pack_into(_RECORD, buf, o, self._ticks[p], self._lat[p], self._lon[p], self._alt[p], self._hdop[p], self._speed[p])
+            o = o + RECORD_SIZE
+        return o - offset
+
+    def pack(self) -> bytes:
+        """Returns the whole track as a packed binary blob, ready to send in one go (i.e. over LoRa or as a queue message)."""
+        ToReturn:bytearray = bytearray(self.packed_size())
+        self.pack_into(ToReturn)
+        return bytes(ToReturn)
+
+def unpack(blob, capacity:int = None) -> Track:
+    """Decodes a blob produced by Track.pack() back into a Track (works on a desktop too)."""
+    version, reserved, count = struct.unpack_from(_HEADER, blob, 0)
+    if version != PACK_VERSION:
+        raise Exception("Unable to unpack track of version " + str(version) + ". Only version " + str(PACK_VERSION) + " is supported.")
+    if len(blob) < HEADER_SIZE + (RECORD_SIZE * count):
+        raise Exception("Packed track is truncated! Header says " + str(count) + " points but only " + str(len(blob)) + " bytes were provided.")
+    ToReturn:Track = Track(max(count, 1) if capacity == None else capacity)
+    o:int = HEADER_SIZE
+    for i in range(count):
+        ticks_ms, lat, lon, alt, hdop, speed = struct.unpack_from(_RECORD, blob, o)
+        ToReturn.append(ticks_ms, lat, lon, alt, hdop, speed)
+        o = o + RECORD_SIZE
+    return ToReturn
+
+######## HELPERS ########
+
+def _reverse(column:array, i:int, j:int) -> None:
+    while i < j:
+        tmp = column[i]
+        column[i] = column[j]
+        column[j] = tmp
+        i = i + 1
+        j = j - 1
+
+def _distance_m(lat1_e7:int, lon1_e7:int, lat2_e7:int, lon2_e7:int) -> float:
+    """Approximate (equirectangular) distance between two points, in meters. Plenty accurate at the scale of consecutive track points."""
+    dy:float = (lat2_e7 - lat1_e7) * _METERS_PER_E7
+    dx:float = (lon2_e7 - lon1_e7) * _METERS_PER_E7 * math.cos(math.radians((lat1_e7 + lat2_e7) / 20000000))
+    return math.sqrt((dx * dx) + (dy * dy))
+
+def _segment_distance_m(lat_e7:int, lon_e7:int, lat1_e7:int, lon1_e7:int, lat2_e7:int, lon2_e7:int) -> float:
+    """Approximate distance in meters from a point to the line segment between two other points, on a local flat projection around the segment's first point."""
+    k:float = _METERS_PER_E7 * math.cos(math.radians(lat1_e7 / 10000000))
+    px:float = (lon_e7 - lon1_e7) * k
+    py:float = (lat_e7 - lat1_e7) * _METERS_PER_E7
+    sx:float = (lon2_e7 - lon1_e7) * k
+    sy:float = (lat2_e7 - lat1_e7) * _METERS_PER_E7
+    length_sq:float = (sx * sx) + (sy * sy)
+    if length_sq == 0:
+        return math.sqrt((px * px) + (py * py))
+    t:float = ((px * sx) + (py * sy)) / length_sq
+    t = min(max(t, 0.0), 1.0)
+    dx:float = px - (t * sx)
+    dy:float = py - (t * sy)
+    return math.sqrt((dx * dx) + (dy * dy))
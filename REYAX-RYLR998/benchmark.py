@@ -0,0 +1,129 @@
+"""
+Times parsing +RCV lines into a ReceivedMessage, comparing the original parser (kept below as legacy_parse, for reference) to the current byte-level one.
+Meant to be run on a desktop (CPython) before flashing parser changes to a device. The run() function also works on a device under MicroPython (i.e. print(benchmark.run(2000))), the only place the bytes allocated per parse can be measured.
+
+Usage:
+python benchmark.py                      # 20,000 parses of each line shape
+python benchmark.py --iterations 5000 --json
+"""
+
+import sys
+
+import desktop # stand-ins for machine and MicroPython's time functions under CPython
+import reyax
+
+# line shapes, as they come off of the UART
+LINES:dict = {
+    "short": b"+RCV=50,5,HELLO,-99,40\r\n",
+    "commas": b"+RCV=12,17,12.5,-3.25,88.125,-48,11\r\n",
+    "negative": b"+RCV=65535,8,ABCDEFGH,-120,-12\r\n",
+    "full": b"+RCV=1234,240," + (bytes(range(65, 65 + 48)) * 5) + b",-101,-7\r\n",
+}
+
+def legacy_parse(msg:reyax.ReceivedMessage, full_line:bytes) -> None:
+    """The original ReceivedMessage.parse, for comparison."""
+    try:
+        i_equal:int = full_line.find("=".encode("ascii"))
+        i_comma1:int = full_line.find(",".encode("ascii"))
+        i_comma2:int = full_line.find(",".encode("ascii"), i_comma1 + 1)
+        i_comma4:int = full_line.rfind(",".encode("ascii"))
+        i_comma3:int = full_line.rfind(",".encode("ascii"), 0, i_comma4-1)
+        i_linebreak:int = full_line.find("\r\n".encode("ascii"))
+        msg.ReceivedMessage = reyax.ReceivedMessage()
+        msg.address = int(full_line[i_equal + 1:i_comma1].decode("ascii"))
+        msg.length = int(full_line[i_comma1 + 1:i_comma2].decode("ascii"))
+        msg.data = full_line[i_comma2 + 1:i_comma3]
+        msg.RSSI = int(full_line[i_comma3 + 1:i_comma4].decode("ascii"))
+        msg.SNR = int(full_line[i_comma4 + 1:i_linebreak].decode("ascii"))
+    except Exception as e:
+        raise Exception("Unable to parse line '" + str(full_line) + "' as a ReceivedMessage! Exception message: " + str(e))
+
+######## PARSERS UNDER TEST ########
+# each takes a ReceivedMessage and the raw line (bytes) and a memoryview of it, the way the driver has it
+
+def _legacy(msg:reyax.ReceivedMessage, line:bytes, mv:memoryview) -> None:
+    legacy_parse(msg, line)
+
+def _parse(msg:reyax.ReceivedMessage, line:bytes, mv:memoryview) -> None:
+    msg.parse(line)
+
+def _parse_from(msg:reyax.ReceivedMessage, line:bytes, mv:memoryview) -> None:
+    msg.parse_from(mv, 0, len(line) - 2) # without the \r\n, as RYLR998.receive_into() does
+
+PARSERS:dict = {"legacy parse": _legacy, "parse": _parse, "parse_from": _parse_from}
+
+def run(iterations:int = 20000) -> dict:
+    """
+    Parses every line shape iterations times with each parser.
+
+    Parameters:
+    iterations (int): Number of parses per line shape and parser.
+
+    Returns:
+    dict: For each parser, for each line shape: microseconds and bytes per parse (see "metric" for what the bytes are).
+    """
+    ToReturn = {}
+    meter:desktop.AllocationMeter = desktop.AllocationMeter()
+    ToReturn["metric"] = meter.metric
+    for pname in PARSERS:
+        parser = PARSERS[pname]
+        results = {}
+        for lname in LINES:
+            line:bytes = LINES[lname]
+            mv:memoryview = memoryview(line)
+            msg:reyax.ReceivedMessage = reyax.ReceivedMessage()
+            parser(msg, line, mv) # warm up (parse_from allocates its payload buffer once)
+
+            # timing pass
+            started:float = desktop.now()
+            for i in range(iterations):
+                parser(msg, line, mv)
+            elapsed_s:float = desktop.now() - started
+
+            # allocation pass (separate, as measuring allocations slows everything down)
+            allocs:int = min(iterations, 200)
+            allocated:int = 0
+            meter.start()
+            try:
+                for i in range(allocs):
+                    meter.begin()
+                    parser(msg, line, mv)
+                    allocated = allocated + meter.end()
+            finally:
+                meter.stop()
+
+            result = {}
+            result["us_per_parse"] = (elapsed_s * 1000000) / iterations
+            result["bytes_per_parse"] = allocated / allocs
+            results[lname] = result
+        ToReturn[pname] = results
+    return ToReturn
+
+def main(argv:list[str]) -> int:
+    import argparse
+    import json
+    ap = argparse.ArgumentParser(description="Time parsing +RCV lines with the original and current ReceivedMessage parsers.")
+    ap.add_argument("--iterations", type=int, default=20000, help="number of parses per line shape and parser")
+    ap.add_argument("--json", action="store_true", help="print the results as JSON")
+    args = ap.parse_args(argv)
+
+    results:dict = run(args.iterations)
+
+    if args.json:
+        print(json.dumps(results))
+        return 0
+    print("Per parse: microseconds / " + results["metric"])
+    header:str = "".ljust(14)
+    for lname in LINES:
+        header = header + lname.rjust(18)
+    print(header)
+    for pname in PARSERS:
+        row:str = pname.ljust(14)
+        for lname in LINES:
+            r = results[pname][lname]
+            row = row + (str(round(r["us_per_parse"], 2)) + " / " + str(round(r["bytes_per_parse"]))).rjust(18)
+        print(row)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,323 @@
+"""
+Fragmentation and reassembly for sending payloads larger than one RYLR998 packet (240 bytes), such as whole GPS tracks or configuration files.
+Author Tim Hanewich, github.com/TimHanewich
+Find updates to this code: https://github.com/TimHanewich/MicroPython-Collection/blob/master/REYAX-RYLR998/
+
+MIT License
+Copyright 2024 Tim Hanewich
+Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated documentation files (the “Software”), to deal in the Software without restriction, including without limitation the rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software, and to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in all copies or substantial portions of the Software.
+THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+import time
+import random
+
+# frame types (first byte of every frame)
+_DATA:int = 0xD1 # [type, transfer id, sequence number, frame count] + a piece of the payload
+_NACK:int = 0xD2 # [type, transfer id, frame count] + a bitmap of the frames still missing (bit set = missing)
+_DONE:int = 0xD3 # [type, transfer id], the whole payload arrived
+_DATA_HEADER:int = 4
+_MAX_FRAMES:int = 255
+
+class TransportMessage:
+    """A payload reassembled from its frames."""
+
+    def __init__(self, address:int, transfer_id:int, data:bytes) -> None:
+        self.address:int = address # the address of the transmitter it came from
+        self.transfer_id:int = transfer_id
+        self.data:bytes = data
+
+    def __str__(self) -> str:
+        return str({"address":self.address, "transfer_id":self.transfer_id, "length":len(self.data)})
+
+class _Outgoing:
+    """A payload being sent, kept until the receiver confirms it arrived."""
+
+    def __init__(self, address:int, transfer_id:int, data:bytes, chunk:int) -> None:
+        self.address:int = address
+        self.transfer_id:int = transfer_id
+        self.data:memoryview = memoryview(data)
+        self.count:int = (len(data) + chunk - 1) // chunk if len(data) > 0 else 1
+        self.queued:list[int] = list(range(self.count)) # frames (sequence numbers) still to be sent
+        self.last_ms:int = 0 # when the last frame was sent or the receiver was last heard from
+        self.probes:int = 0 # times the last frame was re-sent because the receiver went quiet
+
+class _Incoming:
+    """A payload being reassembled."""
+
+    def __init__(self, address:int, transfer_id:int, count:int, chunk:int) -> None:
+        self.address:int = address
+        self.transfer_id:int = transfer_id
+        self.count:int = count
+        self.buf:bytearray = bytearray(count * chunk)
+        self.have:bytearray = bytearray((count + 7) // 8) # bitmap of the frames received
+        self.received:int = 0
+        self.length:int = -1 # total length, known once the last frame arrives
+        self.last_ms:int = 0 # when the last frame arrived (or a NACK was sent)
+        self.nacks:int = 0 # NACKs sent since the last new frame arrived
+
+class FragmentTransport:
+    """
+    Sends payloads of up to 60 KB over a link that only carries small packets (an RYLR998), and reassembles them on the other side.
+    - Payloads are split into sequence-numbered frames, each as large as the link allows, so the fewest packets (and the least air time) are used. Frames are not acknowledged one by one.
+    - The receiver reassembles frames in whatever order they arrive into a bounded table of transfers. Once the whole payload is in, it sends one DONE. If frames go missing, it sends a NACK listing exactly which ones (a bitmap), and only those are sent again.
+    - If the receiver goes quiet, the sender re-sends the last frame to prompt a NACK (or DONE), and eventually gives up. Stalled reassemblies are dropped the same way.
+
+    Everything happens in poll(), which should be called regularly. Both sides need a FragmentTransport with the same frame_size.
+    """
+
+    def __init__(self, link, frame_size:int = 240, max_outgoing:int = 2, max_incoming:int = 4, max_size:int = 16384, retry_ms:int = 3000, max_retries:int = 5, on_done = None) -> None:
+        """
+        Parameters:
+        link: The link frames are sent and received over. Anything with send(address, data) and receive() (returning None, or a message with address and data), i.e. a reyax.RYLR998. Frames are handed to send() as a memoryview of a buffer reused for the next frame, so send() must be done with it (or copy it) before returning, as RYLR998.send() and reliable.ReliableLink.send() do.
+        frame_size (int): Largest packet the link can carry, in bytes. Each frame carries frame_size - 4 bytes of the payload.
+        max_outgoing (int): Most payloads being sent at once. send() raises an exception once this many are waiting on their DONE.
+        max_incoming (int): Most payloads being reassembled at once. Once full, the reassembly heard from least recently is dropped to make room.
+        max_size (int): Largest payload accepted for reassembly, in bytes (at most 255 frames' worth). Each incoming payload gets a reassembly buffer as large as its frames add up to (frame count x (frame_size - 4) bytes), so at most max_incoming buffers of up to max_size bytes are held at once.
+        retry_ms (int): How long the other side may stay quiet before the sender re-sends its last frame, or the receiver sends a NACK, in milliseconds. Should be longer than a few frames take on air.
+        max_retries (int): How many times that happens before the transfer is given up on (sender) or dropped (receiver).
+        on_done: Optional, called with (transfer_id, success) once a payload sent has been confirmed (success = True) or given up on (success = False).
+        """
+        self.link = link
+        self.frame_size:int = frame_size
+        self.chunk:int = frame_size - _DATA_HEADER # payload bytes per frame
+        if self.chunk < 1:
+            raise Exception("Frame size of " + str(frame_size) + " bytes is too small! It must be more than the " + str(_DATA_HEADER) + " byte frame header.")
+        self.max_outgoing:int = max_outgoing
+        self.max_incoming:int = max_incoming
+        self.max_size:int = min(max_size, self.chunk * _MAX_FRAMES)
+        self.retry_ms:int = retry_ms
+        self.max_retries:int = max_retries
+        self.on_done = on_done
+
+        self._next_id:int = random.getrandbits(8) # a random start, so a receiver that remembers our last few transfers doesn't mistake new ones for them after a restart
+        self._outgoing:list[_Outgoing] = []
+        self._incoming:list[_Incoming] = []
+        self._recent:list[tuple] = [] # (address, transfer id) of the last few payloads reassembled, so late duplicates get a DONE instead of starting over
+        self._inbox:list[TransportMessage] = []
+        self._frame:bytearray = bytearray(frame_size) # reused to assemble every outgoing frame
+        self._frame_mv:memoryview = memoryview(self._frame)
+
+        # metrics
+        self.sent:int = 0 # payloads confirmed by the receiver
+        self.failed:int = 0 # payloads given up on
+        self.received:int = 0 # payloads reassembled
+        self.frames_sent:int = 0
+        self.frames_resent:int = 0 # frames sent again after a NACK, or to prompt a quiet receiver
+        self.frames_received:int = 0
+        self.duplicates:int = 0 # frames received that were already in hand
+        self.nacks_sent:int = 0
+        self.dropped:int = 0 # reassemblies dropped (stalled, evicted to make room, or too large)
+        self.ignored:int = 0 # packets received that weren't a frame
+
+    ######## SENDING ########
+
+    @property
+    def can_send(self) -> bool:
+        return len(self._outgoing) < self.max_outgoing
+
+    def send(self, address:int, data:bytes) -> int:
+        """Queues a payload to send to a specified address and returns its transfer ID. Frames are sent by poll()."""
+        if len(data) > self.chunk * _MAX_FRAMES:
+            raise Exception("Provided payload of length " + str(len(data)) + " to send is too large! Limit is " + str(self.chunk * _MAX_FRAMES) + " bytes with " + str(self.frame_size) + " byte frames.")
+        if not self.can_send:
+            raise Exception("Unable to send payload, " + str(len(self._outgoing)) + " payloads are already being sent. Wait for one to finish (see can_send).")
+        transfer_id:int = self._next_id
+        self._next_id = (self._next_id + 1) % 256
+        self._outgoing.append(_Outgoing(address, transfer_id, data, self.chunk))
+        return transfer_id
+
+    @property
+    def sending(self) -> int:
+        """Number of payloads still being sent (not yet confirmed or given up on)."""
+        return len(self._outgoing)
+
+    def _send_data(self, out:_Outgoing, seq:int) -> None:
+        frame:bytearray = self._frame
+        start:int = seq * self.chunk
+        end:int = min(start + self.chunk, len(out.data))
+        frame[0] = _DATA
+        frame[1] = out.transfer_id
+        frame[2] = seq
+        frame[3] = out.count
+        frame[_DATA_HEADER:_DATA_HEADER + (end - start)] = out.data[start:end]
+        self.link.send(out.address, self._frame_mv[0:_DATA_HEADER + (end - start)]) # no copy, the link copies it into its command
+        self.frames_sent = self.frames_sent + 1
+
+    def _finish(self, out:_Outgoing, success:bool) -> None:
+        self._outgoing.remove(out)
+        if success:
+            self.sent = self.sent + 1
+        else:
+            self.failed = self.failed + 1
+        if self.on_done != None:
+            self.on_done(out.transfer_id, success)
+
+    def _find_outgoing(self, address:int, transfer_id:int) -> _Outgoing:
+        for out in self._outgoing:
+            if out.transfer_id == transfer_id and (out.address == address or out.address == 0):
+                return out
+        return None
+
+    ######## RECEIVING ########
+
+    def receive(self) -> TransportMessage:
+        """If there is a reassembled payload awaiting retrieval, returns it."""
+        if len(self._inbox) == 0:
+            return None
+        return self._inbox.pop(0)
+
+    def _on_data(self, address:int, data:bytes) -> None:
+        if len(data) < _DATA_HEADER:
+            self.ignored = self.ignored + 1
+            return
+        transfer_id:int = data[1]
+        seq:int = data[2]
+        count:int = data[3]
+        if count == 0 or seq >= count:
+            self.ignored = self.ignored + 1
+            return
+        self.frames_received = self.frames_received + 1
+
+        # already reassembled? The DONE must have been lost, send it again
+        if (address, transfer_id) in self._recent:
+            self.duplicates = self.duplicates + 1
+            self.link.send(address, bytes([_DONE, transfer_id]))
+            return
+
+        inc:_Incoming = None
+        for candidate in self._incoming:
+            if candidate.address == address and candidate.transfer_id == transfer_id:
+                inc = candidate
+                break
+        if inc != None and inc.count != count: # a new payload reusing the ID of one that never finished
+            self._incoming.remove(inc)
+            inc = None
+        if inc == None:
+            if count * self.chunk > self.max_size:
+                self.dropped = self.dropped + 1
+                return
+            if len(self._incoming) >= self.max_incoming: # make room by dropping the one heard from least recently
+                oldest:_Incoming = self._incoming[0]
+                for candidate in self._incoming:
+                    if time.ticks_diff(oldest.last_ms, candidate.last_ms) > 0:
+                        oldest = candidate
+                self._incoming.remove(oldest)
+                self.dropped = self.dropped + 1
+            inc = _Incoming(address, transfer_id, count, self.chunk)
+            self._incoming.append(inc)
+
+        inc.last_ms = time.ticks_ms()
+        length:int = len(data) - _DATA_HEADER
+        if inc.have[seq >> 3] & (1 << (seq & 7)):
+            self.duplicates = self.duplicates + 1
+        elif seq < count - 1 and length != self.chunk: # every frame but the last is full
+            self.ignored = self.ignored + 1
+            return
+        else:
+            inc.buf[seq * self.chunk:(seq * self.chunk) + length] = data[_DATA_HEADER:]
+            inc.have[seq >> 3] = inc.have[seq >> 3] | (1 << (seq & 7))
+            inc.received = inc.received + 1
+            inc.nacks = 0
+            if seq == count - 1:
+                inc.length = (seq * self.chunk) + length
+
+        if inc.received == inc.count:
+            self._incoming.remove(inc)
+            self._inbox.append(TransportMessage(address, transfer_id, bytes(memoryview(inc.buf)[0:inc.length])))
+            self.received = self.received + 1
+            self._recent.append((address, transfer_id))
+            if len(self._recent) > 8:
+                self._recent.pop(0)
+            self.link.send(address, bytes([_DONE, transfer_id]))
+        elif seq == count - 1: # the last frame is in (or was sent again to prompt us) but some before it are not, ask for them straight away
+            self._send_nack(inc)
+
+    def _send_nack(self, inc:_Incoming) -> None:
+        """Asks the sender for every frame still missing."""
+        nack:bytearray = bytearray(3 + len(inc.have))
+        nack[0] = _NACK
+        nack[1] = inc.transfer_id
+        nack[2] = inc.count
+        for i in range(len(inc.have)):
+            nack[3 + i] = ~inc.have[i] & 0xFF
+        self.link.send(inc.address, bytes(nack))
+        self.nacks_sent = self.nacks_sent + 1
+        inc.last_ms = time.ticks_ms()
+
+    def _on_nack(self, address:int, data:bytes) -> None:
+        if len(data) < 3:
+            self.ignored = self.ignored + 1
+            return
+        out:_Outgoing = self._find_outgoing(address, data[1])
+        if out == None or out.count != data[2]:
+            return # already finished or given up on
+        out.last_ms = time.ticks_ms()
+        out.probes = 0
+        for seq in range(out.count):
+            byte:int = 3 + (seq >> 3)
+            if byte < len(data) and data[byte] & (1 << (seq & 7)) and seq not in out.queued:
+                out.queued.append(seq)
+                self.frames_resent = self.frames_resent + 1
+
+    def _on_done(self, address:int, data:bytes) -> None:
+        if len(data) < 2:
+            self.ignored = self.ignored + 1
+            return
+        out:_Outgoing = self._find_outgoing(address, data[1])
+        if out != None:
+            self._finish(out, True)
+
+    ######## POLLING ########
+
+    def poll(self) -> None:
+        """Handles every packet received since the last poll, retries and drops stalled transfers, and sends the next frame, if there is one to send. Call it regularly."""
+
+        # everything received
+        while True:
+            msg = self.link.receive()
+            if msg == None:
+                break
+            data = msg.data
+            if len(data) == 0:
+                self.ignored = self.ignored + 1
+            elif data[0] == _DATA:
+                self._on_data(msg.address, data)
+            elif data[0] == _NACK:
+                self._on_nack(msg.address, data)
+            elif data[0] == _DONE:
+                self._on_done(msg.address, data)
+            else:
+                self.ignored = self.ignored + 1
+
+        now:int = time.ticks_ms()
+
+        # receivers that went quiet
+        for out in list(self._outgoing):
+            if len(out.queued) > 0 or time.ticks_diff(now, out.last_ms) < self.retry_ms:
+                continue
+            if out.probes >= self.max_retries:
+                self._finish(out, False)
+                continue
+            out.probes = out.probes + 1
+            out.queued.append(out.count - 1) # prompts a NACK (or DONE) from the receiver
+            self.frames_resent = self.frames_resent + 1
+
+        # reassemblies that stalled
+        for inc in list(self._incoming):
+            if time.ticks_diff(now, inc.last_ms) < self.retry_ms:
+                continue
+            if inc.nacks >= self.max_retries:
+                self._incoming.remove(inc)
+                self.dropped = self.dropped + 1
+                continue
+            inc.nacks = inc.nacks + 1
+            self._send_nack(inc)
+
+        # the next frame, oldest payload first
+        for out in self._outgoing:
+            if len(out.queued) > 0:
+                self._send_data(out, out.queued.pop(0))
+                out.last_ms = time.ticks_ms()
+                break
@@ -0,0 +1,218 @@
+"""
+Runs reliable.ReliableLink between two simulated modules on a desktop (CPython) and reports goodput (message bytes delivered per second) under configurable packet loss.
+The simulation runs on a virtual clock, so it finishes in moments however much air time it covers. Packets take as long on air as they would on an RYLR998 with its default RF parameters, one at a time (a single channel, like two modules in range of each other), and each is lost at random with the given chance.
+
+Usage:
+python loopback.py                                   # 200 messages of 64 bytes, at 0%, 10%, 20% and 30% loss, stop-and-wait vs. a window of 4
+python loopback.py --loss 0.25 --window 1,2,4,8 --size 200 --messages 500
+python loopback.py --json
+python loopback.py --check                           # checks a few delivery scenarios, exiting 1 on any failure
+"""
+
+import sys
+import time
+import random
+
+class VirtualClock:
+    """Stands in for MicroPython's time.ticks_ms(), so time only moves when the simulation says so."""
+
+    def __init__(self) -> None:
+        self.now_ms:float = 0.0
+
+    def ticks_ms(self) -> int:
+        return int(self.now_ms)
+
+clock:VirtualClock = VirtualClock()
+time.ticks_ms = clock.ticks_ms
+time.ticks_diff = lambda new, old: new - old
+
+import desktop # stands in for the machine module reyax.py imports
+from reyax_sim import airtime_ms
+import reliable
+
+class LoopbackMessage:
+    def __init__(self, address:int, data:bytes) -> None:
+        self.address:int = address
+        self.data:bytes = data
+
+class LoopbackLink:
+    """One end of a simulated link between two modules, with the same send(address, data) and receive() as reyax.RYLR998. Sending blocks (advances the clock) for as long as the packet takes on air, like RYLR998.send() waiting for +OK."""
+
+    def __init__(self, address:int, loss:float, rnd:random.Random, uart_overhead_ms:float = 5.0) -> None:
+        self.address:int = address
+        self.loss:float = loss
+        self.peer:LoopbackLink = None
+        self._rnd:random.Random = rnd
+        self._uart_overhead_ms:float = uart_overhead_ms
+        self._inbox:list[LoopbackMessage] = []
+
+        # metrics
+        self.packets:int = 0
+        self.lost:int = 0
+        self.airtime_ms:float = 0.0
+
+    def send(self, address:int, data:bytes) -> None:
+        if len(data) > 240:
+            raise Exception("Provided data packet of length " + str(len(data)) + " to send is too large! Limit is 240 bytes.")
+        air:float = airtime_ms(len(data))
+        clock.now_ms = clock.now_ms + air + self._uart_overhead_ms
+        self.packets = self.packets + 1
+        self.airtime_ms = self.airtime_ms + air
+        if self._rnd.random() < self.loss:
+            self.lost = self.lost + 1
+        elif self.peer.address == address:
+            self.peer._inbox.append(LoopbackMessage(self.address, bytes(data)))
+
+    def receive(self) -> LoopbackMessage:
+        if len(self._inbox) == 0:
+            return None
+        return self._inbox.pop(0)
+
+def run(messages:int, size:int, loss:float, window:int, seed:int = 1, poll_ms:float = 20.0) -> dict:
+    """
+    Sends messages from one simulated module to another through ReliableLink.
+
+    Parameters:
+    messages (int): Number of messages to send.
+    size (int): Length of each message, in bytes (at least 2, up to 237).
+    loss (float): Chance of each packet (message or ACK) being lost (0-1).
+    window (int): ReliableLink window.
+    seed (int): Random seed, so runs can be repeated exactly.
+    poll_ms (float): How often each side calls poll() while idle, in milliseconds.
+
+    Returns:
+    dict: Delivery, goodput and retransmission results.
+    """
+    rnd:random.Random = random.Random(seed)
+    clock.now_ms = 0.0
+    link_a:LoopbackLink = LoopbackLink(1, loss, rnd)
+    link_b:LoopbackLink = LoopbackLink(2, loss, rnd)
+    link_a.peer = link_b
+    link_b.peer = link_a
+    a:reliable.ReliableLink = reliable.ReliableLink(link_a, window=window)
+    b:reliable.ReliableLink = reliable.ReliableLink(link_b, window=window)
+
+    delivered:list[int] = [0] * messages # times each message was delivered
+    queued:int = 0
+    while True:
+        # the application on A keeps the queue topped up
+        while queued < messages and a.pending(2) < a.max_queue:
+            a.send(2, queued.to_bytes(2, "big") + bytes(size - 2))
+            queued = queued + 1
+        if queued == messages and a.pending(2) == 0:
+            break
+
+        before:int = link_a.packets + link_b.packets
+        a.poll()
+        b.poll()
+        while True:
+            msg:reliable.ReliableMessage = b.receive()
+            if msg == None:
+                break
+            delivered[int.from_bytes(msg.data[0:2], "big")] += 1
+        if link_a.packets + link_b.packets == before: # nothing happened, wait for the next poll
+            clock.now_ms = clock.now_ms + poll_ms
+
+    elapsed_s:float = clock.now_ms / 1000
+    unique:int = 0
+    for count in delivered:
+        if count > 0:
+            unique = unique + 1
+    srtt = a.rtt(2)
+
+    ToReturn = {}
+    ToReturn["loss"] = loss
+    ToReturn["window"] = window
+    ToReturn["messages"] = messages
+    ToReturn["delivered"] = unique
+    ToReturn["delivered_twice"] = messages - delivered.count(0) - delivered.count(1) # should always be 0
+    ToReturn["given_up"] = a.failed
+    ToReturn["elapsed_s"] = elapsed_s
+    ToReturn["goodput_bytes_per_s"] = (unique * size) / elapsed_s if elapsed_s > 0 else 0.0
+    ToReturn["data_frames"] = a.frames_sent
+    ToReturn["retransmissions"] = a.retransmissions
+    ToReturn["duplicates_suppressed"] = b.duplicates
+    ToReturn["packets_lost"] = link_a.lost + link_b.lost
+    ToReturn["srtt_ms"] = srtt[0]
+    ToReturn["rto_ms"] = srtt[2]
+    return ToReturn
+
+def check_late_first() -> list[str]:
+    """
+    With a window of 16, the first message arrives after the 15 sent behind it, so its ACK answers an ID more than 8 behind the highest received.
+    It must still release the message. Returns what failed (an empty list if nothing did).
+    """
+    rnd:random.Random = random.Random(1)
+    clock.now_ms = 0.0
+    link_a:LoopbackLink = LoopbackLink(1, 0.0, rnd)
+    link_b:LoopbackLink = LoopbackLink(2, 0.0, rnd)
+    link_a.peer = link_b
+    link_b.peer = link_a
+    a:reliable.ReliableLink = reliable.ReliableLink(link_a, window=16)
+    b:reliable.ReliableLink = reliable.ReliableLink(link_b, window=16)
+    for i in range(16):
+        a.send(2, bytes([i]))
+    for i in range(16):
+        a.poll() # sends one message each
+    link_b._inbox.append(link_b._inbox.pop(0)) # the first arrives last
+    b.poll()
+    a.poll()
+
+    failures:list[str] = []
+    if b.received != 16:
+        failures.append(str(b.received) + " of 16 messages delivered")
+    if a.pending(2) != 0:
+        failures.append(str(a.pending(2)) + " messages still unacknowledged")
+    if a.retransmissions != 0 or a.failed != 0:
+        failures.append(str(a.retransmissions) + " retransmissions and " + str(a.failed) + " messages given up on")
+    return failures
+
+def check() -> int:
+    """Runs every check, returning 0 if they all passed."""
+    ToReturn:int = 0
+    for name, run_check in (("first message delivered last, window 16", check_late_first),):
+        failures:list[str] = run_check()
+        print(("FAIL" if len(failures) > 0 else "ok").ljust(6) + name)
+        for failure in failures:
+            print("      " + failure)
+            ToReturn = 1
+    return ToReturn
+
+def main(argv:list[str]) -> int:
+    import argparse
+    import json
+    ap = argparse.ArgumentParser(description="Goodput of ReliableLink between two simulated modules under packet loss.")
+    ap.add_argument("--messages", type=int, default=200, help="number of messages to send")
+    ap.add_argument("--size", type=int, default=64, help="length of each message, in bytes (2-237)")
+    ap.add_argument("--loss", default="0,0.1,0.2,0.3", help="comma separated chances of each packet being lost (0-1)")
+    ap.add_argument("--window", default="1,4", help="comma separated window sizes to compare")
+    ap.add_argument("--seed", type=int, default=1, help="random seed")
+    ap.add_argument("--json", action="store_true", help="print the results as JSON")
+    ap.add_argument("--check", action="store_true", help="check a few delivery scenarios and exit")
+    args = ap.parse_args(argv)
+    if args.check:
+        return check()
+    if args.size < 2 or args.size > 237:
+        print("Message size must be between 2 and 237 bytes.")
+        return 1
+
+    results:list[dict] = []
+    for loss in args.loss.split(","):
+        for window in args.window.split(","):
+            results.append(run(args.messages, args.size, float(loss), int(window), args.seed))
+
+    if args.json:
+        print(json.dumps(results))
+        return 0
+    print(str(args.messages) + " messages of " + str(args.size) + " bytes, " + str(round(airtime_ms(args.size + 3), 1)) + " ms on air each")
+    print("loss".rjust(6) + "window".rjust(8) + "delivered".rjust(11) + "goodput B/s".rjust(13) + "elapsed s".rjust(11) + "resent".rjust(8) + "dups".rjust(6) + "SRTT/RTO ms".rjust(14))
+    for r in results:
+        print(str(r["loss"]).rjust(6) + str(r["window"]).rjust(8) + (str(r["delivered"]) + "/" + str(r["messages"])).rjust(11) + str(round(r["goodput_bytes_per_s"], 1)).rjust(13) + str(round(r["elapsed_s"], 1)).rjust(11) + str(r["retransmissions"]).rjust(8) + str(r["duplicates_suppressed"]).rjust(6) + (str(r["srtt_ms"]) + "/" + str(r["rto_ms"])).rjust(14))
+    for r in results:
+        if r["delivered_twice"] > 0:
+            print("FAIL: " + str(r["delivered_twice"]) + " messages were delivered more than once at " + str(r["loss"]) + " loss with a window of " + str(r["window"]))
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
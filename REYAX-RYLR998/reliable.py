@@ -0,0 +1,272 @@
+"""
+Reliable delivery for the RYLR998 LoRa module by REYAX: messages are acknowledged by the receiver and sent again until they are, with several allowed in flight at once.
+Author Tim Hanewich, github.com/TimHanewich
+Find updates to this code: https://github.com/TimHanewich/MicroPython-Collection/blob/master/REYAX-RYLR998/
+
+MIT License
+Copyright 2024 Tim Hanewich
+Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated documentation files (the “Software”), to deal in the Software without restriction, including without limitation the rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software, and to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in all copies or substantial portions of the Software.
+THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+import time
+import random
+
+# frame types (first byte of every frame)
+_DATA:int = 0xA1 # [type, session, message ID] + the message
+_ACK:int = 0xA2 # [type, session, message ID this ACK answers, highest message ID received, bitmap of the 16 IDs before it received (2 bytes, big-endian)]
+_ACK_SIZE:int = 6
+_HEADER:int = 3
+_HISTORY:int = 32 # how many message IDs back the receiver remembers, for spotting duplicates
+MAX_WINDOW:int = 16 # the ACK bitmap covers this many IDs, so every message in flight is covered
+
+class ReliableMessage:
+    """A message received through a ReliableLink."""
+
+    def __init__(self, address:int, message_id:int, data:bytes) -> None:
+        self.address:int = address # the address of the transmitter it came from
+        self.message_id:int = message_id
+        self.data:bytes = data
+
+    def __str__(self) -> str:
+        return str({"address":self.address, "message_id":self.message_id, "data":self.data})
+
+class _Pending:
+    """A message sent (or waiting to be sent) that hasn't been acknowledged yet."""
+
+    def __init__(self, message_id:int, data:bytes) -> None:
+        self.message_id:int = message_id
+        self.data:bytes = data
+        self.sent_ms:int = 0 # when it was last sent
+        self.tries:int = 0 # times it has been sent
+
+class _Peer:
+    """Everything tracked for one address: what we are sending to it, and what we have received from it."""
+
+    def __init__(self, address:int) -> None:
+        self.address:int = address
+
+        # sending
+        self.next_id:int = 0
+        self.queued:list[_Pending] = [] # waiting for room in the window
+        self.inflight:list[_Pending] = [] # sent, waiting on an ACK
+        self.srtt:int = -1 # smoothed round trip time, in ms (-1 until the first sample)
+        self.rttvar:int = 0 # round trip time variation, in ms
+        self.rto:int = 0 # retransmit timeout for a message sent once, in ms. Doubles with every further try.
+
+        # receiving
+        self.session:int = -1 # session of the sender we last heard from at this address
+        self.top:int = 255 # highest message ID received
+        self.seen:int = 0 # bit i set = message ID top - i was received
+
+class ReliableLink:
+    """
+    Delivers messages over a link that may lose packets (an RYLR998), confirming each one arrived.
+    - Every message gets an ID and is sent again until the receiver acknowledges it, or given up on after max_retries.
+    - Up to window messages may be in flight (sent but not yet acknowledged) at once, so the sender doesn't sit idle waiting on every ACK.
+    - The retransmit timeout adapts to the round trip time actually measured (smoothed RTT plus four times its variation, the way TCP does it), and doubles with every try of the same message.
+    - The receiver acknowledges every message (each ACK also covers the 16 before it, so a lost ACK is usually made up for by the next) and suppresses duplicates, so a message sent again because its ACK was lost is only delivered once. Messages are delivered as they arrive, which may be out of order when some had to be sent again.
+
+    Everything happens in poll(), which should be called regularly. Both sides need a ReliableLink.
+    """
+
+    def __init__(self, link, window:int = 4, max_queue:int = 16, initial_rto_ms:int = 3000, min_rto_ms:int = 500, max_rto_ms:int = 60000, max_retries:int = 8, on_done = None) -> None:
+        """
+        Parameters:
+        link: The link messages are sent and received over. Anything with send(address, data) and receive() (returning None, or a message with address and data), i.e. a reyax.RYLR998.
+        window (int): Most messages in flight per address at once (1-16). 1 waits for each ACK before sending the next message (stop-and-wait).
+        max_queue (int): Most messages waiting for room in the window per address. send() raises an exception once this many are waiting.
+        initial_rto_ms (int): Retransmit timeout until the round trip time has been measured, in milliseconds. Should be longer than a message and its ACK take on air.
+        min_rto_ms (int): Shortest retransmit timeout, in milliseconds.
+        max_rto_ms (int): Longest retransmit timeout, in milliseconds.
+        max_retries (int): How many times a message is sent again before it is given up on.
+        on_done: Optional, called with (address, message_id, success) once a message sent has been acknowledged (success = True) or given up on (success = False).
+        """
+        if window < 1 or window > MAX_WINDOW:
+            raise Exception("Window of " + str(window) + " is not allowed! It must be between 1 and " + str(MAX_WINDOW) + ".")
+        self.link = link
+        self.window:int = window
+        self.max_queue:int = max_queue
+        self.initial_rto_ms:int = initial_rto_ms
+        self.min_rto_ms:int = min_rto_ms
+        self.max_rto_ms:int = max_rto_ms
+        self.max_retries:int = max_retries
+        self.on_done = on_done
+
+        self.session:int = random.getrandbits(8) # a receiver that sees a new session starts over, so message IDs restarting after a reset aren't mistaken for duplicates
+        self._peers:dict = {}
+        self._inbox:list[ReliableMessage] = []
+
+        # metrics
+        self.sent:int = 0 # messages acknowledged
+        self.failed:int = 0 # messages given up on
+        self.received:int = 0 # messages delivered
+        self.frames_sent:int = 0
+        self.retransmissions:int = 0
+        self.acks_sent:int = 0
+        self.duplicates:int = 0 # messages received again (and not delivered again)
+        self.ignored:int = 0 # packets received that weren't a frame
+
+    def _peer(self, address:int) -> _Peer:
+        ToReturn:_Peer = self._peers.get(address)
+        if ToReturn == None:
+            ToReturn = _Peer(address)
+            ToReturn.rto = self.initial_rto_ms
+            self._peers[address] = ToReturn
+        return ToReturn
+
+    ######## SENDING ########
+
+    def send(self, address:int, data:bytes) -> int:
+        """Queues a message to send to a specified address and returns its message ID (0-255). Messages are sent by poll()."""
+        if len(data) > 240 - _HEADER:
+            raise Exception("Provided message of length " + str(len(data)) + " to send is too large! Limit is " + str(240 - _HEADER) + " bytes.")
+        if address == 0:
+            raise Exception("Reliable messages can't be broadcast (address 0), as there would be no single receiver to acknowledge them.")
+        peer:_Peer = self._peer(address)
+        if len(peer.queued) >= self.max_queue:
+            raise Exception("Unable to send message, " + str(len(peer.queued)) + " messages are already waiting to be sent to address " + str(address) + ".")
+        pending:_Pending = _Pending(peer.next_id, bytes(data))
+        peer.next_id = (peer.next_id + 1) % 256
+        peer.queued.append(pending)
+        return pending.message_id
+
+    def pending(self, address:int = None) -> int:
+        """Number of messages not yet acknowledged (queued or in flight), to one address or to all of them."""
+        ToReturn:int = 0
+        for peer in self._peers.values():
+            if address == None or peer.address == address:
+                ToReturn = ToReturn + len(peer.queued) + len(peer.inflight)
+        return ToReturn
+
+    def rtt(self, address:int) -> tuple[int, int, int]:
+        """The smoothed round trip time, its variation and the current retransmit timeout to an address, in milliseconds. The first two are -1 and 0 until the first round trip has been measured."""
+        peer:_Peer = self._peer(address)
+        return (peer.srtt, peer.rttvar, peer.rto)
+
+    def _transmit(self, peer:_Peer, pending:_Pending) -> None:
+        self.link.send(peer.address, bytes([_DATA, self.session, pending.message_id]) + pending.data)
+        pending.sent_ms = time.ticks_ms()
+        pending.tries = pending.tries + 1
+        self.frames_sent = self.frames_sent + 1
+
+    def _on_ack(self, address:int, data:bytes) -> None:
+        if len(data) < _ACK_SIZE:
+            self.ignored = self.ignored + 1
+            return
+        if data[1] != self.session: # for a session before a reset
+            return
+        peer:_Peer = self._peers.get(address)
+        if peer == None:
+            return
+        answers:int = data[2]
+        top:int = data[3]
+        bits:int = (data[4] << 8) | data[5]
+        now:int = time.ticks_ms()
+        for pending in list(peer.inflight):
+            back:int = (top - pending.message_id) % 256
+            if pending.message_id == answers or back == 0 or (back <= MAX_WINDOW and bits & (1 << (back - 1))):
+                peer.inflight.remove(pending)
+                if pending.tries == 1 and pending.message_id == answers: # only time ACKs answering a message sent once, as it's unknown which send an ACK for a resent message answers (Karn's algorithm), and an ACK answering a later message would make the round trip look longer than it is
+                    self._sample_rtt(peer, time.ticks_diff(now, pending.sent_ms))
+                self.sent = self.sent + 1
+                if self.on_done != None:
+                    self.on_done(address, pending.message_id, True)
+
+    def _sample_rtt(self, peer:_Peer, rtt:int) -> None:
+        """Updates the smoothed RTT, its variation and the retransmit timeout with a new measurement (RFC 6298)."""
+        if peer.srtt < 0:
+            peer.srtt = rtt
+            peer.rttvar = rtt // 2
+        else:
+            peer.rttvar = ((3 * peer.rttvar) + abs(peer.srtt - rtt)) // 4
+            peer.srtt = ((7 * peer.srtt) + rtt) // 8
+        peer.rto = min(max(peer.srtt + max(4 * peer.rttvar, 10), self.min_rto_ms), self.max_rto_ms)
+
+    ######## RECEIVING ########
+
+    def receive(self) -> ReliableMessage:
+        """If there is a message awaiting retrieval, returns it."""
+        if len(self._inbox) == 0:
+            return None
+        return self._inbox.pop(0)
+
+    def _on_data(self, address:int, data:bytes) -> None:
+        if len(data) < _HEADER:
+            self.ignored = self.ignored + 1
+            return
+        peer:_Peer = self._peer(address)
+        if data[1] != peer.session: # a new sender (or the same one after a reset), start over
+            peer.session = data[1]
+            peer.top = 255
+            peer.seen = 0
+        message_id:int = data[2]
+
+        # have we seen it before?
+        ahead:int = (message_id - peer.top) % 256
+        duplicate:bool = False
+        if ahead > 0 and ahead < 128: # newer than anything so far
+            peer.seen = ((peer.seen << ahead) | 1) & ((1 << _HISTORY) - 1)
+            peer.top = message_id
+        else:
+            back:int = (peer.top - message_id) % 256
+            if back >= _HISTORY or peer.seen & (1 << back): # too old to tell is treated as a duplicate, as the sender won't have it in flight anymore
+                duplicate = True
+            else:
+                peer.seen = peer.seen | (1 << back)
+
+        if duplicate:
+            self.duplicates = self.duplicates + 1
+        else:
+            self._inbox.append(ReliableMessage(address, message_id, bytes(data[_HEADER:])))
+            self.received = self.received + 1
+
+        # acknowledge it either way, a duplicate means our last ACK was lost
+        bits:int = (peer.seen >> 1) & 0xFFFF
+        self.link.send(address, bytes([_ACK, peer.session, message_id, peer.top, bits >> 8, bits & 0xFF]))
+        self.acks_sent = self.acks_sent + 1
+
+    ######## POLLING ########
+
+    def poll(self) -> None:
+        """Handles every packet received since the last poll, then sends the next frame that is due (a retransmission first, otherwise a new message if the window has room). Call it regularly."""
+
+        # everything received
+        while True:
+            msg = self.link.receive()
+            if msg == None:
+                break
+            data = msg.data
+            if len(data) == 0:
+                self.ignored = self.ignored + 1
+            elif data[0] == _DATA:
+                self._on_data(msg.address, data)
+            elif data[0] == _ACK:
+                self._on_ack(msg.address, data)
+            else:
+                self.ignored = self.ignored + 1
+
+        # a message that timed out
+        now:int = time.ticks_ms()
+        for peer in self._peers.values():
+            for pending in peer.inflight:
+                if time.ticks_diff(now, pending.sent_ms) < min(peer.rto << (pending.tries - 1), self.max_rto_ms): # backing off with every try
+                    continue
+                if pending.tries > self.max_retries:
+                    peer.inflight.remove(pending)
+                    self.failed = self.failed + 1
+                    if self.on_done != None:
+                        self.on_done(peer.address, pending.message_id, False)
+                    return
+                self._transmit(peer, pending)
+                self.retransmissions = self.retransmissions + 1
+                return
+
+        # otherwise the next new message
+        for peer in self._peers.values():
+            if len(peer.queued) > 0 and len(peer.inflight) < self.window:
+                pending:_Pending = peer.queued.pop(0)
+                peer.inflight.append(pending)
+                self._transmit(peer, pending)
+                return
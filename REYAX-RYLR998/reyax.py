@@ -13,6 +13,30 @@ THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR I
 import machine
 import time
 
+MAX_PAYLOAD:int = 240 # largest payload the RYLR998 can send in one packet, in bytes
+
+# byte values used while parsing, so nothing has to be encoded on the fly
+_RCV_PREFIX:bytes = b"+RCV="
+_RCV_PREFIX_LEN:int = len(_RCV_PREFIX)
+_COMMA:int = 44 # ,
+_MINUS:int = 45 # -
+_ZERO:int = 48 # 0
+_NINE:int = 57 # 9
+_CR:int = 13 # \r
+_LF:int = 10 # \n
+
+def _move(mv:memoryview, dst:int, src:int, n:int) -> None:
+    """
+    Copies mv[src:src + n] to mv[dst:dst + n], where dst < src (compacting a buffer towards its front).
+    Copying between overlapping parts of one buffer with a single slice assignment isn't guaranteed to be safe on every port, so it is done front to back in blocks no longer than the distance moved, none of which overlap the block they are copied onto.
+    """
+    step:int = src - dst
+    done:int = 0
+    while done < n:
+        k:int = min(step, n - done)
+        mv[dst + done:dst + done + k] = mv[src + done:src + done + k]
+        done = done + k
+
 class ReceivedMessage:
     def __init__(self) -> None:
         self.address:int = None # the address of the transmitter it came from
@@ -21,43 +45,132 @@ class ReceivedMessage:
         self.RSSI:int = None # Received signal strength indicator
         self.SNR:int = None # Signal-to-noise ratio
 
-    def parse(self, full_line:bytes) -> None:
-        """Parses a received message from the raw line of byte data received over UART. For example, b'+RCV=50,5,HELLO,-99,40'"""
+        # used by parse_from() (and RYLR998.receive_into()), so a reused ReceivedMessage doesn't allocate a new payload every time
+        self._payload:bytearray = None
+        self._payload_mv:memoryview = None
 
-        try:
+    def parse_from(self, buf, start:int, end:int) -> None:
+        """
+        Parses a received message from a line of bytes within buf (ideally a memoryview, so the payload is copied without slicing), buf[start:end], not including the line break. For example, b'+RCV=50,5,HELLO,-99,40'
+        The line is read in a single pass: the numbers are accumulated digit by digit and the payload, which is read by its stated length (so it may contain commas), is copied into a buffer this ReceivedMessage reuses. data is then a memoryview of that buffer, so it is overwritten by the next parse_from() (use bytes(msg.data) to keep a copy).
+        """
+        if self._payload == None:
+            self._payload = bytearray(MAX_PAYLOAD)
+            self._payload_mv = memoryview(self._payload)
+        i:int = start + _RCV_PREFIX_LEN
+
+        # address and length, each followed by a comma
+        address:int = 0
+        while True:
+            if i >= end:
+                raise Exception("Unable to parse line '" + str(bytes(buf[start:end])) + "' as a ReceivedMessage! It ends before the payload.")
+            c:int = buf[i]
+            i = i + 1
+            if c == _COMMA:
+                break
+            if c < _ZERO or c > _NINE:
+                raise Exception("Unable to parse line '" + str(bytes(buf[start:end])) + "' as a ReceivedMessage! The address is not a number.")
+            address = (address * 10) + (c - _ZERO)
+        length:int = 0
+        while True:
+            if i >= end:
+                raise Exception("Unable to parse line '" + str(bytes(buf[start:end])) + "' as a ReceivedMessage! It ends before the payload.")
+            c:int = buf[i]
+            i = i + 1
+            if c == _COMMA:
+                break
+            if c < _ZERO or c > _NINE:
+                raise Exception("Unable to parse line '" + str(bytes(buf[start:end])) + "' as a ReceivedMessage! The length is not a number.")
+            length = (length * 10) + (c - _ZERO)
+
+        # payload, which is exactly length bytes and followed by a comma
+        if length > MAX_PAYLOAD or i + length >= end or buf[i + length] != _COMMA:
+            raise Exception("Unable to parse line '" + str(bytes(buf[start:end])) + "' as a ReceivedMessage! The payload does not match its stated length of " + str(length) + " bytes.")
+        self._payload[0:length] = buf[i:i + length]
+        i = i + length + 1
+
+        # RSSI (followed by a comma) and SNR (to the end of the line), either of which can be negative
+        rssi:int = 0
+        negative:bool = i < end and buf[i] == _MINUS
+        if negative:
+            i = i + 1
+        while True:
+            if i >= end:
+                raise Exception("Unable to parse line '" + str(bytes(buf[start:end])) + "' as a ReceivedMessage! It ends before the SNR.")
+            c:int = buf[i]
+            i = i + 1
+            if c == _COMMA:
+                break
+            if c < _ZERO or c > _NINE:
+                raise Exception("Unable to parse line '" + str(bytes(buf[start:end])) + "' as a ReceivedMessage! The RSSI is not a number.")
+            rssi = (rssi * 10) + (c - _ZERO)
+        if negative:
+            rssi = -rssi
+        snr:int = 0
+        negative = i < end and buf[i] == _MINUS
+        if negative:
+            i = i + 1
+        if i >= end:
+            raise Exception("Unable to parse line '" + str(bytes(buf[start:end])) + "' as a ReceivedMessage! The SNR is missing.")
+        while i < end:
+            c:int = buf[i]
+            i = i + 1
+            if c < _ZERO or c > _NINE:
+                raise Exception("Unable to parse line '" + str(bytes(buf[start:end])) + "' as a ReceivedMessage! The SNR is not a number.")
+            snr = (snr * 10) + (c - _ZERO)
+        if negative:
+            snr = -snr
+
+        self.address = address
+        self.length = length
+        self.RSSI = rssi
+        self.SNR = snr
+        self.data = self._payload_mv[0:length] # the one small allocation per message: a view object, not a copy of the payload
 
-            # find landmarkers that will help with parsing
-            i_equal:int = full_line.find("=".encode("ascii"))
-            i_comma1:int = full_line.find(",".encode("ascii"))
-            i_comma2:int = full_line.find(",".encode("ascii"), i_comma1 + 1)
-            i_comma4:int = full_line.rfind(",".encode("ascii")) # search from end
-            i_comma3:int = full_line.rfind(",".encode("ascii"), 0, i_comma4-1) # search for a comma from right, starting at 0 and ending at the last comma (or right before it)
-            i_linebreak:int = full_line.find("\r\n".encode("ascii"))
-            
-            # extract
-            self.ReceivedMessage = ReceivedMessage()
-            self.address = int(full_line[i_equal + 1:i_comma1].decode("ascii"))
-            self.length = int(full_line[i_comma1 + 1:i_comma2].decode("ascii"))
-            self.data = full_line[i_comma2 + 1:i_comma3]
-            self.RSSI = int(full_line[i_comma3 + 1:i_comma4].decode("ascii"))
-            self.SNR = int(full_line[i_comma4 + 1:i_linebreak].decode("ascii"))
-        except Exception as e:
-            raise Exception("Unable to parse line '" + str(full_line) + "' as a ReceivedMessage! Exception message: " + str(e))
+    def parse(self, full_line:bytes) -> None:
+        """Parses a received message from the raw line of byte data received over UART. For example, b'+RCV=50,5,HELLO,-99,40'"""
+        end:int = len(full_line)
+        if end > 0 and full_line[end - 1] == _LF:
+            end = end - 1
+        if end > 0 and full_line[end - 1] == _CR:
+            end = end - 1
+        if end < _RCV_PREFIX_LEN or full_line[0:_RCV_PREFIX_LEN] != _RCV_PREFIX:
+            raise Exception("Unable to parse line '" + str(full_line) + "' as a ReceivedMessage! It does not start with '+RCV='.")
+        self.parse_from(memoryview(full_line), 0, end)
+        self.data = bytes(self.data) # a copy that belongs to this message
 
     def __str__(self) -> str:
         return str({"address":self.address, "length":self.length, "data":self.data, "RSSI":self.RSSI, "SNR":self.SNR})
 
 class RYLR998:
 
-    def __init__(self, uart:machine.UART) -> None:
+    def __init__(self, uart:machine.UART, rx_buffer_size:int = 1024, max_pending:int = 8) -> None:
+        """
+        Parameters:
+        uart (machine.UART): The UART the RYLR998 is connected to.
+        rx_buffer_size (int): Size of the internal buffer received bytes are collected in. Must fit at least one full +RCV line (about 270 bytes for a 240 byte payload). Larger buffers ride out longer bursts of received packets between calls to receive().
+        max_pending (int): While waiting on the response to a command, received messages that don't fit in the internal buffer are set aside (so the response behind them can be read), up to this many. Beyond that, the oldest is dropped.
+        """
         self._uart = uart
 
         # clear out UART Rx buf
         while self._uart.any() > 0:
             self._uart.read()
 
-        # set up internal RX buffer
-        self._rxbuf:bytes = bytes()
+        # set up internal RX buffer. A fixed bytearray that is read into directly. Unread bytes are _rxbuf[_rstart:_rend].
+        self._rxbuf:bytearray = bytearray(rx_buffer_size)
+        self._rxmv:memoryview = memoryview(self._rxbuf)
+        self._rstart:int = 0
+        self._rend:int = 0
+        self._scanned:int = 0 # everything in _rxbuf[_rstart:_scanned] has already been searched for a line break
+        self._lines:list[bytes] = [] # reused by _pluck_responses()
+
+        # +RCV lines set aside while waiting on a command's response (older than anything in _rxbuf)
+        self.max_pending:int = max_pending
+        self._pending:list[bytes] = []
+        self._awaiting:bool = False # waiting on a command's response
+
+        self.overflows:int = 0 # number of times the buffer filled up without a complete line and was discarded, or a received message set aside was dropped
 
     @property
     def pulse(self) -> bool:
@@ -236,41 +349,158 @@ class RYLR998:
         
     def receive(self) -> ReceivedMessage:
         """If there is a message awaiting retrieval, returns it."""
+        ToReturn:ReceivedMessage = ReceivedMessage()
+        if not self.receive_into(ToReturn):
+            return None
+        ToReturn.data = bytes(ToReturn.data) # a copy that belongs to this message
+        return ToReturn
+
+    def receive_into(self, msg:ReceivedMessage) -> bool:
+        """
+        If there is a message awaiting retrieval, parses it into msg (a ReceivedMessage you reuse) and returns True. Otherwise returns False.
+        Received bytes are read straight into a fixed internal buffer and the message is parsed where it lies, so receiving doesn't allocate new buffers. msg.data is overwritten by the next call (use bytes(msg.data) to keep a copy).
+        """
 
         # collect anything on the Rx to local buffer
         self._colrx()
 
-        # find where the +RCV (receive message start) starts
-        i1:int = self._rxbuf.find("+RCV=".encode("ascii")) # find where the received message starts
-
-        # if there is no message to be found, return None
-        if i1 == -1: 
-            return None
-    
-        # find where it ends from here (newline)
-        i2:int = self._rxbuf.find("\r\n".encode("ascii"), i1 + 1)
-
-        # if no \r\n found
-        if i2 == -1:
-            raise Exception("Received message beginning at index '" + str(i1) + "' in internal buf did not terminate in '\\r\\n'")
-        
-        # get bytes of the full RCV
-        rcv:bytes = self._rxbuf[i1:i2 + 2] # add +2 for the length of the \r\n (actually 2 characters)
-
-        # "pluck" it out (remove what we are taking from the internal buffer)
-        self._rxbuf = self._rxbuf[0:i1] + self._rxbuf[i2+2:]
+        # messages set aside while waiting on a command's response came first
+        if len(self._pending) > 0:
+            line:bytes = self._pending.pop(0)
+            end:int = len(line)
+            while end > 0 and (line[end - 1] == _LF or line[end - 1] == _CR):
+                end = end - 1
+            msg.parse_from(memoryview(line), 0, end)
+            return True
+
+        while True:
+            lf:int = self._find_lf()
+            if lf == -1: # no complete line yet
+                return False
+            start:int = self._rstart
+            end:int = lf - 1 if lf > start and self._rxbuf[lf - 1] == _CR else lf # drop the \r
+            self._rstart = lf + 1
+            self._scanned = self._rstart
+            if self._is_rcv(start, end):
+                msg.parse_from(self._rxmv, start, end)
+                return True
+            # anything else (i.e. a late response to a command that timed out) is dropped
+
+    def _is_rcv(self, start:int, end:int) -> bool:
+        """Whether the line _rxbuf[start:end] starts with "+RCV=" """
+        if end - start < _RCV_PREFIX_LEN:
+            return False
+        buf:bytearray = self._rxbuf
+        for i in range(_RCV_PREFIX_LEN):
+            if buf[start + i] != _RCV_PREFIX[i]:
+                return False
+        return True
+
+    def _find_lf(self) -> int:
+        """Index of the line feed ending the first unread line, or -1."""
+        ToReturn:int = self._line_end(self._rstart, self._scanned)
+        if ToReturn == -1:
+            self._scanned = self._rend
+        return ToReturn
 
-        # now time to convert the RCV message to useful data
-        ToReturn:ReceivedMessage = ReceivedMessage()
-        ToReturn.parse(rcv)
+    def _line_end(self, start:int, scan_from:int) -> int:
+        """
+        Index of the line feed ending the line that starts at _rxbuf[start], or -1 if it isn't complete yet. _rxbuf[start:scan_from] is known to hold no line feed.
+        The payload of a +RCV line is skipped by its stated length, as binary data may contain line feeds of its own.
+        """
+        buf:bytearray = self._rxbuf
+        i:int = scan_from
+        if self._is_rcv(start, self._rend):
+            j:int = start + _RCV_PREFIX_LEN
+            commas:int = 0
+            length:int = 0
+            while commas < 2:
+                if j >= self._rend:
+                    return -1
+                c:int = buf[j]
+                if c == _LF: # cut short, not a valid +RCV line
+                    return j
+                j = j + 1
+                if c == _COMMA:
+                    commas = commas + 1
+                elif commas == 1 and c >= _ZERO and c <= _NINE:
+                    length = (length * 10) + (c - _ZERO)
+            if length <= MAX_PAYLOAD and j + length > i:
+                i = j + length
+        for k in range(i, self._rend):
+            if buf[k] == _LF:
+                return k
+        return -1
 
-        return ToReturn
-        
     def _colrx(self) -> None:
         """Collects and moves all bytes from UART Rx buffer to internal buffer."""
-        all_bytes:bytes = self._uart.read()
-        if all_bytes != None:
-            self._rxbuf += all_bytes
+        while self._uart.any() > 0:
+            if self._rend == len(self._rxbuf): # no room left at the end
+                if self._rstart > 0: # move what is unread to the front
+                    unread:int = self._rend - self._rstart
+                    _move(self._rxmv, 0, self._rstart, unread)
+                    self._scanned = self._scanned - self._rstart
+                    self._rstart = 0
+                    self._rend = unread
+                elif self._find_lf() != -1: # full of complete lines
+                    if not self._awaiting: # leave the rest in the UART until receive() makes room
+                        return
+                    self._set_aside() # a response may be waiting behind them
+                    if self._rend == len(self._rxbuf): # full of responses, let _pluck_responses() take them first
+                        return
+                else: # full without a single complete line. Can't be a message, discard it.
+                    self._rstart = 0
+                    self._rend = 0
+                    self._scanned = 0
+                    self.overflows = self.overflows + 1
+
+            # read straight into the free space at the end
+            n:int = self._uart.readinto(self._rxmv[self._rend:], min(self._uart.any(), len(self._rxbuf) - self._rend))
+            if n == None or n == 0:
+                return
+            self._rend = self._rend + n
+
+    def _take_lines(self, rcv:bool, into:list) -> None:
+        """Removes every complete line in the internal buffer that is (rcv = True) or is not (rcv = False) a received message (+RCV), appending each (with its line break) to into. The other lines are kept, in order."""
+        w:int = self._rstart # where the next kept line goes
+        r:int = self._rstart
+        while True:
+            lf:int = self._line_end(r, r)
+            if lf == -1:
+                break
+            n:int = lf + 1 - r
+            if self._is_rcv(r, lf) == rcv:
+                into.append(bytes(self._rxmv[r:lf + 1]))
+            else:
+                if w != r:
+                    _move(self._rxmv, w, r, n)
+                w = w + n
+            r = lf + 1
+
+        # the incomplete rest
+        rest:int = self._rend - r
+        if w != r:
+            _move(self._rxmv, w, r, rest)
+        self._rend = w + rest
+        self._scanned = self._rstart
+
+    def _pluck_responses(self) -> bytes:
+        """Removes every complete line in the internal buffer that is not a received message (+RCV), returning them (or None if there were none). Received messages are kept, in order, for receive()."""
+        lines:list[bytes] = self._lines
+        self._take_lines(False, lines)
+        if len(lines) == 0:
+            return None
+        ToReturn:bytes = b"".join(lines)
+        while len(lines) > 0:
+            lines.pop()
+        return ToReturn
+
+    def _set_aside(self) -> None:
+        """Moves every complete received message (+RCV) out of the internal buffer, so a response arriving behind them can be read. receive() returns them first."""
+        self._take_lines(True, self._pending)
+        while len(self._pending) > self.max_pending:
+            self._pending.pop(0)
+            self.overflows = self.overflows + 1
     
     def _command_response(self, command:bytes, response_timeout_ms:int = 500)-> bytes:
         """Sends a byte sequence (AT command) to the RYLR988 module, and collects the response while still preserving any pre-existing bytes in the internal Rx buffer."""
@@ -280,9 +510,21 @@ class RYLR998:
         # but rather a message that pops up when a message is received (not directly a result of a command sent to the RYLR998 via UART)
         # Because of this rule, any +RCV will just be ignored and be stored in the buffer.
 
+        # while waiting, received messages that would hold the response up are set aside (see _colrx())
+        self._awaiting = True
+        try:
+            return self._exchange(command, response_timeout_ms)
+        finally:
+            self._awaiting = False
+
+    def _exchange(self, command:bytes, response_timeout_ms:int) -> bytes:
+        """Does the work of _command_response()."""
+
         # collect any bytes still left over in UART Rx 
         # we do this just in case there were previously un-handled response bytes (i.e. +RCV)
+        # anything that is not a +RCV is left over from an earlier command, so discard it
         self._colrx()
+        self._pluck_responses()
 
         # send command
         self._uart.write(command)
@@ -292,11 +534,8 @@ class RYLR998:
         response:bytes = None # will contain the actual response we will return back.
         while (time.ticks_ms() - started_waiting_at_ticks_ms) < response_timeout_ms and response == None:
             if self._uart.any() > 0: # if there are bytes to read
-                new_bytes = self._uart.read() # read the bytes
-                if new_bytes.startswith("+RCV".encode("ascii")): # if the new bytes we just received are actually a message we just received (not a direct response to the command we just sent), add it to the buffer for us to get to it later
-                    self._rxbuf += new_bytes # add it to the buffer for us to get later. It is not the response to our command we were looking for.
-                else:
-                    response = new_bytes # This is our response! So save it.
+                self._colrx() # read the bytes
+                response = self._pluck_responses() # every line that is not a message we just received (+RCV lines stay in the buffer for us to get to later)
             else:
                 time.sleep_ms(1) # wait 1 ms
 
@@ -0,0 +1,322 @@
+"""
+asyncio driver for the RYLR998 LoRa module by REYAX: sends are queued and written to the module one at a time as it becomes ready, while received packets are collected as they arrive.
+Author Tim Hanewich, github.com/TimHanewich
+Find updates to this code: https://github.com/TimHanewich/MicroPython-Collection/blob/master/REYAX-RYLR998/
+
+MIT License
+Copyright 2024 Tim Hanewich
+Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated documentation files (the “Software”), to deal in the Software without restriction, including without limitation the rights to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies of the Software, and to permit persons to whom the Software is furnished to do so, subject to the following conditions:
+The above copyright notice and this permission notice shall be included in all copies or substantial portions of the Software.
+THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+try:
+    import asyncio
+except ImportError: # older MicroPython firmware
+    import uasyncio as asyncio
+
+import reyax
+from reyax import ReceivedMessage, MAX_PAYLOAD
+
+class PendingCommand:
+    """An AT command waiting in the TX queue (or on the module's response). Await wait() for the module's response."""
+
+    def __init__(self, command:bytes, timeout_ms:int) -> None:
+        self.command:bytes = command
+        self.timeout_ms:int = timeout_ms
+        self.response:bytes = None # the module's response line, including the \r\n
+        self.error:str = None # why the command failed, if it did
+        self.done:bool = False
+        self._expect_ok:bool = False # if True, anything but +OK is an error (i.e. AT+SEND)
+        self._event:asyncio.Event = asyncio.Event()
+
+    def _finish(self, response:bytes, error:str) -> None:
+        if self.done:
+            return
+        self.response = response
+        self.error = error
+        self.done = True
+        self._event.set()
+
+    async def wait(self) -> bytes:
+        """Waits until the module has responded and returns the response. Raises an exception if the command failed (an +ERR response to a send, a timeout, or the driver stopping)."""
+        await self._event.wait()
+        if self.error != None:
+            raise Exception(self.error)
+        return self.response
+
+class AsyncRYLR998:
+    """
+    Drives an RYLR998 from an asyncio task, so sending never blocks the rest of your program.
+    - Sends (and any other AT commands) go into a bounded TX queue. They are written to the module one at a time, each once the module has responded to the one before it, and each gets the module's response (+OK, +ERR=...) matched back to it.
+    - +RCV lines that arrive in between (including in the middle of waiting on a response) are parsed and put in a bounded receive queue.
+    """
+
+    def __init__(self, uart = None, stream = None, tx_queue_size:int = 8, rx_queue_size:int = 16, rx_buffer_size:int = 1024, response_timeout_ms:int = 8000, chunk_size:int = 128) -> None:
+        """
+        Creates a new driver. Start it with asyncio.create_task(lora.run()).
+
+        Parameters:
+        uart (machine.UART): The UART the RYLR998 is connected to. Wrapped in an asyncio.StreamReader (which, on MicroPython, can write too).
+        stream: Alternatively, any object with an awaitable read(n) method that returns b"" at the end of the stream, a write(data) method and an awaitable drain() method (i.e. a simulated module from reyax_sim.py for testing on a desktop).
+        tx_queue_size (int): Maximum number of commands waiting to be written. send() waits for room once it is full.
+        rx_queue_size (int): Maximum number of received messages kept until receive() picks them up. Once full, the oldest is dropped.
+        rx_buffer_size (int): Size of the internal buffer received bytes are collected in. Must fit at least one full +RCV line (about 270 bytes for a 240 byte payload).
+        response_timeout_ms (int): How long to wait on the module's response to a command, in milliseconds. Generous by default, as the module responds to a send once it has been transmitted, which takes over a second for large payloads at long range settings.
+        chunk_size (int): Maximum number of bytes read from the stream at once.
+        """
+        if stream == None:
+            if uart == None:
+                raise Exception("Either a UART or a stream must be provided to communicate with the RYLR998.")
+            stream = asyncio.StreamReader(uart)
+        self._stream = stream
+        self.tx_queue_size:int = tx_queue_size
+        self.rx_queue_size:int = rx_queue_size
+        self.response_timeout_ms:int = response_timeout_ms
+        self._chunk_size:int = chunk_size
+
+        # TX queue and the command currently waiting on a response
+        self._txq:list[PendingCommand] = []
+        self._tx_ready:asyncio.Event = asyncio.Event() # set when something is put in the TX queue
+        self._tx_space:asyncio.Event = asyncio.Event() # set when something is taken out of the TX queue
+        self._inflight:PendingCommand = None
+
+        # receive queue
+        self._rxq:list[ReceivedMessage] = []
+        self._rx_ready:asyncio.Event = asyncio.Event()
+
+        # internal RX buffer, unread bytes are _rxbuf[_rstart:_rend]
+        self._rxbuf:bytearray = bytearray(rx_buffer_size)
+        self._rxmv:memoryview = memoryview(self._rxbuf)
+        self._rstart:int = 0
+        self._rend:int = 0
+
+        self._running:bool = False
+        self._done:bool = False # True once run() has finished (the stream ended or stop() was called)
+
+        # metrics
+        self.sent:int = 0 # sends the module confirmed with +OK
+        self.send_errors:int = 0 # sends that got an error response or timed out
+        self.received:int = 0
+        self.rx_dropped:int = 0 # received messages dropped because the receive queue was full
+        self.unsolicited:int = 0 # lines that weren't a +RCV and arrived while no command was waiting on a response (i.e. +READY after a reset)
+        self.overflows:int = 0 # number of times the buffer filled up without a complete line and was discarded
+
+    ######## SENDING ########
+
+    async def send(self, address:int, data:bytes) -> None:
+        """Queues a packet of binary data to send to a specified address and waits until the module confirms it was sent. Raises an exception if it wasn't."""
+        pending:PendingCommand = await self.submit(address, data)
+        await pending.wait()
+
+    async def submit(self, address:int, data:bytes) -> PendingCommand:
+        """Queues a packet of binary data to send to a specified address, waiting only for room in the TX queue. Returns the PendingCommand, so you can await its wait() later (or check its done and error)."""
+        if len(data) > MAX_PAYLOAD:
+            raise Exception("Provided data packet of length " + str(len(data)) + " to send is too large! Limit is " + str(MAX_PAYLOAD) + " bytes.")
+        cmd:bytes = b"AT+SEND=" + str(address).encode() + b"," + str(len(data)).encode() + b"," + bytes(data) + b"\r\n"
+        pending:PendingCommand = PendingCommand(cmd, self.response_timeout_ms)
+        pending._expect_ok = True
+        await self._enqueue(pending)
+        return pending
+
+    async def command(self, command:bytes, timeout_ms:int = 500) -> bytes:
+        """Queues any other AT command (i.e. b"AT+ADDRESS?\\r\\n") behind the pending sends and returns the module's response line."""
+        pending:PendingCommand = PendingCommand(command, timeout_ms)
+        await self._enqueue(pending)
+        return await pending.wait()
+
+    @property
+    def tx_pending(self) -> int:
+        """Number of commands in the TX queue or waiting on a response."""
+        return len(self._txq) + (0 if self._inflight == None else 1)
+
+    async def _enqueue(self, pending:PendingCommand) -> None:
+        if self._done:
+            raise Exception("The RYLR998 driver has stopped.")
+        while len(self._txq) >= self.tx_queue_size:
+            self._tx_space.clear()
+            await self._tx_space.wait()
+            if self._done:
+                raise Exception("The RYLR998 driver has stopped.")
+        self._txq.append(pending)
+        self._tx_ready.set()
+
+    async def _write_loop(self) -> None:
+        """Writes queued commands to the module, one at a time, each once the one before it has been responded to."""
+        while True:
+            while len(self._txq) == 0:
+                self._tx_ready.clear()
+                await self._tx_ready.wait()
+            pending:PendingCommand = self._txq.pop(0)
+            self._tx_space.set()
+
+            self._inflight = pending
+            try:
+                self._stream.write(pending.command)
+                await self._stream.drain()
+                await asyncio.wait_for(pending._event.wait(), pending.timeout_ms / 1000)
+            except asyncio.TimeoutError:
+                pending._finish(None, "Response from RYLR998 for command " + str(pending.command) + " was not received after waiting " + str(pending.timeout_ms) + " ms!")
+            except Exception as e: # the UART write failed
+                pending._finish(None, "Writing command " + str(pending.command) + " to the RYLR998 failed: " + str(e))
+            finally:
+                self._inflight = None
+            if pending._expect_ok:
+                if pending.error == None:
+                    self.sent = self.sent + 1
+                else:
+                    self.send_errors = self.send_errors + 1
+
+    def _respond(self, line:bytes) -> None:
+        """Matches a response line to the command waiting on it."""
+        pending:PendingCommand = self._inflight
+        if pending == None:
+            self.unsolicited = self.unsolicited + 1
+            return
+        if pending._expect_ok and line != b"+OK\r\n":
+            pending._finish(line, "Send command '" + str(pending.command) + "' returned abnormal response '" + str(line) + "'")
+        else:
+            pending._finish(line, None)
+
+    ######## RECEIVING ########
+
+    async def receive(self) -> ReceivedMessage:
+        """Waits for the next received message and returns it, or returns None if the driver has stopped."""
+        while len(self._rxq) == 0:
+            if self._done:
+                return None
+            self._rx_ready.clear()
+            await self._rx_ready.wait()
+        return self._rxq.pop(0)
+
+    def receive_nowait(self) -> ReceivedMessage:
+        """If there is a received message waiting, returns it. Otherwise returns None."""
+        if len(self._rxq) == 0:
+            return None
+        return self._rxq.pop(0)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> ReceivedMessage:
+        """Allows "async for msg in lora:" to receive every message until the driver stops."""
+        msg:ReceivedMessage = await self.receive()
+        if msg == None:
+            raise StopAsyncIteration
+        return msg
+
+    def _deliver(self, start:int, end:int) -> None:
+        """Parses the +RCV line _rxbuf[start:end] (without the line break) into the receive queue."""
+        msg:ReceivedMessage = ReceivedMessage()
+        try:
+            msg.parse_from(self._rxmv, start, end)
+        except Exception:
+            return
+        msg.data = bytes(msg.data) # a copy that belongs to this message
+        if len(self._rxq) >= self.rx_queue_size:
+            self._rxq.pop(0)
+            self.rx_dropped = self.rx_dropped + 1
+        self._rxq.append(msg)
+        self.received = self.received + 1
+        self._rx_ready.set()
+
+    ######## RUNNING ########
+
+    def stop(self) -> None:
+        """Stops the driver once the read it is currently waiting on completes. Commands still queued fail."""
+        self._running = False
+
+    async def run(self) -> None:
+        """Reads and dispatches everything the module sends until the stream ends or stop() is called, writing queued commands along the way."""
+        self._running = True
+        self._done = False
+        writer = asyncio.create_task(self._write_loop())
+        try:
+            while self._running:
+                data:bytes = await self._stream.read(self._chunk_size)
+                if not data: # end of stream
+                    break
+                self._take(data)
+                self._dispatch()
+        finally:
+            self._running = False
+            self._done = True
+            writer.cancel()
+
+            # fail everything still waiting on the module and release anything waiting on the queues
+            if self._inflight != None:
+                self._inflight._finish(None, "The RYLR998 driver stopped before command " + str(self._inflight.command) + " was responded to.")
+                self._inflight = None
+            while len(self._txq) > 0:
+                pending:PendingCommand = self._txq.pop(0)
+                pending._finish(None, "The RYLR998 driver stopped before command " + str(pending.command) + " was written.")
+            self._tx_space.set()
+            self._rx_ready.set()
+
+    def _take(self, data:bytes) -> None:
+        """Appends data to the internal buffer, making room if needed."""
+        n:int = len(data)
+        if self._rend + n > len(self._rxbuf) and self._rstart > 0: # move what is unread to the front
+            unread:int = self._rend - self._rstart
+            reyax._move(self._rxmv, 0, self._rstart, unread)
+            self._rstart = 0
+            self._rend = unread
+        if self._rend + n > len(self._rxbuf): # full without a single complete line. Can't be a message, discard it.
+            self._rstart = 0
+            self._rend = 0
+            self.overflows = self.overflows + 1
+            if n > len(self._rxbuf):
+                return
+        self._rxbuf[self._rend:self._rend + n] = data
+        self._rend = self._rend + n
+
+    def _dispatch(self) -> None:
+        """Handles every complete line in the internal buffer."""
+        while True:
+            start:int = self._rstart
+            is_rcv:bool = self._is_rcv(start)
+            lf:int = self._find_line_end(start, is_rcv)
+            if lf == -1: # no complete line yet
+                return
+            self._rstart = lf + 1
+            end:int = lf - 1 if lf > start and self._rxbuf[lf - 1] == reyax._CR else lf # drop the \r
+            if is_rcv:
+                self._deliver(start, end)
+            elif end > start: # a response
+                self._respond(bytes(self._rxmv[start:lf + 1]))
+
+    def _is_rcv(self, start:int) -> bool:
+        """Whether the unread bytes starting at start begin with "+RCV=" """
+        if self._rend - start < reyax._RCV_PREFIX_LEN:
+            return False
+        buf:bytearray = self._rxbuf
+        for i in range(reyax._RCV_PREFIX_LEN):
+            if buf[start + i] != reyax._RCV_PREFIX[i]:
+                return False
+        return True
+
+    def _find_line_end(self, start:int, is_rcv:bool) -> int:
+        """Index of the line feed ending the line at start, or -1 if it isn't complete yet. The payload of a +RCV line is skipped by its stated length, as binary data may contain line feeds of its own."""
+        buf:bytearray = self._rxbuf
+        i:int = start
+        if is_rcv:
+            i = i + reyax._RCV_PREFIX_LEN
+            commas:int = 0
+            length:int = 0
+            while commas < 2:
+                if i >= self._rend:
+                    return -1
+                c:int = buf[i]
+                if c == reyax._LF: # cut short, not a valid +RCV line
+                    return i
+                i = i + 1
+                if c == reyax._COMMA:
+                    commas = commas + 1
+                elif commas == 1 and c >= reyax._ZERO and c <= reyax._NINE:
+                    length = (length * 10) + (c - reyax._ZERO)
+            if length <= MAX_PAYLOAD:
+                i = i + length
+        for j in range(i, self._rend):
+            if buf[j] == reyax._LF:
+                return j
+        return -1
@@ -0,0 +1,285 @@
+"""
+Simulated RYLR998 modules for trying out reyax_async.AsyncRYLR998 (and anything built on it) on a desktop (CPython), without modules or a microcontroller at hand.
+Each SimulatedRYLR998 stands in for asyncio.StreamReader(uart) connected to a module: it answers AT commands over the "UART" and transmits packets through a shared SimulatedAir to the other simulated modules, taking as long as a real module would (UART transfer time plus LoRa air time for its RF parameters).
+
+Usage:
+python reyax_sim.py                               # module A sends 20 packets of 32 bytes to module B
+python reyax_sim.py --messages 50 --size 240 --loss 0.1 --time-scale 0.1
+"""
+
+import time
+import math
+import random
+import asyncio
+
+import desktop # stand-ins for machine and MicroPython's time functions under CPython
+import reyax
+import reyax_async
+
+BANDWIDTHS_HZ:dict = {7: 125000, 8: 250000, 9: 500000} # AT+PARAMETER bandwidth codes
+
+def airtime_ms(payload_length:int, spreading_factor:int = 9, bandwidth_hz:int = 125000, coding_rate:int = 1, preamble:int = 12) -> float:
+    """Time on air of a LoRa packet (explicit header, CRC on), in milliseconds. The defaults are the RYLR998's (AT+PARAMETER=9,7,1,12)."""
+    symbol_ms:float = (2 ** spreading_factor) / (bandwidth_hz / 1000)
+    low_rate:int = 1 if symbol_ms > 16 else 0 # low data rate optimization, used once symbols get longer than 16 ms
+    symbols:float = 8 + max(math.ceil(((8 * payload_length) - (4 * spreading_factor) + 28 + 16) / (4 * (spreading_factor - (2 * low_rate)))) * (coding_rate + 4), 0)
+    return ((preamble + 4.25) * symbol_ms) + (symbols * symbol_ms)
+
+class SimulatedAir:
+    """The radio channel shared by simulated modules. Packets are lost at random (loss), when the receiver is transmitting itself, or when they overlap with another packet at the receiver (a collision)."""
+
+    def __init__(self, loss:float = 0.0, seed:int = None) -> None:
+        self.loss:float = loss
+        self._random = random.Random(seed)
+        self.modules:list = []
+        self._transmissions:list[tuple] = [] # recent (sender, start ms, end ms)
+
+        # metrics
+        self.delivered:int = 0
+        self.lost:int = 0 # dropped at random
+        self.collisions:int = 0 # overlapped with another packet, or arrived while the receiver was transmitting
+
+    def _transmit(self, sender, start:float, end:float) -> None:
+        self._transmissions.append((sender, start, end))
+        while len(self._transmissions) > 0 and self._transmissions[0][2] < start - 60000: # forget anything long gone
+            self._transmissions.pop(0)
+
+    def _deliver(self, sender, address:int, data:bytes, start:float, end:float) -> None:
+        """Hands a packet that just finished transmitting to every module it was addressed to (address 0 is a broadcast)."""
+        for module in self.modules:
+            if module is sender or module.networkid != sender.networkid:
+                continue
+            if address != 0 and module.address != address:
+                continue
+            collided:bool = False
+            for t in self._transmissions:
+                if t[0] is sender or t[2] <= start or t[1] >= end:
+                    continue
+                collided = True # the receiver itself, or another module, was transmitting at the same time
+                break
+            if collided:
+                self.collisions = self.collisions + 1
+            elif self._random.random() < self.loss:
+                self.lost = self.lost + 1
+            else:
+                self.delivered = self.delivered + 1
+                module._received(sender.address, data)
+
+class SimulatedRYLR998:
+    """An in-memory stand-in for asyncio.StreamReader(uart) connected to an RYLR998. Pass it to reyax_async.AsyncRYLR998(stream=...)."""
+
+    def __init__(self, air:SimulatedAir, address:int = 0, networkid:int = 18, baudrate:int = 115200, rf_parameters:tuple = (9, 7, 1, 12), rssi:int = -60, snr:int = 10, time_scale:float = 1.0, chunk_size:int = 64) -> None:
+        """
+        Parameters:
+        air (SimulatedAir): The channel this module transmits on and receives from.
+        address (int): The module's address (AT+ADDRESS).
+        networkid (int): The module's network ID (AT+NETWORKID). Only modules on the same network hear each other.
+        baudrate (int): UART baud rate, for how long commands and responses take to transfer.
+        rf_parameters (tuple): Spreading factor, bandwidth code, coding rate and preamble (AT+PARAMETER), for how long packets take to transmit.
+        rssi (int): RSSI reported for every packet this module receives.
+        snr (int): SNR reported for every packet this module receives.
+        time_scale (float): Multiplies every delay. 0.1 runs ten times faster than real modules would.
+        chunk_size (int): Most bytes handed out per read, as a UART hands data over in small pieces.
+        """
+        self.air:SimulatedAir = air
+        self.address:int = address
+        self.networkid:int = networkid
+        self.baudrate:int = baudrate
+        self.rf_parameters:tuple = rf_parameters
+        self.rssi:int = rssi
+        self.snr:int = snr
+        self.time_scale:float = time_scale
+        self._chunk_size:int = chunk_size
+        air.modules.append(self)
+
+        self._cmdbuf:bytes = b"" # written, but not yet a complete command
+        self._out:bytes = b"" # waiting to be read
+        self._out_ready:asyncio.Event = asyncio.Event()
+        self._undrained:int = 0 # bytes written since the last drain()
+        self._busy:bool = False # transmitting
+        self._closed:bool = False
+
+        # metrics
+        self.commands:int = 0
+        self.transmitted:int = 0
+        self.received:int = 0
+        self.rejected:int = 0 # sends that arrived while still transmitting the one before (answered with +ERR=17)
+
+    ######## UART SIDE ########
+
+    async def read(self, n:int) -> bytes:
+        while len(self._out) == 0:
+            if self._closed:
+                return b"" # end of stream
+            self._out_ready.clear()
+            await self._out_ready.wait()
+        ToReturn:bytes = self._out[0:min(n, self._chunk_size)]
+        self._out = self._out[len(ToReturn):]
+        return ToReturn
+
+    def write(self, data:bytes) -> int:
+        self._cmdbuf = self._cmdbuf + bytes(data)
+        self._undrained = self._undrained + len(data)
+        while True:
+            command:bytes = self._take_command()
+            if command == None:
+                break
+            self._execute(command)
+        return len(data)
+
+    async def drain(self) -> None:
+        """Waits as long as the bytes written since the last drain take to go over the UART."""
+        ms:float = self._uart_ms(self._undrained)
+        self._undrained = 0
+        await asyncio.sleep((ms * self.time_scale) / 1000)
+
+    def close(self) -> None:
+        """Ends the stream, so a driver reading from it stops."""
+        self._closed = True
+        self._out_ready.set()
+
+    def _uart_ms(self, n:int) -> float:
+        return (n * 10 * 1000) / self.baudrate # 10 bits per byte (start, 8 data, stop)
+
+    def _emit(self, line:bytes) -> None:
+        self._out = self._out + line
+        self._out_ready.set()
+
+    ######## MODULE ########
+
+    def _take_command(self) -> bytes:
+        """Takes the next complete command (including its \\r\\n) off of the written bytes, or returns None. AT+SEND is framed by its stated length, as the data may contain line breaks of its own."""
+        buf:bytes = self._cmdbuf
+        search_from:int = 0
+        if buf.startswith(b"AT+SEND="):
+            c1:int = buf.find(b",", 8)
+            c2:int = buf.find(b",", c1 + 1) if c1 != -1 else -1
+            if c2 == -1:
+                if buf.find(b"\r\n") == -1:
+                    return None
+            else:
+                try:
+                    search_from = c2 + 1 + int(buf[c1 + 1:c2])
+                except ValueError:
+                    search_from = 0
+                if len(buf) < search_from + 2:
+                    return None
+        i:int = buf.find(b"\r\n", search_from)
+        if i == -1:
+            return None
+        self._cmdbuf = buf[i + 2:]
+        return buf[0:i + 2]
+
+    def _execute(self, command:bytes) -> None:
+        self.commands = self.commands + 1
+        asyncio.create_task(self._respond(command))
+
+    async def _respond(self, command:bytes) -> None:
+        # the module only starts on a command once it has come in over the UART
+        await asyncio.sleep((self._uart_ms(len(command)) * self.time_scale) / 1000)
+        body:bytes = command[0:-2]
+        if body == b"AT":
+            self._reply(b"+OK\r\n")
+        elif body == b"AT+ADDRESS?":
+            self._reply(b"+ADDRESS=" + str(self.address).encode() + b"\r\n")
+        elif body.startswith(b"AT+ADDRESS="):
+            self.address = int(body[11:])
+            self._reply(b"+OK\r\n")
+        elif body == b"AT+NETWORKID?":
+            self._reply(b"+NETWORKID=" + str(self.networkid).encode() + b"\r\n")
+        elif body == b"AT+PARAMETER?":
+            p = self.rf_parameters
+            self._reply(b"+PARAMETER=" + str(p[0]).encode() + b"," + str(p[1]).encode() + b"," + str(p[2]).encode() + b"," + str(p[3]).encode() + b"\r\n")
+        elif body.startswith(b"AT+SEND="):
+            await self._send(body)
+        else:
+            self._reply(b"+ERR=4\r\n") # unknown command
+
+    def _reply(self, line:bytes) -> None:
+        """Emits a response once it has gone over the UART."""
+        asyncio.get_event_loop().call_later((self._uart_ms(len(line)) * self.time_scale) / 1000, self._emit, line)
+
+    async def _send(self, body:bytes) -> None:
+        parts:list[bytes] = body[8:].split(b",", 2)
+        if len(parts) < 3:
+            self._reply(b"+ERR=4\r\n")
+            return
+        try:
+            address:int = int(parts[0])
+            length:int = int(parts[1])
+        except ValueError:
+            self._reply(b"+ERR=4\r\n")
+            return
+        data:bytes = parts[2]
+        if length > reyax.MAX_PAYLOAD:
+            self._reply(b"+ERR=13\r\n") # more than 240 bytes
+            return
+        if length != len(data):
+            self._reply(b"+ERR=5\r\n") # length doesn't match the data
+            return
+        if self._busy:
+            self.rejected = self.rejected + 1
+            self._reply(b"+ERR=17\r\n") # last transmission not completed
+            return
+
+        # transmit, then confirm
+        self._busy = True
+        p = self.rf_parameters
+        air_ms:float = airtime_ms(length, p[0], BANDWIDTHS_HZ.get(p[1], 125000), p[2], p[3]) * self.time_scale
+        start:float = time.ticks_ms()
+        self.air._transmit(self, start, start + air_ms)
+        await asyncio.sleep(air_ms / 1000)
+        self._busy = False
+        self.transmitted = self.transmitted + 1
+        self.air._deliver(self, address, data, start, start + air_ms)
+        self._reply(b"+OK\r\n")
+
+    def _received(self, address:int, data:bytes) -> None:
+        self.received = self.received + 1
+        self._reply(b"+RCV=" + str(address).encode() + b"," + str(len(data)).encode() + b"," + data + b"," + str(self.rssi).encode() + b"," + str(self.snr).encode() + b"\r\n")
+
+######## DEMO ########
+
+async def main(messages:int, size:int, loss:float, time_scale:float) -> None:
+    air:SimulatedAir = SimulatedAir(loss, seed=1)
+    sim_a:SimulatedRYLR998 = SimulatedRYLR998(air, address=1, time_scale=time_scale)
+    sim_b:SimulatedRYLR998 = SimulatedRYLR998(air, address=2, time_scale=time_scale)
+    a = reyax_async.AsyncRYLR998(stream=sim_a)
+    b = reyax_async.AsyncRYLR998(stream=sim_b)
+    tasks:list = [asyncio.create_task(a.run()), asyncio.create_task(b.run())]
+
+    started:float = time.monotonic()
+    pending:list = []
+    for i in range(messages):
+        payload:bytes = (str(i).encode() + b":" + (b"x" * size))[0:size]
+        pending.append(await a.submit(2, payload)) # only waits once the TX queue is full
+        if i == messages // 2: # other commands queue up behind the sends and get their own response
+            print("A's address, asked mid-stream: " + str(await a.command(b"AT+ADDRESS?\r\n")))
+    for p in pending:
+        try:
+            await p.wait()
+        except Exception as e:
+            print("Send failed: " + str(e))
+    elapsed_s:float = (time.monotonic() - started) / time_scale
+    await asyncio.sleep(0.05) # let the last +RCV reach B's driver
+
+    sim_a.close()
+    sim_b.close()
+    for t in tasks:
+        await t
+
+    print("Packets sent by A:          " + str(a.sent) + " (" + str(a.send_errors) + " failed)")
+    print("Packets received by B:      " + str(b.received))
+    print("Sends rejected as busy:     " + str(sim_a.rejected))
+    print("Lost in the air:            " + str(air.lost))
+    print("Elapsed (real module time): " + str(round(elapsed_s, 2)) + " s, air time per " + str(size) + " byte packet: " + str(round(airtime_ms(size), 1)) + " ms")
+
+if __name__ == "__main__":
+    import argparse
+    ap = argparse.ArgumentParser(description="Two simulated RYLR998 modules talking through AsyncRYLR998.")
+    ap.add_argument("--messages", type=int, default=20, help="number of packets module A sends")
+    ap.add_argument("--size", type=int, default=32, help="payload size of each packet, in bytes (up to 240)")
+    ap.add_argument("--loss", type=float, default=0.0, help="chance of each packet being lost in the air (0-1)")
+    ap.add_argument("--time-scale", type=float, default=0.1, help="multiplies every delay. 1 runs in real time")
+    args = ap.parse_args()
+    asyncio.run(main(args.messages, args.size, args.loss, args.time_scale))